@@ -1,3 +1,11 @@
 """Package with all classes representing data model."""
 
 from .odata_object_base import *
+
+
+def __getattr__(name):
+    """Imports generated classes of the package when they are first used."""
+    if name in CLASS_MODULES:
+        return resolve_class(name)
+    raise AttributeError("module '{}' has no attribute '{}'".format(__name__, name))
+
@@ -0,0 +1,361 @@
+"""Asyncio client to query the odata service and get objects of the generated classes."""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from urllib.parse import urlencode, quote
+from json import dumps
+from time import perf_counter
+from weakref import WeakKeyDictionary
+from .odata_object_base import OdataObjectBase
+from .request import odata_literal
+from .transport import HttpTransport, decode_json
+from .batch import decode_result
+from .query import QueryPushdown
+from .extension import ODATA_CONTAINER_TYPE, ODATA_TYPE_TO_PYTHON
+
+
+RETRY_STATUS = (429, 503)
+
+
+def retry_after_seconds(value, default):
+    """Returns seconds to wait from a Retry-After header value, either seconds or http date."""
+    if value is None:
+        return default
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return default
+
+
+class Page(object):
+    """Response to a GET request: either the json body still to be decoded or objects taken from the cache."""
+
+    def __init__(self, url, body=None, objects=None, next_link=None, etag=None, started=None, odata_context=None):
+        self.url = url
+        self.body = body
+        self.objects = objects
+        self.next_link = next_link
+        self.etag = etag
+        self.started = started
+        self.odata_context = odata_context
+
+
+class AsyncQuery(object):
+    """Query on an entity set or singleton. Query options return a new query so it can be reused."""
+
+    def __init__(self, client, container, options=None):
+        """Initializes the query.
+        :param client: AsyncClient object.
+        :param container: name of entity set or singleton in odata format, i.e. "users".
+        :param options: dictionary of odata query options. Optional.
+        """
+        if container not in ODATA_CONTAINER_TYPE:
+            raise ValueError("Unknown entity set or singleton: " + container)
+        self.client = client
+        self.container = container
+        self.cls = ODATA_TYPE_TO_PYTHON[ODATA_CONTAINER_TYPE[container]]
+        self.options = dict(options) if options else {}
+
+    def __repr__(self):
+        return '<ODATA QUERY: ' + self.url() + '>'
+
+    def _with_option(self, name, value):
+        options = dict(self.options)
+        options[name] = value
+        return AsyncQuery(self.client, self.container, options)
+
+    def select(self, *properties):
+        """Returns query with $select of the properties, in odata format."""
+        return self._with_option('$select', ",".join(properties))
+
+    def expand(self, *properties):
+        """Returns query with $expand of the navigation properties, in odata format."""
+        return self._with_option('$expand', ",".join(properties))
+
+    def filter(self, expression):
+        """Returns query with the $filter expression."""
+        return self._with_option('$filter', expression)
+
+    def orderby(self, expression):
+        """Returns query with the $orderby expression."""
+        return self._with_option('$orderby', expression)
+
+    def top(self, count):
+        """Returns query with $top, the page size for collections."""
+        return self._with_option('$top', str(count))
+
+    def selected_fields(self):
+        """Returns tuple with the property names of $select, or None if all properties are decoded."""
+        select = self.options.get('$select')
+        if not select or '/' in select or '*' in select:
+            return None
+        return tuple(select.split(","))
+
+    def url(self, key=None):
+        """Returns url of the query relative to the service root.
+        :param key: key of an entity of the entity set. Optional.
+        """
+        url = self.container
+        if key is not None:
+            url += "(" + quote(odata_literal(key), safe="'") + ")"
+        if self.options:
+            url += "?" + urlencode(self.options, safe="$,'()", quote_via=quote)
+        return url
+
+    async def get(self, key=None):
+        """Returns the singleton, or the entity with the key specified of the entity set.
+        :param key: key of the entity. Not used for singletons.
+        """
+        page = await self.client.fetch_page(self.url(key))
+        return self.client.decode_page(page, self.selected_fields())
+
+    async def pages(self):
+        """Asynchronous generator of lists of objects, one per page of the collection.
+        The next page is requested while the current one is being decoded.
+        """
+        fields = self.selected_fields()
+        page = await self.client.fetch_page(self.url())
+        while page is not None:
+            # Next pages have the context of the first one
+            next_page = asyncio.ensure_future(self.client.fetch_page(page.next_link, page.odata_context)) \
+                if page.next_link else None
+            try:
+                items = self.client.decode_page(page, fields)
+                yield items if isinstance(items, list) else [items]
+            except BaseException:
+                if next_page:
+                    next_page.cancel()
+                raise
+            page = await next_page if next_page else None
+
+    async def __aiter__(self):
+        async for page in self.pages():
+            for item in page:
+                yield item
+
+    async def all(self):
+        """Returns list with the objects of all pages of the collection."""
+        result = []
+        async for page in self.pages():
+            result.extend(page)
+        return result
+
+    async def fetch(self, filter=None, orderby=None, top=None, skip=0, select=None):
+        """Returns list of the objects of the entity set matching the query options. Options are evaluated
+        by the service where the capabilities of the entity set allow it and locally otherwise, see
+        QueryPushdown. Pages stop being requested when the objects received are enough for the result.
+        Other options of the query, i.e. $expand, are sent unchanged.
+        :param filter: odata $filter expression. Optional.
+        :param orderby: odata $orderby expression. Optional.
+        :param top: maximum number of objects returned. Optional.
+        :param skip: number of objects skipped. Optional.
+        :param select: list of property names in odata format of the objects. Optional.
+        """
+        pushdown = QueryPushdown(self.container, filter, orderby, top, skip, select)
+        query = AsyncQuery(self.client, self.container, dict(self.options, **pushdown.options))
+        limit = pushdown.limit()
+
+        objects = []
+        pages = query.pages()
+        try:
+            async for page in pages:
+                objects.extend(page)
+                if limit is not None and len(objects) >= limit:
+                    break
+        finally:
+            await pages.aclose()
+        return pushdown.apply(objects)
+
+    async def count(self, filter=None):
+        """Returns number of entities of the entity set matching the filter. The service counts them if the
+        entity set is countable and the filter can be evaluated by the service, otherwise only their keys
+        are requested and counted.
+        :param filter: odata $filter expression. Optional.
+        """
+        key_class = self.cls.get_key_class()
+        select = [key_class.key_property] if key_class is not None else None
+        pushdown = QueryPushdown(self.container, filter, select=select, count=True)
+        if '$count' in pushdown.options:
+            options = dict(pushdown.options)
+            if pushdown.capabilities['top_supported']:
+                options['$top'] = '1'
+            body = await self.client.get_json(AsyncQuery(self.client, self.container, options).url())
+            if isinstance(body, dict) and '@odata.count' in body:
+                return body['@odata.count']
+        return len(await self.fetch(filter, select=select))
+
+
+class AsyncClient(object):
+    """Asynchronous access to an odata service sharing a pool of keep-alive connections.
+
+    Entity sets and singletons are available as attributes with their odata name, i.e. client.users.
+    """
+
+    def __init__(self, service_url, headers=None, max_connections=8, max_concurrency=None,
+                 max_retries=5, retry_delay=1.0, session=None, cache=None):
+        """Initializes the client.
+        :param service_url: service root url, i.e. "https://graph.microsoft.com/v1.0/".
+        :param headers: dictionary with http headers sent on every request, i.e. Authorization. Optional.
+        :param max_connections: number of connections kept open.
+        :param max_concurrency: maximum number of requests in progress. Defaults to max_connections.
+        :param max_retries: times a request is retried after status 429 or 503.
+        :param retry_delay: seconds to wait before retrying if the response has no Retry-After header.
+        :param session: Session object used to de-duplicate entities. Optional.
+        :param cache: ResponseCache object used for GET requests of entity sets and singletons. Optional.
+        """
+        self.transport = HttpTransport(service_url, headers, max_connections)
+        self.max_concurrency = max_concurrency or max_connections
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.session = session
+        self.cache = cache
+        self._executor = ThreadPoolExecutor(max_workers=max_connections)
+        # Running loop: semaphore limiting the requests in progress, a semaphore can only be used in one loop
+        self._semaphores = WeakKeyDictionary()
+
+    def __getattr__(self, name):
+        if name in ODATA_CONTAINER_TYPE:
+            return AsyncQuery(self, name)
+        raise AttributeError("'{}' object has no attribute '{}'".format(type(self).__name__, name))
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def query(self, container):
+        """Returns query on the entity set or singleton.
+        :param container: name of entity set or singleton in odata format.
+        """
+        return AsyncQuery(self, container)
+
+    async def request(self, method, url, body=None, headers=None):
+        """Sends a request retrying when the service is throttling.
+        :param method: http method.
+        :param url: url relative to the service root or absolute url of the same service.
+        :param body: bytes sent as body. Optional.
+        :param headers: dictionary with additional http headers. Optional.
+        :return: tuple (status, headers dictionary with lower case names, body bytes).
+        """
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            # Created here so it belongs to the running loop
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(self.max_concurrency)
+
+        for attempt in range(self.max_retries + 1):
+            async with semaphore:
+                response = await loop.run_in_executor(self._executor, self.transport.request,
+                                                      method, url, body, headers)
+            status, response_headers, data = response
+            if status not in RETRY_STATUS or attempt == self.max_retries:
+                return response
+            await asyncio.sleep(retry_after_seconds(response_headers.get('retry-after'), self.retry_delay))
+
+    async def request_json(self, method, url, body=None, headers=None):
+        """Sends a request with optional json body and returns the decoded json response.
+        :param body: object sent as json body. Optional.
+        :return: decoded json body, or None if the response has no body.
+        """
+        all_headers = {'Accept': 'application/json'}
+        if body is not None:
+            all_headers['Content-Type'] = 'application/json'
+            body = dumps(body).encode('utf-8')
+        if headers:
+            all_headers.update(headers)
+
+        status, response_headers, data = await self.request(method, url, body, all_headers)
+        decoded = decode_json(data)
+        if status >= 400:
+            raise ValueError("Request {} {} failed with status {}: {}".format(method, url, status, decoded))
+        return decoded
+
+    async def get_json(self, url):
+        """Returns the decoded json response of a GET request."""
+        return await self.request_json("GET", url)
+
+    async def fetch_page(self, url, odata_context=None):
+        """Sends a GET request, using the cache if there is one, and returns a Page to decode with decode_page().
+        :param url: url relative to the service root or absolute url of the same service.
+        :param odata_context: @odata.context expected for the response, used to find it in the cache. If not
+                              specified, the response of the url cached last is used. Optional.
+        """
+        started = perf_counter()
+        headers = {'Accept': 'application/json'}
+        # Cached with the absolute url, so services sharing the cache don't mix their responses
+        url = self.transport.url(url)
+
+        entry = self.cache.get_entry(url, odata_context) if self.cache is not None else None
+        if entry is not None and self.cache.is_fresh(entry):
+            objects = self.cache.load(entry)
+            if objects is not None:
+                self.cache.record('hit', perf_counter() - started)
+                return Page(url, objects=objects, next_link=entry.next_link, odata_context=entry.odata_context)
+            entry = None
+
+        if entry is not None:
+            status, response_headers, data = await self.request("GET", url, None,
+                                                                dict(headers, **{'If-None-Match': entry.etag}))
+            if status == 304:
+                objects = self.cache.load(entry)
+                if objects is not None:
+                    self.cache.touch(entry)
+                    self.cache.record('revalidated', perf_counter() - started)
+                    return Page(url, objects=objects, next_link=entry.next_link, odata_context=entry.odata_context)
+                status, response_headers, data = await self.request("GET", url, None, headers)
+        else:
+            status, response_headers, data = await self.request("GET", url, None, headers)
+
+        body = decode_json(data)
+        if status >= 400:
+            raise ValueError("Request GET {} failed with status {}: {}".format(url, status, body))
+
+        is_dict = isinstance(body, dict)
+        return Page(url, body=body,
+                    next_link=body.get('@odata.nextLink') if is_dict else None,
+                    etag=response_headers.get('etag') or (body.get('@odata.etag') if is_dict else None),
+                    started=started,
+                    odata_context=body.get('@odata.context') if is_dict else None)
+
+    def decode_page(self, page, fields=None):
+        """Returns the objects of a page fetched with fetch_page(), storing them in the cache if there is one.
+        Objects taken from the cache are merged into the session if there is one, see Session.merge().
+        :param fields: property names in odata format of the $select of the request, see decode(). Optional.
+        """
+        if page.objects is not None:
+            if self.session is None:
+                return page.objects
+            if isinstance(page.objects, list):
+                return [self.session.merge(obj) for obj in page.objects]
+            return self.session.merge(page.objects)
+
+        page.objects = self.decode(page.body, fields)
+        if self.cache is not None:
+            objects = page.objects if isinstance(page.objects, list) else [page.objects]
+            if page.etag and all(isinstance(obj, OdataObjectBase) for obj in objects):
+                self.cache.put(page.url, page.odata_context, page.etag, page.objects, page.next_link)
+            self.cache.record('miss', perf_counter() - page.started)
+        return page.objects
+
+    def decode(self, body, fields=None):
+        """Returns the json response converted to the generated classes, using the session if there is one.
+        :param fields: property names in odata format of the $select of the request. Without a session,
+                       objects are created with the projection of their class for these fields,
+                       see OdataObjectBase.projection(). Optional.
+        """
+        if self.session is None:
+            return decode_result(body, fields=fields)
+        items = self.session.decode_page(body)
+        return items if 'value' in body else items[0]
+
+    def close(self):
+        """Closes pooled connections and worker threads."""
+        self._executor.shutdown(wait=False)
+        self.transport.close()
@@ -0,0 +1,208 @@
+"""Composition of json $batch requests and decoding of their responses."""
+
+from json import dumps
+from .odata_object_base import OdataObjectBase
+from .extension import ODATA_TYPE_TO_PYTHON, get_object_class
+from .decoder import decode_object
+
+
+MAX_BATCH_REQUESTS = 20
+
+
+def decode_item(item, cls, fields=None):
+    """Returns item converted to class cls, or to the class of its @odata.type if it has one.
+    :param fields: property names in odata format selected in the request. Objects are created with
+                   the projection of the class for these fields. Optional.
+    """
+    if isinstance(item, dict) and '@odata.type' in item:
+        cls = get_object_class(None, item['@odata.type'])
+    if not issubclass(cls, OdataObjectBase):
+        return cls(item)
+    if fields:
+        cls = cls.projection(fields)
+    return decode_object(item, cls)
+
+
+def decode_result(body, returns=None, fields=None):
+    """Returns the body of a response converted to the generated classes.
+    :param body: decoded json body.
+    :param returns: odata type expected. If not specified it's taken from @odata.context. Optional.
+    :param fields: property names in odata format of the $select of the request. Optional.
+    """
+    if not isinstance(body, dict):
+        return body
+
+    if returns:
+        cls = ODATA_TYPE_TO_PYTHON.get(returns[11:-1] if returns.startswith("Collection(") else returns)
+    else:
+        try:
+            cls = get_object_class(body.get('@odata.context', ''))
+        except (ValueError, KeyError, AttributeError):
+            cls = None
+
+    is_list = 'value' in body and isinstance(body['value'], list)
+    if cls is None:
+        return body['value'] if is_list else body
+    if is_list:
+        return [decode_item(item, cls, fields) for item in body['value']]
+    if 'value' in body and not issubclass(cls, OdataObjectBase):
+        # Single primitive value
+        return cls(body['value'])
+    return decode_item(body, cls, fields)
+
+
+class BatchResult(object):
+    """Response to a single request of a batch."""
+
+    def __init__(self, request_id, request, status, headers=None, body=None):
+        self.request_id = request_id
+        self.request = request
+        self.status = status
+        self.headers = headers or {}
+        self.body = body
+
+    def __repr__(self):
+        return '<ODATA BATCH RESULT: ' + self.request_id + ' ' + str(self.status) + '>'
+
+    @property
+    def ok(self):
+        """True if the request succeeded, False if it failed or the part has no status."""
+        return self.status is not None and 200 <= self.status < 300
+
+    @property
+    def error(self):
+        """Error returned by the service, or None if the request succeeded."""
+        if self.ok:
+            return None
+        return self.body.get('error', self.body) if isinstance(self.body, dict) else self.body
+
+    @property
+    def value(self):
+        """Body converted to the generated classes, or None if the request failed or returned no body."""
+        if not self.ok or self.body is None:
+            return None
+        # Responses with ids that weren't requested have no request, their type is taken from the body
+        return decode_result(self.body, self.request.returns if self.request is not None else None)
+
+
+class BatchComposer(object):
+    """Packs OdataRequest objects into json $batch payloads.
+
+    Requests that depend on each other are always sent in the same batch, ordered so a
+    request comes after the requests it depends on.
+    """
+
+    def __init__(self, max_requests=MAX_BATCH_REQUESTS):
+        """Initializes the composer.
+        :param max_requests: maximum number of requests in a single batch.
+        """
+        if max_requests < 1:
+            raise ValueError("Parameter max_requests must be a positive integer.")
+        self.max_requests = max_requests
+        self.requests = {}
+        self.depends_on = {}
+        self._next_id = 1
+
+    def __len__(self):
+        return len(self.requests)
+
+    def add(self, request, depends_on=None, request_id=None):
+        """Adds a request.
+        :param request: OdataRequest object.
+        :param depends_on: list of ids of requests that must run before this one. Optional.
+        :param request_id: id of the request. Defaults to the next sequential number not used yet.
+        :return: id of the request.
+        """
+        if request_id is None:
+            while str(self._next_id) in self.requests:
+                self._next_id += 1
+            request_id = self._next_id
+            self._next_id += 1
+        request_id = str(request_id)
+        if request_id in self.requests:
+            raise ValueError("Request id {} already in batch.".format(request_id))
+
+        depends_on = [str(d) for d in depends_on] if depends_on else []
+        for d in depends_on:
+            if d not in self.requests:
+                raise ValueError("Request {} depends on unknown request {}.".format(request_id, d))
+
+        self.requests[request_id] = request
+        self.depends_on[request_id] = depends_on
+        return request_id
+
+    def _groups(self):
+        """Returns lists of request ids linked by dependencies, each one in dependency order."""
+        # Union of requests linked by dependencies
+        parent = {request_id: request_id for request_id in self.requests}
+
+        def find(i):
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        for request_id, depends_on in self.depends_on.items():
+            for d in depends_on:
+                parent[find(d)] = find(request_id)
+
+        # Dependencies are always added before, so insertion order is a valid order
+        groups = {}
+        for request_id in self.requests:
+            groups.setdefault(find(request_id), []).append(request_id)
+        return list(groups.values())
+
+    def batches(self):
+        """Returns the requests split into batches.
+        :return: list of lists of request ids.
+        """
+        batches = []
+        for group in self._groups():
+            if len(group) > self.max_requests:
+                raise ValueError("{} requests depend on each other, more than the batch limit of {}.".
+                                 format(len(group), self.max_requests))
+
+            # First batch with enough room
+            for batch in batches:
+                if len(batch) + len(group) <= self.max_requests:
+                    batch.extend(group)
+                    break
+            else:
+                batches.append(list(group))
+        return batches
+
+    def payloads(self):
+        """Returns list of json $batch payloads as dictionaries."""
+        return [{'requests': [self.requests[i].batch_item(i, self.depends_on[i]) for i in batch]}
+                for batch in self.batches()]
+
+    def parse_response(self, response):
+        """Splits a json $batch response into results.
+        :param response: decoded json body of the $batch response.
+        :return: dictionary request id: BatchResult.
+        """
+        results = {}
+        for item in response.get('responses', []):
+            request_id = str(item['id'])
+            results[request_id] = BatchResult(request_id,
+                                              self.requests.get(request_id),
+                                              item.get('status'),
+                                              item.get('headers'),
+                                              item.get('body'))
+        return results
+
+    def send(self, transport, batch_url="$batch"):
+        """Sends all requests in as few batches as possible.
+        :param transport: HttpTransport object.
+        :param batch_url: url of the $batch endpoint relative to the service root.
+        :return: dictionary request id: BatchResult.
+        """
+        results = {}
+        for payload in self.payloads():
+            status, headers, body = transport.request_json("POST", batch_url, dumps(payload).encode('utf-8'),
+                                                           {'Content-Type': 'application/json',
+                                                            'Accept': 'application/json'})
+            if status != 200:
+                raise ValueError("Batch request failed with status {}: {}".format(status, body))
+            results.update(self.parse_response(body))
+        return results
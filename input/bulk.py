@@ -0,0 +1,186 @@
+"""Parallel decoding of large NDJSON files (one json object per line) into objects of the model."""
+
+import os
+import threading
+from functools import reduce
+from importlib import import_module
+from json import loads
+from multiprocessing import get_context
+from multiprocessing.pool import ThreadPool
+from .odata_object_base import OdataObjectBase
+
+
+DEFAULT_CHUNK_SIZE = 16 * 1024 * 1024
+
+# Class lookup and decoder of the worker process, set once by the pool initializer
+_get_object_class = None
+_decode_object = None
+
+# Buffer each worker thread or process reads its chunks into, allocated once with the size of the largest chunk
+_scratch = threading.local()
+
+
+def split_file(path, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Returns list of (start, end) byte ranges of the file, each one ending at a line boundary.
+    :param path: path to the file.
+    :param chunk_size: approximate size in bytes of each range.
+    """
+    size = os.path.getsize(path)
+    ranges = []
+    with open(path, 'rb') as f:
+        start = 0
+        while start < size:
+            f.seek(min(start + chunk_size, size))
+            f.readline()
+            end = min(f.tell(), size)
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+
+def _init_worker(package):
+    """Imports the model once in the worker process."""
+    global _get_object_class, _decode_object
+    _get_object_class = import_module(package + ".extension").get_object_class
+    _decode_object = import_module(package + ".decoder").decode_object
+
+
+def _read_chunk(path, start, end):
+    """Reads a byte range of the file into the scratch buffer of the thread.
+    :return: tuple (buffer, number of bytes read).
+    """
+    size = end - start
+    buffer = getattr(_scratch, 'buffer', None)
+    if buffer is None or len(buffer) < size:
+        buffer = _scratch.buffer = bytearray(size)
+    with open(path, 'rb') as f:
+        f.seek(start)
+        length = f.readinto(memoryview(buffer)[:size])
+    return buffer, length
+
+
+def _count_lines(path, end, block_size=1024 * 1024):
+    """Returns number of lines of the file before byte position end."""
+    count = 0
+    with open(path, 'rb') as f:
+        while f.tell() < end:
+            data = f.read(min(block_size, end - f.tell()))
+            if not data:
+                break
+            count += data.count(b'\n')
+    return count
+
+
+def _decode_chunk(args):
+    """Decodes the lines of a byte range of the file and returns function applied to the list of objects."""
+    path, start, end, odata_type, function = args
+    buffer, length = _read_chunk(path, start, end)
+
+    objects = []
+    classes = {}
+    pos = 0
+    while pos < length:
+        line_end = buffer.find(b'\n', pos, length)
+        if line_end < 0:
+            line_end = length
+        line = buffer[pos:line_end]
+        line_start, pos = pos, line_end + 1
+        if not line.strip():
+            continue
+        item = loads(line)
+        item_type = item.get('@odata.type') or odata_type
+        if item_type is None:
+            line_number = _count_lines(path, start) + buffer.count(b'\n', 0, line_start) + 1
+            raise ValueError("line {} has no @odata.type and no odata_type was given".format(line_number))
+        if item_type not in classes:
+            classes[item_type] = _get_object_class(None, item_type)
+        objects.append(_decode_object(item, classes[item_type]))
+    return function(objects)
+
+
+def to_objects(objects):
+    """Returns the objects unchanged, to get them from worker threads without converting them."""
+    return objects
+
+
+def to_records(objects):
+    """Returns list of compact records of the objects. See OdataObjectBase.to_record()."""
+    return [obj.to_record() for obj in objects]
+
+
+def to_columns(objects):
+    """Returns dictionary property name: list of values, with None for properties an object doesn't have.
+    Objects in values are converted to records.
+    """
+    columns = {}
+    for row, obj in enumerate(objects):
+        record_values = obj.to_record()[1]
+        for name, value in zip(obj.flattened_properties(), record_values):
+            if name not in columns:
+                columns[name] = [None] * row
+            columns[name].append(value)
+        for column in columns.values():
+            if len(column) <= row:
+                column.append(None)
+    return columns
+
+
+def map_file(path, function, odata_type=None, processes=None, ordered=True, chunk_size=DEFAULT_CHUNK_SIZE,
+             threads=False):
+    """Generator of the results of function applied in worker processes to the objects of each chunk of the file.
+    :param path: path to the NDJSON file.
+    :param function: picklable function (defined at module level) receiving a list of objects.
+    :param odata_type: odata type of lines without @odata.type, i.e. "microsoft.graph.user". If not
+                       specified, a line without @odata.type raises ValueError. Optional.
+    :param processes: number of worker processes. Defaults to the number of cpus.
+    :param ordered: True to get results in file order, False to get them as soon as they are ready.
+    :param chunk_size: approximate size in bytes of the chunk decoded by a worker at once.
+    :param threads: True to use worker threads instead of processes. Results are not pickled and function
+                    doesn't need to be picklable. Threads only run in parallel on free-threaded builds
+                    of Python.
+    """
+    tasks = [(path, start, end, odata_type, function) for start, end in split_file(path, chunk_size)]
+    if not tasks:
+        return
+
+    pool_class = ThreadPool if threads else get_context().Pool
+    with pool_class(processes, initializer=_init_worker, initargs=(__package__,)) as pool:
+        results = pool.imap(_decode_chunk, tasks) if ordered else pool.imap_unordered(_decode_chunk, tasks)
+        for result in results:
+            yield result
+
+
+def reduce_file(path, function, combine, initial, odata_type=None, processes=None,
+                chunk_size=DEFAULT_CHUNK_SIZE, threads=False):
+    """Returns the results of function applied in worker processes to each chunk, combined in this process.
+    :param path: path to the NDJSON file.
+    :param function: picklable function receiving a list of objects and returning a partial result.
+    :param combine: function receiving the accumulated result and a partial result.
+    :param initial: initial accumulated result.
+    :param threads: True to use worker threads instead of processes, see map_file().
+    """
+    return reduce(combine, map_file(path, function, odata_type, processes, False, chunk_size, threads), initial)
+
+
+def decode_file(path, odata_type=None, processes=None, ordered=True, as_records=False,
+                chunk_size=DEFAULT_CHUNK_SIZE, threads=False):
+    """Generator of the objects of the NDJSON file decoded in worker processes.
+    :param path: path to the NDJSON file.
+    :param odata_type: odata type of lines without @odata.type, i.e. "microsoft.graph.user". If not
+                       specified, a line without @odata.type raises ValueError. Optional.
+    :param processes: number of worker processes. Defaults to the number of cpus.
+    :param ordered: True to get objects in file order, False to get them as soon as they are ready.
+    :param as_records: True to get compact records instead of objects.
+    :param chunk_size: approximate size in bytes of the chunk decoded by a worker at once.
+    :param threads: True to use worker threads instead of processes, objects are returned as decoded
+                    by the threads. See map_file().
+    """
+    if threads and not as_records:
+        for objects in map_file(path, to_objects, odata_type, processes, ordered, chunk_size, threads):
+            for obj in objects:
+                yield obj
+        return
+
+    for records in map_file(path, to_records, odata_type, processes, ordered, chunk_size, threads):
+        for record in records:
+            yield record if as_records else OdataObjectBase.from_record(record)
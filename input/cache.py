@@ -0,0 +1,254 @@
+"""Disk backed cache of decoded responses, revalidated with etags and bounded in size."""
+
+import os
+import pickle
+from collections import OrderedDict
+from hashlib import sha256
+from json import dump, dumps, load, loads
+from time import time
+from .odata_object_base import OdataObjectBase
+
+
+INDEX_FILENAME = "index.json"
+JOURNAL_FILENAME = "index.journal"
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# The index is rewritten when its journal has more operations than this and than the number of entries
+MIN_JOURNAL_OPERATIONS = 64
+
+
+class CacheEntry(object):
+    """Metadata of a cached response. The decoded objects are kept in a file of the cache directory."""
+
+    def __init__(self, url, odata_context, etag, next_link, file_name, size, stored):
+        self.url = url
+        self.odata_context = odata_context
+        self.etag = etag
+        self.next_link = next_link
+        self.file_name = file_name
+        self.size = size
+        self.stored = stored
+
+    @property
+    def key(self):
+        return self.url, self.odata_context
+
+    def to_dict(self):
+        return dict(self.__dict__)
+
+
+class ResponseCache(object):
+    """Cache of responses keyed by request url and @odata.context. Entries keep the etag used to
+    revalidate them and the objects already decoded, stored as compact records. When the total
+    size goes over the limit, least recently used entries are removed.
+
+    Changes of the entries are appended to a journal next to the index, which is rewritten when the
+    journal grows longer than the index or when flush() is called. The order of use of the entries is
+    only saved when the index is rewritten.
+    """
+
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES, max_age=0):
+        """Initializes the cache, loading the entries already in the directory.
+        :param directory: path to the cache directory. It's created if it doesn't exist.
+        :param max_bytes: maximum total size in bytes of the cached objects.
+        :param max_age: seconds an entry is used without revalidating it with the service.
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.total_bytes = 0
+        self._entries = OrderedDict()
+        # Url: @odata.context of its entry used last, for requests that don't know the context to expect
+        self._contexts = {}
+        self._journal_operations = 0
+
+        # Statistics: fresh hits don't use the network, revalidated hits got status 304
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        self.evictions = 0
+        self._latency = {'hit': [0, 0.0], 'revalidated': [0, 0.0], 'miss': [0, 0.0]}
+
+        os.makedirs(directory, exist_ok=True)
+        self._load_index()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _load_index(self):
+        """Loads the entries of the index and applies the operations of its journal."""
+        try:
+            with open(os.path.join(self.directory, INDEX_FILENAME)) as f:
+                index = load(f)
+        except (OSError, ValueError):
+            index = []
+        entries = OrderedDict()
+        for item in index:
+            entry = CacheEntry(**item)
+            entries[entry.key] = entry
+
+        # Journal lines: ["put", entry dictionary] or ["remove", url, odata_context]
+        try:
+            with open(os.path.join(self.directory, JOURNAL_FILENAME)) as f:
+                for line in f:
+                    try:
+                        operation = loads(line)
+                    except ValueError:
+                        # Line not completely written
+                        break
+                    if operation[0] == 'put':
+                        entry = CacheEntry(**operation[1])
+                        entries.pop(entry.key, None)
+                        entries[entry.key] = entry
+                    else:
+                        entries.pop((operation[1], operation[2]), None)
+                    self._journal_operations += 1
+        except OSError:
+            pass
+
+        for key, entry in entries.items():
+            if os.path.exists(os.path.join(self.directory, entry.file_name)):
+                self._entries[key] = entry
+                self._contexts[entry.url] = entry.odata_context
+                self.total_bytes += entry.size
+
+    def _save_index(self):
+        """Rewrites the index with all the entries, in order of use, and removes the journal."""
+        path = os.path.join(self.directory, INDEX_FILENAME)
+        with open(path + ".tmp", 'w') as f:
+            dump([entry.to_dict() for entry in self._entries.values()], f)
+        os.replace(path + ".tmp", path)
+        try:
+            os.remove(os.path.join(self.directory, JOURNAL_FILENAME))
+        except OSError:
+            pass
+        self._journal_operations = 0
+
+    def _log(self, operations):
+        """Appends operations to the journal, or rewrites the index if the journal is too long."""
+        if self._journal_operations + len(operations) > max(MIN_JOURNAL_OPERATIONS, len(self._entries)):
+            self._save_index()
+            return
+        with open(os.path.join(self.directory, JOURNAL_FILENAME), 'a') as f:
+            f.write("".join(dumps(operation) + "\n" for operation in operations))
+        self._journal_operations += len(operations)
+
+    def flush(self):
+        """Rewrites the index, saving the order of use of the entries."""
+        self._save_index()
+
+    def _remove(self, key):
+        """Removes the entry and its file, returns the journal operation of the removal."""
+        entry = self._entries.pop(key)
+        self.total_bytes -= entry.size
+        if self._contexts.get(entry.url) == entry.odata_context:
+            del self._contexts[entry.url]
+        try:
+            os.remove(os.path.join(self.directory, entry.file_name))
+        except OSError:
+            pass
+        return ['remove', entry.url, entry.odata_context]
+
+    def get_entry(self, url, odata_context=None):
+        """Returns the entry of the url and context, or None if it's not cached.
+        :param url: request url.
+        :param odata_context: @odata.context expected for the response. If not specified, the entry of the
+                              url used last is returned. Optional.
+        """
+        if odata_context is None:
+            odata_context = self._contexts.get(url)
+        entry = self._entries.get((url, odata_context))
+        if entry is None:
+            return None
+        self._entries.move_to_end(entry.key)
+        self._contexts[url] = odata_context
+        return entry
+
+    def is_fresh(self, entry):
+        """Returns True if the entry can be used without revalidating it."""
+        return time() - entry.stored < self.max_age
+
+    def load(self, entry):
+        """Returns the objects of a cache entry, an object or a list of objects."""
+        try:
+            with open(os.path.join(self.directory, entry.file_name), 'rb') as f:
+                records = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            if entry.key in self._entries:
+                self._log([self._remove(entry.key)])
+            return None
+        if isinstance(records, list):
+            return [OdataObjectBase.from_record(record) for record in records]
+        return OdataObjectBase.from_record(records)
+
+    def touch(self, entry):
+        """Marks the entry as revalidated now."""
+        entry.stored = time()
+        if entry.key in self._entries:
+            self._log([['put', entry.to_dict()]])
+
+    def put(self, url, odata_context, etag, objects, next_link=None):
+        """Stores the decoded objects of a response.
+        :param url: request url.
+        :param odata_context: @odata.context of the response.
+        :param etag: etag of the response.
+        :param objects: object or list of objects decoded from the response.
+        :param next_link: @odata.nextLink of the response. Optional.
+        """
+        if isinstance(objects, list):
+            records = [obj.to_record() for obj in objects]
+        else:
+            records = objects.to_record()
+        data = pickle.dumps(records, pickle.HIGHEST_PROTOCOL)
+
+        # The previous response of the url is replaced, or removed if the new one is too large to store
+        operations = []
+        if (url, odata_context) in self._entries:
+            operations.append(self._remove((url, odata_context)))
+        if len(data) > self.max_bytes:
+            self._log(operations)
+            return
+
+        file_name = sha256((url + "\n" + str(odata_context)).encode('utf-8')).hexdigest() + ".pickle"
+        with open(os.path.join(self.directory, file_name), 'wb') as f:
+            f.write(data)
+
+        entry = CacheEntry(url, odata_context, etag, next_link, file_name, len(data), time())
+        self._entries[entry.key] = entry
+        self._contexts[url] = odata_context
+        self.total_bytes += len(data)
+        operations.append(['put', entry.to_dict()])
+
+        while self.total_bytes > self.max_bytes:
+            operations.append(self._remove(next(iter(self._entries))))
+            self.evictions += 1
+        self._log(operations)
+
+    def record(self, outcome, seconds):
+        """Records the outcome of a request: 'hit', 'revalidated' or 'miss', with its latency."""
+        if outcome == 'hit':
+            self.hits += 1
+        elif outcome == 'revalidated':
+            self.revalidated += 1
+        else:
+            self.misses += 1
+        self._latency[outcome][0] += 1
+        self._latency[outcome][1] += seconds
+
+    def stats(self):
+        """Returns dictionary with hit rate, counters and average latency in seconds of each outcome."""
+        requests = self.hits + self.revalidated + self.misses
+        return {'entries': len(self._entries),
+                'bytes': self.total_bytes,
+                'hits': self.hits,
+                'revalidated': self.revalidated,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': (self.hits + self.revalidated) / requests if requests else 0.0,
+                'latency': {k: v[1] / v[0] if v[0] else None for k, v in self._latency.items()}}
+
+    def clear(self):
+        """Removes all entries."""
+        for key in list(self._entries):
+            self._remove(key)
+        self._save_index()
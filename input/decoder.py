@@ -0,0 +1,218 @@
+"""Schema driven decoding of json responses straight into objects of the generated classes.
+
+Generated constructors build a dictionary of the properties renamed to python names and convert each property
+with a conditional expression, repeating it for every base class and every nested object. The decoder of a
+class is a function compiled from its decode plan the first time the class is decoded: it looks up each
+property of the class and its bases once in the json dictionary and assigns the converted value, without
+calling the constructors. Keys that aren't properties are never visited. Objects are equal to the ones
+created by the constructors: nested objects have the class declared for the property and missing
+properties are None.
+
+Decoding is safe from several threads: decoders are compiled once under the lock of the model and
+afterwards they only read the tables of the model. On free-threaded builds of Python the threads of
+decode_items_threaded() and loads_threaded() use several cores, without the pickling of process pools.
+Tables must not be changed while decoding, i.e. by a Reloader.
+"""
+
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from json import loads
+from .odata_object_base import OdataObjectBase, _lock
+from .extension import ODATA_TYPE_TO_PYTHON, get_object_class
+
+
+# Kinds of properties in the decode plans
+SCALAR, OBJECT, SCALAR_LIST, OBJECT_LIST = range(4)
+
+# Converters that return the same value when it already has their type
+_IDENTITY_TYPES = (str, int, float, bool)
+
+DEFAULT_CHUNK_ITEMS = 1024
+
+# True if threads run in parallel, on free-threaded builds of Python
+FREE_THREADED = not getattr(sys, '_is_gil_enabled', lambda: True)()
+
+# Class: compiled decoder function
+_decoders = {}
+
+
+def decode_plan(cls):
+    """Returns list of tuples (odata name, python name, kind, converter or class) with the properties decoded
+    for the class, in the order they are assigned by the constructors. Projection classes only decode their
+    selected properties, see OdataObjectBase.projection().
+    :param cls: generated class.
+    """
+    if '_decode_plan' in cls.__dict__:
+        declared = [(odata_name, name) for odata_name, name, _, _ in cls._decode_plan]
+    else:
+        declared = [(cls.get_property_odata_name(name), name) for name in cls.flattened_properties()]
+
+    plan = []
+    for odata_name, name in declared:
+        odata_type = next(c.__dict__['valid_properties'][name]['odata_type'] for c in cls.__mro__
+                          if name in c.__dict__.get('valid_properties', {}))
+        is_list = odata_type.startswith("Collection(")
+        converter = ODATA_TYPE_TO_PYTHON[odata_type[11:-1] if is_list else odata_type]
+        if isinstance(converter, type) and issubclass(converter, OdataObjectBase):
+            kind = OBJECT_LIST if is_list else OBJECT
+        else:
+            kind = SCALAR_LIST if is_list else SCALAR
+        plan.append((odata_name, name, kind, converter))
+    return plan
+
+
+def _value_expression(kind, converter, argument):
+    """Returns source of the expression converting variable v, with the converter in variable argument."""
+    if kind == OBJECT:
+        return "decode_object(v, {})".format(argument)
+    if kind == OBJECT_LIST:
+        return "[decode_object(x, {}) for x in v]".format(argument)
+
+    if converter in _IDENTITY_TYPES:
+        convert = "{0} if {0}.__class__ is {1} else {1}({0})"
+    else:
+        convert = "{1}({0})"
+    if kind == SCALAR:
+        return convert.format("v", argument)
+    return "[" + convert.format("x", argument) + " for x in v]"
+
+
+def object_decoder(cls):
+    """Returns function receiving a dictionary of properties in odata format and returning an object of class
+    cls, compiled from the decode plan of the class the first time.
+    :param cls: generated class.
+    """
+    try:
+        return _decoders[cls]
+    except KeyError:
+        pass
+
+    with _lock:
+        if cls not in _decoders:
+            _decoders[cls] = _compile_decoder(cls)
+        return _decoders[cls]
+
+
+def _compile_decoder(cls):
+    """Returns decoder function of the class compiled from its decode plan."""
+    # Properties not selected by a projection are class attributes, so only the ones received are assigned
+    is_projection = '_decode_plan' in cls.__dict__
+
+    arguments = []
+    lines = ["    obj = new(cls)",
+             "    try:",
+             "        get = item.get",
+             "    except AttributeError:",
+             "        raise ValueError(\"Positional parameter 'odata_properties' must be a dictionary.\")"]
+    for odata_name, name, kind, converter in decode_plan(cls):
+        argument = "c" + str(len(arguments))
+        arguments.append(converter)
+        expression = _value_expression(kind, converter, argument)
+        lines.append("    v = get({!r})".format(odata_name))
+        if is_projection:
+            lines.append("    if v is not None:")
+            lines.append("        obj.{} = {}".format(name, expression))
+        else:
+            lines.append("    obj.{} = {} if v is not None else None".format(name, expression))
+    lines.append("    return obj")
+
+    source = "def make(new, cls{}):\n".format("".join(", c" + str(i) for i in range(len(arguments))))
+    source += "  def decode(item):\n  " + "\n  ".join(lines) + "\n  return decode\n"
+
+    # Nested objects are decoded with decode_object() of this module
+    namespace = {}
+    exec(source, globals(), namespace)
+    return namespace['make'](cls.__new__, cls, *arguments)
+
+
+def decode_object(item, cls):
+    """Returns object of class cls with the properties of the item, like cls(item).
+    :param item: dictionary of properties in odata format.
+    :param cls: generated class.
+    """
+    decoder = _decoders.get(cls)
+    if decoder is None:
+        decoder = object_decoder(cls)
+    return decoder(item)
+
+
+def decode_item(item, cls):
+    """Returns object of the class of the @odata.type of the item, or of class cls if it has none."""
+    if '@odata.type' in item:
+        cls = get_object_class(None, item['@odata.type'])
+    return decode_object(item, cls)
+
+
+def decode_items(items, cls):
+    """Returns list of objects of the items, see decode_item().
+    :param items: list of dictionaries in odata format, i.e. the value of a response.
+    :param cls: generated class of the items without @odata.type.
+    """
+    classes = {}
+    result = []
+    for item in items:
+        odata_type = item.get('@odata.type')
+        if odata_type is None:
+            item_cls = cls
+        else:
+            item_cls = classes.get(odata_type)
+            if item_cls is None:
+                item_cls = classes[odata_type] = get_object_class(None, odata_type)
+        result.append(decode_object(item, item_cls))
+    return result
+
+
+def loads_objects(data, cls=None):
+    """Returns the objects of a json response body.
+    :param data: json response as bytes or str.
+    :param cls: generated class of the items. If not specified it's taken from @odata.context. Optional.
+    :return: list of objects for collections, or a single object.
+    """
+    body = loads(data)
+    if not isinstance(body, dict):
+        raise ValueError("Response is not a json object.")
+    if cls is None:
+        cls = get_object_class(body.get('@odata.context', ''))
+    if isinstance(body.get('value'), list):
+        return decode_items(body['value'], cls)
+    return decode_item(body, cls)
+
+
+def _map_threads(function, tasks, max_workers, executor):
+    """Returns list of results of function applied to each task in a pool of threads."""
+    if executor is not None:
+        return list(executor.map(function, tasks))
+    with ThreadPoolExecutor(max_workers, thread_name_prefix="odata-decoder") as pool:
+        return list(pool.map(function, tasks))
+
+
+def decode_items_threaded(items, cls, max_workers=None, chunk_items=DEFAULT_CHUNK_ITEMS, executor=None):
+    """Returns list of objects of the items decoded by a pool of threads in chunks, see decode_items().
+    Threads only run in parallel on free-threaded builds of Python, see FREE_THREADED.
+    :param items: list of dictionaries in odata format, i.e. the value of a response.
+    :param cls: generated class of the items without @odata.type.
+    :param max_workers: number of threads of the pool. Defaults to the one of ThreadPoolExecutor.
+    :param chunk_items: number of items decoded by a thread at once.
+    :param executor: executor to use instead of a new pool of threads. Optional.
+    """
+    if chunk_items < 1:
+        raise ValueError("Parameter chunk_items must be a positive integer.")
+    if len(items) <= chunk_items:
+        return decode_items(items, cls)
+
+    chunks = [items[i:i + chunk_items] for i in range(0, len(items), chunk_items)]
+    result = []
+    for objects in _map_threads(lambda chunk: decode_items(chunk, cls), chunks, max_workers, executor):
+        result.extend(objects)
+    return result
+
+
+def loads_threaded(bodies, cls=None, max_workers=None, executor=None):
+    """Returns list with the objects of each json response body, parsed and decoded by a pool of threads.
+    See loads_objects().
+    :param bodies: iterable with json responses as bytes or str, i.e. the pages of a collection.
+    :param cls: generated class of the items. If not specified it's taken from @odata.context. Optional.
+    :param max_workers: number of threads of the pool. Defaults to the one of ThreadPoolExecutor.
+    :param executor: executor to use instead of a new pool of threads. Optional.
+    """
+    return _map_threads(lambda data: loads_objects(data, cls), bodies, max_workers, executor)
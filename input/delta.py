@@ -0,0 +1,322 @@
+"""Incremental synchronization of entity sets with delta queries: @odata.deltaLink, @removed and partial updates."""
+
+import os
+import pickle
+from time import perf_counter
+from urllib.parse import urlencode, quote
+from .odata_object_base import OdataObjectBase
+from .transport import decode_json
+from .diff import DiffResult, property_deltas
+from .decoder import decode_object
+from .extension import ODATA_CONTAINER_TYPE, ODATA_TYPE_TO_PYTHON, get_object_class
+
+
+NEXT_LINK = "@odata.nextLink"
+DELTA_LINK = "@odata.deltaLink"
+REMOVED = "@removed"
+
+JOURNAL_SUFFIX = ".journal"
+
+# Status of the response when the delta link expired and a full synchronization is needed
+RESYNC_STATUS = (410,)
+
+
+class SyncResult(DiffResult):
+    """Changes applied by DeltaSync.sync(), see DiffResult.
+    full: True if all the entity set was requested, the first time or because the delta link expired.
+    pages: number of pages received.
+    seconds: duration of the synchronization.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.full = False
+        self.pages = 0
+        self.seconds = 0.0
+
+        # Keys of the objects in added
+        self._added_keys = set()
+
+    def __repr__(self):
+        return '<ODATA SYNC: {} added, {} removed, {} modified in {} pages{}>'.format(
+            len(self.added), len(self.removed), len(self.modified), self.pages, ', full' if self.full else '')
+
+
+def _comparable(value):
+    """Returns value that compares equal for objects with the same properties."""
+    if isinstance(value, OdataObjectBase):
+        return value.to_record()
+    if isinstance(value, list):
+        return [v.to_record() if isinstance(v, OdataObjectBase) else v for v in value]
+    return value
+
+
+class DeltaSync(object):
+    """Local copy of an entity set kept up to date with delta queries.
+
+    The first synchronization gets the whole entity set. Next ones send the delta link of the previous one,
+    so the service only returns the entities added, modified or removed since then. Modified entities have
+    only the properties that changed, which are merged into the local objects. Objects are keyed on the key
+    property of the entity type.
+
+    Each change is passed to the callback as a tuple like the ones of diff.diff_sorted(): ('added', object),
+    ('modified', key, dictionary property name: (old value, new value)) or ('removed', object).
+    """
+
+    def __init__(self, transport, container, select=None, state_path=None, callback=None):
+        """Initializes the synchronization, loading the state saved by a previous one if there is one.
+        :param transport: HttpTransport object of the service.
+        :param container: name of entity set in odata format, i.e. "users".
+        :param select: list of property names in odata format to synchronize. Defaults to the ones
+                       returned by the service. Optional.
+        :param state_path: path to the file where the delta link and the objects are saved. Each
+                           synchronization appends the objects that changed to a journal file next to it,
+                           which is merged into the state file when it grows larger than it. Optional.
+        :param callback: function receiving each change. Optional.
+        """
+        if container not in ODATA_CONTAINER_TYPE:
+            raise ValueError("Unknown entity set: " + container)
+        self.transport = transport
+        self.container = container
+        self.cls = ODATA_TYPE_TO_PYTHON[ODATA_CONTAINER_TYPE[container]]
+        self.callback = callback
+        self.state_path = state_path
+
+        key_class = self.cls.get_key_class()
+        if key_class is None:
+            raise ValueError("Entity type of {} has no key.".format(container))
+        self.key_property = key_class.key_property
+
+        self.url = container + "/delta"
+        if select:
+            self.url += "?" + urlencode({'$select': ",".join(select)}, safe="$,'()", quote_via=quote)
+
+        self.delta_link = None
+        self.objects = {}
+        self._journal_records = 0
+        if state_path is not None:
+            self.load()
+
+        # Statistics
+        self.syncs = 0
+        self.requests_sent = 0
+
+    def __len__(self):
+        return len(self.objects)
+
+    def __iter__(self):
+        return iter(self.objects.values())
+
+    def __contains__(self, key):
+        return key in self.objects
+
+    def get(self, key):
+        """Returns the object with the key specified, or None if it's not in the entity set."""
+        return self.objects.get(key)
+
+    ######################################################################
+
+    def load(self):
+        """Loads the delta link and the objects from the state file and its journal. Nothing is loaded if
+        the file doesn't exist or was saved with another url.
+        """
+        try:
+            with open(self.state_path, 'rb') as f:
+                state = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return
+        if state.get('url') != self.url:
+            return
+        self.delta_link = state['delta_link']
+        self.objects = {}
+        for record in state['records']:
+            obj = OdataObjectBase.from_record(record)
+            self.objects[obj.get_key()] = obj
+
+        # Journal entries: (delta link, records of the objects changed, keys of the objects removed)
+        self._journal_records = 0
+        try:
+            with open(self.state_path + JOURNAL_SUFFIX, 'rb') as f:
+                while True:
+                    delta_link, records, removed = pickle.load(f)
+                    for record in records:
+                        obj = OdataObjectBase.from_record(record)
+                        self.objects[obj.get_key()] = obj
+                    for key in removed:
+                        self.objects.pop(key, None)
+                    self.delta_link = delta_link
+                    self._journal_records += len(records) + len(removed)
+        except (OSError, pickle.UnpicklingError, EOFError, ValueError):
+            # End of the journal, or an entry not completely written: its changes are received again
+            pass
+
+    def save(self):
+        """Saves the delta link and all the objects to the state file, replacing it at once, and removes the journal."""
+        state = {'url': self.url,
+                 'delta_link': self.delta_link,
+                 'records': [obj.to_record() for obj in self.objects.values()]}
+        with open(self.state_path + ".tmp", 'wb') as f:
+            pickle.dump(state, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(self.state_path + ".tmp", self.state_path)
+        try:
+            os.remove(self.state_path + JOURNAL_SUFFIX)
+        except OSError:
+            pass
+        self._journal_records = 0
+
+    def save_changes(self, result):
+        """Appends the delta link and the changes of a synchronization to the journal. The state file is
+        saved instead after a full synchronization, or when the journal has more records than the state.
+        :param result: SyncResult object of the synchronization.
+        """
+        changed = [obj.get_key() for obj in result.added] + list(result.modified)
+        removed = [obj.get_key() for obj in result.removed]
+        if result.full or not os.path.exists(self.state_path) or \
+                self._journal_records + len(changed) + len(removed) > len(self.objects):
+            self.save()
+            return
+
+        entry = (self.delta_link, [self.objects[key].to_record() for key in changed], removed)
+        with open(self.state_path + JOURNAL_SUFFIX, 'ab') as f:
+            pickle.dump(entry, f, pickle.HIGHEST_PROTOCOL)
+        self._journal_records += len(changed) + len(removed)
+
+    def reset(self):
+        """Forgets the delta link, so the next synchronization gets the whole entity set again.
+        Objects are kept and the ones no longer in the entity set are removed by that synchronization.
+        """
+        self.delta_link = None
+
+    ######################################################################
+
+    def _get(self, url):
+        """Returns tuple (status, decoded body) of a GET request."""
+        self.requests_sent += 1
+        status, headers, data = self.transport.request("GET", url, headers={'Accept': 'application/json'})
+        return status, decode_json(data)
+
+    def _emit(self, event):
+        if self.callback is not None:
+            self.callback(event)
+
+    def _add(self, key, item, result):
+        cls = get_object_class(None, item['@odata.type']) if '@odata.type' in item else self.cls
+        obj = decode_object(item, cls)
+        self.objects[key] = obj
+        result.added.append(obj)
+        result._added_keys.add(key)
+        self._emit(('added', obj))
+
+    def _update(self, key, obj, item, result):
+        """Merges the properties of the item into the object and records the properties that changed."""
+        cls = get_object_class(None, item['@odata.type']) if '@odata.type' in item else type(obj)
+
+        if cls is not type(obj):
+            # Received with another type: new object keeping the values of the properties not received
+            new_obj = decode_object(item, cls)
+            for name, value in obj.__dict__.items():
+                if value is not None and getattr(new_obj, name, None) is None:
+                    setattr(new_obj, name, value)
+            changes = property_deltas(obj, new_obj)
+            self.objects[key] = new_obj
+            if key in result._added_keys:
+                result.added = [new_obj if added is obj else added for added in result.added]
+        else:
+            names = []
+            for odata_name in item:
+                try:
+                    names.append(cls.get_property_python_name(odata_name))
+                except ValueError:
+                    # Annotation or property not in the model
+                    pass
+            old_values = {name: getattr(obj, name, None) for name in names}
+            obj.update(item)
+            changes = {name: (old, getattr(obj, name, None)) for name, old in old_values.items()
+                       if _comparable(old) != _comparable(getattr(obj, name, None))}
+
+        if not changes:
+            return
+        if key not in result._added_keys:
+            modified = result.modified.setdefault(key, {})
+            for name, (old, new) in changes.items():
+                # Changed again in the same synchronization, keep the first old value
+                modified[name] = (modified[name][0] if name in modified else old, new)
+        self._emit(('modified', key, changes))
+
+    def _remove(self, key, result):
+        obj = self.objects.pop(key, None)
+        if obj is None:
+            return
+        result.modified.pop(key, None)
+        if key in result._added_keys:
+            result._added_keys.discard(key)
+            result.added = [added for added in result.added if added is not obj]
+        else:
+            result.removed.append(obj)
+        self._emit(('removed', obj))
+
+    def apply(self, items, result=None, seen=None):
+        """Applies the items of a delta page to the local objects.
+        :param items: list of entities in odata format, with only the properties changed, or with @removed.
+        :param result: SyncResult object recording the changes. Optional.
+        :param seen: set where the keys of the items are added. Optional.
+        :return: SyncResult object.
+        """
+        if result is None:
+            result = SyncResult()
+        for item in items:
+            key = item.get(self.key_property)
+            if key is None:
+                continue
+            if seen is not None:
+                seen.add(key)
+
+            if REMOVED in item:
+                self._remove(key, result)
+            elif key in self.objects:
+                self._update(key, self.objects[key], item, result)
+            else:
+                self._add(key, item, result)
+        return result
+
+    def sync(self):
+        """Gets the changes since the last synchronization and applies them to the local objects.
+        The changes are saved when the delta link of the new synchronization is received.
+        :return: SyncResult object.
+        """
+        started = perf_counter()
+        result = SyncResult()
+        result.full = self.delta_link is None
+        seen = set() if result.full else None
+        url = self.delta_link or self.url
+
+        while url:
+            status, body = self._get(url)
+            if status in RESYNC_STATUS and not result.full:
+                # Delta link expired: get the whole entity set, then remove what is no longer there
+                self.delta_link = None
+                result.full = True
+                seen = set()
+                url = self.url
+                continue
+            if status != 200 or not isinstance(body, dict):
+                raise ValueError("Request GET {} failed with status {}: {}".format(url, status, body))
+
+            self.apply(body.get('value', []), result, seen)
+            result.pages += 1
+
+            url = body.get(NEXT_LINK)
+            if url is None:
+                if DELTA_LINK not in body:
+                    raise ValueError("Delta response without @odata.nextLink or @odata.deltaLink: " + self.url)
+                self.delta_link = body[DELTA_LINK]
+
+        if seen is not None:
+            for key in [key for key in self.objects if key not in seen]:
+                self._remove(key, result)
+
+        self.syncs += 1
+        if self.state_path is not None:
+            self.save_changes(result)
+        result.seconds = perf_counter() - started
+        return result
@@ -0,0 +1,173 @@
+"""Comparison of two collections of objects joined on their key property, using content hashes."""
+
+from hashlib import blake2b
+
+
+class DiffResult(object):
+    """Differences between two collections.
+    added: list of new objects whose key wasn't in the old collection.
+    removed: list of old objects (or keys if old objects weren't available) not in the new collection.
+    modified: dictionary key: dictionary property name: (old value, new value).
+    keyless: list of tuples ('old' or 'new', object) with the objects without key, which can't be joined.
+    """
+
+    def __init__(self):
+        self.added = []
+        self.removed = []
+        self.modified = {}
+        self.keyless = []
+
+    def __repr__(self):
+        return '<ODATA DIFF: {} added, {} removed, {} modified>'.format(len(self.added), len(self.removed),
+                                                                     len(self.modified))
+
+
+def values_hash(values):
+    """Returns stable hash of a sequence of record values."""
+    return blake2b(repr(values).encode('utf-8'), digest_size=16).digest()
+
+
+def entity_hashes(obj, groups=None):
+    """Returns tuple with the content hash of the object, or one hash per property group.
+    :param obj: object of a generated class.
+    :param groups: list of lists of property names in python format. Properties not in any group
+                   form an additional last group. Optional.
+    """
+    names = obj.flattened_properties()
+    values = obj.to_record()[1]
+    if not groups:
+        return type(obj).odata, values_hash(values)
+
+    by_name = dict(zip(names, values))
+    grouped = set()
+    hashes = [type(obj).odata]
+    for group in groups:
+        hashes.append(values_hash([by_name.get(name) for name in group]))
+        grouped.update(group)
+    hashes.append(values_hash([v for n, v in zip(names, values) if n not in grouped]))
+    return tuple(hashes)
+
+
+def hash_index(objects, groups=None):
+    """Returns dictionary key: hashes of the objects, to keep instead of a full copy of the collection.
+    :param objects: iterable with objects of the generated classes.
+    :param groups: property groups, see entity_hashes(). Optional.
+    """
+    return {obj.get_key(): entity_hashes(obj, groups) for obj in objects}
+
+
+def property_deltas(old, new, names=None):
+    """Returns dictionary property name: (old value, new value) for the properties that are different.
+    :param old: old object.
+    :param new: new object.
+    :param names: property names to compare. Defaults to all properties of both objects.
+    """
+    old_values = dict(zip(old.flattened_properties(), old.to_record()[1]))
+    new_values = dict(zip(new.flattened_properties(), new.to_record()[1]))
+    if names is None:
+        names = list(old_values) + [n for n in new_values if n not in old_values]
+
+    return {name: (getattr(old, name, None), getattr(new, name, None)) for name in names
+            if old_values.get(name) != new_values.get(name)}
+
+
+def changed_properties(old_hashes, new_hashes, obj, groups=None):
+    """Returns property names in the groups whose hash changed, or None for all properties."""
+    if not groups or old_hashes[0] != new_hashes[0]:
+        return None
+    names = []
+    for i, group in enumerate(groups):
+        if old_hashes[i + 1] != new_hashes[i + 1]:
+            names.extend(group)
+    if old_hashes[-1] != new_hashes[-1]:
+        grouped = set(name for group in groups for name in group)
+        names.extend(name for name in obj.flattened_properties() if name not in grouped)
+    return names
+
+
+def diff(old, new, groups=None, old_lookup=None):
+    """Returns the differences between two collections joined on the key property.
+    Properties are compared only for the objects whose hash changed.
+    :param old: iterable with the old objects, or dictionary returned by hash_index() for the old collection.
+    :param new: iterable with the new objects.
+    :param groups: property groups, see entity_hashes(). Only the properties of the groups whose hash
+                   changed are compared. Optional.
+    :param old_lookup: function returning the old object of a key, i.e. Snapshot.get. Required to get
+                       the property deltas when old is a dictionary of hashes.
+    :return: DiffResult object.
+    """
+    result = DiffResult()
+    if isinstance(old, dict):
+        old_hashes, old_objects = old, None
+    else:
+        old_objects = {}
+        for obj in old:
+            key = obj.get_key()
+            if key is None:
+                result.keyless.append(('old', obj))
+            else:
+                old_objects[key] = obj
+        old_hashes = {key: entity_hashes(obj, groups) for key, obj in old_objects.items()}
+
+    seen = set()
+    for obj in new:
+        key = obj.get_key()
+        if key is None:
+            result.keyless.append(('new', obj))
+            continue
+        seen.add(key)
+        if key not in old_hashes:
+            result.added.append(obj)
+            continue
+
+        hashes = entity_hashes(obj, groups)
+        if hashes == old_hashes[key]:
+            continue
+
+        old_obj = old_objects[key] if old_objects is not None else old_lookup(key) if old_lookup else None
+        if old_obj is None:
+            result.modified[key] = {}
+        else:
+            result.modified[key] = property_deltas(old_obj, obj, changed_properties(old_hashes[key], hashes,
+                                                                                     obj, groups))
+
+    for key in old_hashes:
+        if key not in seen and key is not None:
+            result.removed.append(old_objects[key] if old_objects is not None else key)
+    return result
+
+
+def diff_sorted(old, new, groups=None):
+    """Generator of the differences between two collections sorted by key, reading both only once.
+    :param old: iterable with the old objects sorted by key.
+    :param new: iterable with the new objects sorted by key.
+    :param groups: property groups, see entity_hashes(). Optional.
+    :return: tuples ('added', new object), ('removed', old object), ('modified', key, property deltas) or
+             ('keyless', 'old' or 'new', object) for objects without key, which can't be joined.
+    """
+    old, new = iter(old), iter(new)
+    old_obj, new_obj = next(old, None), next(new, None)
+
+    while old_obj is not None or new_obj is not None:
+        old_key = old_obj.get_key() if old_obj is not None else None
+        new_key = new_obj.get_key() if new_obj is not None else None
+
+        if old_obj is not None and old_key is None:
+            yield 'keyless', 'old', old_obj
+            old_obj = next(old, None)
+        elif new_obj is not None and new_key is None:
+            yield 'keyless', 'new', new_obj
+            new_obj = next(new, None)
+        elif new_obj is None or (old_obj is not None and old_key < new_key):
+            yield 'removed', old_obj
+            old_obj = next(old, None)
+        elif old_obj is None or new_key < old_key:
+            yield 'added', new_obj
+            new_obj = next(new, None)
+        else:
+            old_hashes, new_hashes = entity_hashes(old_obj, groups), entity_hashes(new_obj, groups)
+            if old_hashes != new_hashes:
+                yield 'modified', new_key, property_deltas(old_obj, new_obj,
+                                                           changed_properties(old_hashes, new_hashes,
+                                                                              new_obj, groups))
+            old_obj, new_obj = next(old, None), next(new, None)
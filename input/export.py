@@ -0,0 +1,184 @@
+"""Streaming export of collections of objects to flat tables: CSV or Arrow IPC files."""
+
+import csv
+from itertools import islice
+from json import dumps
+from .odata_object_base import OdataObjectBase
+from .extension import ODATA_TYPE_TO_PYTHON
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+except ImportError:
+    pyarrow = None
+
+
+DEFAULT_BATCH_SIZE = 65536
+COLLECTION_MODES = ('json', 'join', 'first', 'count', 'skip')
+INTEGER_TYPES = ('Edm.SByte', 'Edm.Int16', 'Edm.Int32', 'Edm.Int64')
+FLOAT_TYPES = ('Edm.Decimal', 'Edm.Single', 'Edm.Double')
+
+
+def to_json(value):
+    """Returns value as a json string, with objects in their serialized form."""
+    if isinstance(value, OdataObjectBase):
+        value = value.serialized()
+    elif isinstance(value, list):
+        value = [v.serialized() if isinstance(v, OdataObjectBase) else v for v in value]
+    return dumps(value)
+
+
+class Column(object):
+    """Column of a flat table: name, odata type of the values and function getting the value from an object."""
+
+    def __init__(self, name, odata_type, getter):
+        self.name = name
+        self.odata_type = odata_type
+        self.getter = getter
+
+
+def _path_getter(path):
+    """Returns function getting the value of the python property path from an object, None if not set."""
+    def getter(obj):
+        for name in path:
+            obj = getattr(obj, name, None)
+            if obj is None:
+                return None
+        return obj
+    return getter
+
+
+def _collection_getter(getter, mode, separator):
+    if mode == 'count':
+        return lambda obj: None if getter(obj) is None else len(getter(obj))
+    if mode == 'first':
+        def first(obj):
+            value = getter(obj)
+            return (to_json(value[0]) if isinstance(value[0], OdataObjectBase) else value[0]) if value else None
+        return first
+    if mode == 'join':
+        def join(obj):
+            value = getter(obj)
+            return None if value is None else separator.join(to_json(v) if isinstance(v, OdataObjectBase)
+                                                             else str(v) for v in value)
+        return join
+    return lambda obj: None if getter(obj) is None else to_json(getter(obj))
+
+
+def get_columns(cls, collections='json', separator='|', max_depth=3):
+    """Returns list of Column objects for the class. Properties of complex types become columns with
+    dotted names, i.e. "passwordProfile.password".
+    :param cls: generated class.
+    :param collections: how collection properties are exported: 'json' as a json array, 'join' values
+                        joined by the separator, 'first' only the first value, 'count' number of values
+                        or 'skip' not exported.
+    :param separator: separator used by 'join'.
+    :param max_depth: maximum nesting of complex types flattened into columns. Deeper ones are exported as json.
+    """
+    if collections not in COLLECTION_MODES:
+        raise ValueError("Parameter collections must be one of: " + ", ".join(COLLECTION_MODES))
+
+    columns = []
+
+    def add_columns(c, odata_prefix, python_prefix, depth):
+        for klass in reversed(c.__mro__):
+            for name, prop in klass.__dict__.get('valid_properties', {}).items():
+                odata_name = odata_prefix + prop['odata_name']
+                path = python_prefix + (name,)
+                odata_type = prop['odata_type']
+
+                if odata_type.startswith("Collection("):
+                    if collections == 'skip':
+                        continue
+                    item_type = odata_type[11:-1]
+                    column_type = 'Edm.Int64' if collections == 'count' else \
+                        item_type if collections == 'first' and item_type.startswith('Edm.') else 'Edm.String'
+                    columns.append(Column(odata_name, column_type,
+                                          _collection_getter(_path_getter(path), collections, separator)))
+                    continue
+
+                prop_class = ODATA_TYPE_TO_PYTHON.get(odata_type)
+                if isinstance(prop_class, type) and issubclass(prop_class, OdataObjectBase):
+                    if depth < max_depth:
+                        add_columns(prop_class, odata_name + ".", path, depth + 1)
+                    else:
+                        getter = _path_getter(path)
+                        columns.append(Column(odata_name, 'Edm.String',
+                                              lambda obj, g=getter: None if g(obj) is None else to_json(g(obj))))
+                    continue
+
+                columns.append(Column(odata_name, odata_type, _path_getter(path)))
+
+    add_columns(cls, "", (), 0)
+    return columns
+
+
+def iter_batches(objects, columns, batch_size=DEFAULT_BATCH_SIZE):
+    """Generator of batches of rows: lists of tuples with the values of the columns for each object."""
+    getters = [column.getter for column in columns]
+    objects = iter(objects)
+    while True:
+        batch = [tuple(getter(obj) for getter in getters) for obj in islice(objects, batch_size)]
+        if not batch:
+            return
+        yield batch
+
+
+def export_csv(objects, cls, path, batch_size=DEFAULT_BATCH_SIZE, **column_options):
+    """Writes the objects to a CSV file with a header row, converting them in batches.
+    :param objects: iterable with objects of the class cls or derived classes.
+    :param cls: generated class used to get the columns.
+    :param path: path to the file.
+    :param batch_size: number of objects converted and written at once.
+    :param column_options: options of get_columns().
+    :return: number of rows written.
+    """
+    columns = get_columns(cls, **column_options)
+    rows = 0
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow([column.name for column in columns])
+        for batch in iter_batches(objects, columns, batch_size):
+            writer.writerows(batch)
+            rows += len(batch)
+    return rows
+
+
+def arrow_schema(columns):
+    """Returns pyarrow schema of the columns."""
+    fields = []
+    for column in columns:
+        if column.odata_type == 'Edm.Boolean':
+            arrow_type = pyarrow.bool_()
+        elif column.odata_type in INTEGER_TYPES:
+            arrow_type = pyarrow.int64()
+        elif column.odata_type in FLOAT_TYPES:
+            arrow_type = pyarrow.float64()
+        else:
+            arrow_type = pyarrow.string()
+        fields.append(pyarrow.field(column.name, arrow_type))
+    return pyarrow.schema(fields)
+
+
+def export_arrow(objects, cls, path, batch_size=DEFAULT_BATCH_SIZE, **column_options):
+    """Writes the objects to an Arrow IPC file, one record batch per batch of objects. Requires pyarrow.
+    :param objects: iterable with objects of the class cls or derived classes.
+    :param cls: generated class used to get the columns.
+    :param path: path to the file.
+    :param batch_size: number of objects in each record batch.
+    :param column_options: options of get_columns().
+    :return: number of rows written.
+    """
+    if pyarrow is None:
+        raise ImportError("Package pyarrow is required to export Arrow files.")
+
+    columns = get_columns(cls, **column_options)
+    schema = arrow_schema(columns)
+    rows = 0
+    with pyarrow.OSFile(path, 'wb') as sink, pyarrow.ipc.new_file(sink, schema) as writer:
+        for batch in iter_batches(objects, columns, batch_size):
+            arrays = [pyarrow.array([row[i] for row in batch], type=schema.field(i).type)
+                      for i in range(len(columns))]
+            writer.write_batch(pyarrow.RecordBatch.from_arrays(arrays, schema=schema))
+            rows += len(batch)
+    return rows
@@ -1,8 +1,63 @@
 """Auxiliary classes and functions to support the model"""
 
 from re import match
-from .odata_object_base import Guid
-from . import *
+from .odata_object_base import Guid, resolve_class
+
+# Tables are written at the end of the file. Generated classes are only named in them and imported
+# when they are first looked up, so importing this module doesn't import the model.
+
+
+class ClassTable(dict):
+    """Dictionary odata type: python class whose generated classes are imported when first looked up.
+
+    It's created with the python types and the names of the generated classes, see resolve_class().
+    A class looked up is stored in the dictionary, so later lookups are plain dictionary lookups.
+    Iterating over it or getting its values imports the classes.
+    """
+
+    def __init__(self, types):
+        """Initializes the table.
+        :param types: dictionary odata type: python type, or name of a generated class.
+        """
+        super().__init__()
+        self.types = dict(types)
+
+    def __missing__(self, odata_type):
+        python_type = self.types[odata_type]
+        if isinstance(python_type, str):
+            python_type = resolve_class(python_type)
+        # Threads resolving it at the same time store the same class
+        self[odata_type] = python_type
+        return python_type
+
+    def __contains__(self, odata_type):
+        return odata_type in self.types
+
+    def __iter__(self):
+        return iter(self.types)
+
+    def __len__(self):
+        return len(self.types)
+
+    def get(self, odata_type, default=None):
+        try:
+            return self[odata_type]
+        except KeyError:
+            return default
+
+    def keys(self):
+        return self.types.keys()
+
+    def values(self):
+        return [self[odata_type] for odata_type in self.types]
+
+    def items(self):
+        return [(odata_type, self[odata_type]) for odata_type in self.types]
+
+    def reset(self, types):
+        """Replaces the types of the table, forgetting the classes already looked up."""
+        self.clear()
+        self.types = dict(types)
 
 
 def get_object_class(odata_context, odata_type=None):
@@ -13,6 +68,10 @@ def get_object_class(odata_context, odata_type=None):
 
     # If we have odata type we don't need the context
     if odata_type:
+        try:
+            return ODATA_TYPE_DISPATCH[odata_type]
+        except KeyError:
+            pass
         odata_type = odata_type.lstrip('#')
         if odata_type in ODATA_TYPE_TO_PYTHON:
             return ODATA_TYPE_TO_PYTHON[odata_type]
@@ -87,3 +146,84 @@ def get_object_class(odata_context, odata_type=None):
     raise ValueError("Unknown odata context: " + odata_context)
 
 
+# Capabilities of entity sets without capability annotations: the defaults of the vocabulary
+DEFAULT_CAPABILITIES = {'filterable': True,
+                        'requires_filter': False,
+                        'required_filter_properties': (),
+                        'non_filterable_properties': (),
+                        'filter_functions': None,
+                        'sortable': True,
+                        'non_sortable_properties': (),
+                        'top_supported': True,
+                        'skip_supported': True,
+                        'countable': True,
+                        'searchable': True,
+                        'selectable': True,
+                        'expandable': True,
+                        'non_expandable_properties': ()}
+
+
+def get_capabilities(container):
+    """Returns dictionary capability name: value of an entity set or singleton, from its
+    Org.OData.Capabilities.V1 annotations and DEFAULT_CAPABILITIES for the ones not annotated.
+    filter_functions is None if all functions are supported.
+    :param container: name of entity set or singleton in odata format, i.e. "users".
+    """
+    if container not in ODATA_CONTAINER_TYPE:
+        raise ValueError("Unknown entity set or singleton: " + container)
+    capabilities = dict(DEFAULT_CAPABILITIES)
+    capabilities.update(ODATA_CAPABILITIES.get(container, {}))
+    return capabilities
+
+
+# Dispatch dictionaries restricted to the types assignable to a declared type
+_assignable_dispatch = {}
+
+
+def is_assignable(odata_type, declared_type):
+    """Returns True if odata_type is declared_type or derives from it.
+    :param odata_type: odata type name, with or without leading #.
+    :param declared_type: odata type name.
+    """
+    return odata_type.lstrip('#') in ODATA_DERIVED_TYPES.get(declared_type, ())
+
+
+def get_dispatch(declared_type):
+    """Returns dictionary @odata.type value: class, with only the types assignable to declared_type.
+    :param declared_type: odata type name.
+    """
+    try:
+        return _assignable_dispatch[declared_type]
+    except KeyError:
+        pass
+    if declared_type not in ODATA_DERIVED_TYPES:
+        raise ValueError("Unknown odata type: " + declared_type)
+    dispatch = ClassTable({k: v for k, v in ODATA_TYPE_DISPATCH.types.items()
+                           if k.lstrip('#') in ODATA_DERIVED_TYPES[declared_type]})
+    # Threads building it at the same time all get the one published first
+    return _assignable_dispatch.setdefault(declared_type, dispatch)
+
+
+def decode_polymorphic(items, declared_type):
+    """Returns list of objects of the most specific class of each item.
+    :param items: list of dictionaries in odata format, i.e. the value of a response.
+    :param declared_type: odata type declared for the items, i.e. "microsoft.graph.directoryObject".
+                          Items without @odata.type are of this type.
+    :return: list of objects.
+    """
+    dispatch = get_dispatch(declared_type)
+    declared_class = ODATA_TYPE_TO_PYTHON[declared_type]
+    result = []
+
+    for item in items:
+        odata_type = item.get('@odata.type')
+        if odata_type is None:
+            result.append(declared_class(item))
+            continue
+        try:
+            result.append(dispatch[odata_type](item))
+        except KeyError:
+            raise ValueError("Type {} is not assignable to {}.".format(odata_type, declared_type))
+    return result
+
+
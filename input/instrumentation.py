@@ -0,0 +1,317 @@
+"""Opt-in instrumentation of the decoding hot path: object construction, set() and get_object_class().
+
+Nothing is patched until enable() is called, so the model runs unchanged when instrumentation is off.
+"""
+
+import sys
+from collections import Counter
+from json import dump
+from threading import Event, Thread
+from time import perf_counter
+from .odata_object_base import OdataObjectBase, _class_hooks
+from .session import Session
+from . import extension, batch, decoder
+
+
+DEFAULT_SAMPLE_EVERY = 64
+
+# Instrumentation currently enabled, if any
+_active = None
+
+
+def _subclasses(cls):
+    """Returns list with all classes derived from cls, including projection classes already created."""
+    result = []
+    for c in cls.__subclasses__():
+        result.append(c)
+        result.extend(_subclasses(c))
+    return result
+
+
+class Instrumentation(object):
+    """Counters of the decoding hot path.
+
+    By default only decoded responses are measured: the objects returned are counted by class and the
+    time of each response is shared among them, which costs a few operations per response.
+    With constructors=True the constructor of every generated class and decoder.decode_object() are wrapped,
+    so nested objects are counted too. Every construction is counted, but only one of every sample_every
+    constructions of each class is timed and the total time of the class is estimated from the timed ones.
+    Times include the construction of nested objects and base class initialization. This adds a function call to every
+    construction, so the overhead is noticeable for types with few properties.
+    Classes imported after enable() are wrapped when they are created, and modules of the package imported
+    after enable() get the wrapped functions, which disable() also restores in them.
+    """
+
+    def __init__(self, sample_every=DEFAULT_SAMPLE_EVERY, interval=None, path=None, callback=None,
+                 constructors=False):
+        """Initializes the counters. Use enable() to start collecting.
+        :param sample_every: construction of one of every sample_every objects of a class is timed.
+        :param interval: seconds between snapshots written to path or passed to callback. Optional.
+        :param path: path to a json file overwritten with each snapshot. Optional.
+        :param callback: function receiving each snapshot dictionary. Optional.
+        :param constructors: True to wrap the constructors of the generated classes.
+        """
+        if sample_every < 1:
+            raise ValueError("Parameter sample_every must be a positive integer.")
+        if interval is not None and path is None and callback is None:
+            raise ValueError("Parameter interval requires a path or a callback.")
+
+        self.sample_every = sample_every
+        self.interval = interval
+        self.path = path
+        self.callback = callback
+        self.constructors = constructors
+
+        # Class name: [constructions, timed constructions, seconds of the timed constructions]
+        self.classes = {}
+        self.set_calls = 0
+        self.get_object_class_calls = 0
+        self.responses = 0
+        self.response_objects = 0
+        self.max_response_objects = 0
+
+        self._patched = []
+        # Tuples (function, wrapper) of the functions patched
+        self._functions = []
+        self._started = None
+        self._stop = Event()
+        self._thread = None
+
+    ######################################################################
+
+    def _wrap_init(self, cls):
+        init = cls.__dict__['__init__']
+        counters = self.classes.setdefault(cls.__name__, [0, 0, 0.0])
+        sample_every = self.sample_every
+
+        def __init__(obj, odata_properties={}, **kwargs):
+            if type(obj) is not cls:
+                # Base class initialization of a derived object, counted in the derived class
+                return init(obj, odata_properties, **kwargs)
+            counters[0] += 1
+            if counters[0] % sample_every:
+                return init(obj, odata_properties, **kwargs)
+            start = perf_counter()
+            init(obj, odata_properties, **kwargs)
+            counters[1] += 1
+            counters[2] += perf_counter() - start
+
+        __init__.__doc__ = init.__doc__
+        return __init__
+
+    def _wrap_decode_object(self, function):
+        """Wraps decoder.decode_object, which creates objects without calling their constructors."""
+        sample_every = self.sample_every
+
+        def decode_object(item, cls):
+            counters = self.classes.setdefault(cls.__name__, [0, 0, 0.0])
+            counters[0] += 1
+            if counters[0] % sample_every:
+                return function(item, cls)
+            start = perf_counter()
+            obj = function(item, cls)
+            counters[1] += 1
+            counters[2] += perf_counter() - start
+            return obj
+
+        decode_object.__doc__ = function.__doc__
+        return decode_object
+
+    def _wrap_set(self, set_function):
+        def set(obj, **kwargs):
+            self.set_calls += 1
+            return set_function(obj, **kwargs)
+
+        set.__doc__ = set_function.__doc__
+        return set
+
+    def _wrap_get_object_class(self, function):
+        def get_object_class(odata_context, odata_type=None):
+            self.get_object_class_calls += 1
+            return function(odata_context, odata_type)
+
+        get_object_class.__doc__ = function.__doc__
+        return get_object_class
+
+    def _count_response(self, result, seconds):
+        """Counts the objects of a decoded response by class, sharing the time of the response among them."""
+        items = result if isinstance(result, list) else [result]
+        counts = Counter(map(type, items))
+        for cls, count in counts.items():
+            if isinstance(cls, type) and issubclass(cls, OdataObjectBase):
+                counters = self.classes.setdefault(cls.__name__, [0, 0, 0.0])
+                counters[0] += count
+                counters[1] += count
+                counters[2] += seconds * count / len(items)
+        return len(items)
+
+    def _wrap_decode(self, function):
+        """Wraps a function decoding a whole response: batch.decode_result or Session.decode_page."""
+        def decode(*args, **kwargs):
+            before = self.constructions()
+            start = perf_counter()
+            result = function(*args, **kwargs)
+            if self.constructors:
+                objects = self.constructions() - before
+            else:
+                objects = self._count_response(result, perf_counter() - start)
+            self.responses += 1
+            self.response_objects += objects
+            self.max_response_objects = max(self.max_response_objects, objects)
+            return result
+
+        decode.__name__ = function.__name__
+        decode.__doc__ = function.__doc__
+        return decode
+
+    def _patch_attribute(self, owner, name, value):
+        self._patched.append((owner, name, owner.__dict__[name]))
+        setattr(owner, name, value)
+
+    @staticmethod
+    def _package_modules():
+        """Returns list of the modules of the package imported."""
+        return [module for module_name, module in list(sys.modules.items()) if module is not None and
+                (module_name == __package__ or module_name.startswith(__package__ + "."))]
+
+    def _patch_function(self, function, wrapper):
+        """Replaces function in every module of the package that has a reference to it. Modules imported
+        later get the wrapper from the module defining the function.
+        """
+        self._functions.append((function, wrapper))
+        for module in self._package_modules():
+            for name, value in list(module.__dict__.items()):
+                if value is function:
+                    self._patch_attribute(module, name, wrapper)
+
+    def _class_created(self, cls):
+        """Wraps the constructor of a class created while instrumentation is enabled."""
+        if '__init__' in cls.__dict__:
+            self._patch_attribute(cls, '__init__', self._wrap_init(cls))
+
+    def enable(self):
+        """Patches the model to start collecting."""
+        if self._patched:
+            return
+
+        if self.constructors:
+            for cls in _subclasses(OdataObjectBase):
+                self._class_created(cls)
+            _class_hooks.append(self._class_created)
+            self._patch_function(decoder.decode_object, self._wrap_decode_object(decoder.decode_object))
+        self._patch_attribute(OdataObjectBase, 'set', self._wrap_set(OdataObjectBase.__dict__['set']))
+        self._patch_attribute(Session, 'decode_page', self._wrap_decode(Session.__dict__['decode_page']))
+        self._patch_function(extension.get_object_class,
+                             self._wrap_get_object_class(extension.get_object_class))
+        self._patch_function(batch.decode_result, self._wrap_decode(batch.decode_result))
+
+        self._started = perf_counter()
+        if self.interval:
+            self._stop.clear()
+            self._thread = Thread(target=self._run, name="odata-instrumentation", daemon=True)
+            self._thread.start()
+
+    def disable(self):
+        """Restores the original functions. Counters keep their values."""
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+        if self._class_created in _class_hooks:
+            _class_hooks.remove(self._class_created)
+
+        # Restore in reverse order in case an attribute was patched twice
+        for owner, name, value in reversed(self._patched):
+            setattr(owner, name, value)
+        self._patched = []
+
+        # Modules imported while enabled have references to the wrappers
+        wrapped = {id(wrapper): function for function, wrapper in self._functions}
+        for module in self._package_modules():
+            for name, value in list(module.__dict__.items()):
+                if id(value) in wrapped:
+                    setattr(module, name, wrapped[id(value)])
+        self._functions = []
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.export()
+
+    ######################################################################
+
+    def constructions(self):
+        """Returns number of objects constructed."""
+        return sum(counters[0] for counters in self.classes.values())
+
+    def snapshot(self):
+        """Returns dictionary with the counters, classes sorted by estimated construction time.
+        Estimated seconds of a class are the mean of its timed constructions multiplied by its count.
+        """
+        classes = {}
+        for name, (count, timed, seconds) in self.classes.items():
+            if count:
+                mean = seconds / timed if timed else None
+                classes[name] = {'count': count,
+                                 'timed': timed,
+                                 'mean_seconds': mean,
+                                 'estimated_seconds': mean * count if timed else None}
+
+        return {'elapsed_seconds': perf_counter() - self._started if self._started is not None else 0.0,
+                'constructions': self.constructions(),
+                'set_calls': self.set_calls,
+                'get_object_class_calls': self.get_object_class_calls,
+                'responses': self.responses,
+                'objects_per_response': self.response_objects / self.responses if self.responses else None,
+                'max_objects_per_response': self.max_response_objects,
+                'classes': dict(sorted(classes.items(),
+                                       key=lambda item: -(item[1]['estimated_seconds'] or 0.0)))}
+
+    def export(self):
+        """Writes a snapshot to the json file and passes it to the callback, the ones specified."""
+        snapshot = self.snapshot()
+        if self.path:
+            with open(self.path, 'w') as f:
+                dump(snapshot, f, indent=4)
+        if self.callback:
+            self.callback(snapshot)
+        return snapshot
+
+    def reset(self):
+        """Sets all counters to zero."""
+        for counters in self.classes.values():
+            counters[:] = [0, 0, 0.0]
+        self.set_calls = 0
+        self.get_object_class_calls = 0
+        self.responses = 0
+        self.response_objects = 0
+        self.max_response_objects = 0
+        self._started = perf_counter()
+
+
+def enable(sample_every=DEFAULT_SAMPLE_EVERY, interval=None, path=None, callback=None, constructors=False):
+    """Starts instrumentation of the model, see Instrumentation for the parameters.
+    :return: Instrumentation object.
+    """
+    global _active
+    if _active is not None:
+        raise ValueError("Instrumentation is already enabled.")
+    _active = Instrumentation(sample_every, interval, path, callback, constructors)
+    _active.enable()
+    return _active
+
+
+def disable():
+    """Stops instrumentation and returns the last snapshot, or None if it wasn't enabled."""
+    global _active
+    if _active is None:
+        return None
+    _active.disable()
+    snapshot = _active.snapshot()
+    _active = None
+    return snapshot
+
+
+def snapshot():
+    """Returns snapshot of the enabled instrumentation, or None if it's not enabled."""
+    return _active.snapshot() if _active is not None else None
@@ -1,13 +1,71 @@
 """Base object class and other classes."""
+import sys
+from importlib import import_module
+from itertools import chain, repeat
 from re import fullmatch, search
 from datetime import datetime, date, time
+from threading import RLock
+from .request import OdataRequest, odata_literal
+
+
+# Generated classes already resolved by name
+_resolved_classes = {}
+
+# Lock of the lazy initialization shared by threads: imports, classes resolved, projections and decoders.
+# Lookups don't take it, they only read tables that are complete when published.
+_lock = RLock()
+
+# Functions called with each class derived from OdataObjectBase when it's created, i.e. by instrumentation
+_class_hooks = []
+
+# Extension module, imported when first needed because it imports the generated classes
+_extension_module = None
+
+
+def _extension():
+    """Returns the extension module of the package, importing it the first time."""
+    global _extension_module
+    if _extension_module is None:
+        with _lock:
+            if _extension_module is None:
+                _extension_module = import_module(".extension", __package__)
+    return _extension_module
+
+
+def resolve_class(name):
+    """Returns generated class by its name, importing its module the first time it's used.
+    Generated modules only import their base class and resolve the types of their properties with
+    this function, so importing a class doesn't import the whole model.
+    :param name: python class name, i.e. "GraphUser".
+    """
+    try:
+        return _resolved_classes[name]
+    except KeyError:
+        pass
+
+    with _lock:
+        if name in _resolved_classes:
+            return _resolved_classes[name]
+        try:
+            module_name = sys.modules[__package__].CLASS_MODULES[name]
+        except KeyError:
+            raise ValueError("Unknown class: " + name)
+        cls = getattr(import_module("." + module_name, __package__), name)
+        _resolved_classes[name] = cls
+        return cls
 
 
 class OdataObjectBase(object):
     odata = ""
+    key_property = None
     valid_odata_properties = {}
     valid_properties = {}
 
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        for hook in _class_hooks:
+            hook(cls)
+
     @classmethod
     def get_property_odata_name(cls, name):
         if name in cls.valid_properties:
@@ -18,6 +76,50 @@ class OdataObjectBase(object):
             except AttributeError:
                 raise ValueError("Property '{}' not valid.".format(name))
 
+    @classmethod
+    def get_property_python_name(cls, odata_name):
+        if odata_name in cls.valid_odata_properties:
+            return cls.valid_odata_properties[odata_name]
+        else:
+            try:
+                return cls.__bases__[0].get_property_python_name(odata_name)
+            except AttributeError:
+                raise ValueError("Property '{}' not valid.".format(odata_name))
+
+    @classmethod
+    def get_key_class(cls):
+        """Returns the class in the hierarchy that declares the key property, or None if there is no key."""
+        for c in cls.__mro__:
+            if c.__dict__.get('key_property'):
+                return c
+        return None
+
+    @classmethod
+    def flattened_properties(cls):
+        """Returns tuple with python names of all properties of the class, base class properties first."""
+        # Built without the lock: threads doing it at the same time publish equal tuples
+        if '_flattened_properties' not in cls.__dict__:
+            names = []
+            for c in reversed(cls.__mro__):
+                names.extend(c.__dict__.get('valid_properties', {}))
+            cls._flattened_properties = tuple(names)
+        return cls._flattened_properties
+
+    @classmethod
+    def navigation_properties(cls):
+        """Returns dictionary python name: (odata name, odata type) with the navigation properties of the class
+        and its bases. Objects only have them as attributes when returned by a QueryPlan that expands them.
+        """
+        # Built without the lock like flattened_properties(), the dictionary is complete when published
+        if '_navigation_properties' not in cls.__dict__:
+            navigation = {}
+            for c in reversed(cls.__mro__):
+                declared = _extension().ODATA_NAVIGATION_PROPERTY.get(c.__dict__.get('odata'), {})
+                for odata_name, (name, odata_type) in declared.items():
+                    navigation[name] = (odata_name, odata_type)
+            cls._navigation_properties = navigation
+        return cls._navigation_properties
+
     @classmethod
     def property_is_collection(cls, name):
         if name in cls.valid_properties:
@@ -98,12 +200,218 @@ class OdataObjectBase(object):
             args = inherited_args
             c = c.__bases__[0]
 
+    def get_key(self):
+        """Returns the value of the key property of the object, or None if the type has no key."""
+        if not self.key_property:
+            return None
+        return getattr(self, self.get_property_python_name(self.key_property), None)
+
+    def update(self, odata_properties):
+        """Merge properties received in odata format into the object. Properties not present
+        in odata_properties keep their current value.
+        :param odata_properties: dictionary of properties in their original odata name with their values.
+        """
+        odata_type_to_python = _extension().ODATA_TYPE_TO_PYTHON
+
+        for key, value in odata_properties.items():
+            c = self.__class__
+
+            # Find the class declaring the property
+            while c != OdataObjectBase and key not in c.valid_odata_properties:
+                c = c.__bases__[0]
+            if c == OdataObjectBase:
+                continue
+
+            name = c.valid_odata_properties[key]
+            if value is None:
+                setattr(self, name, None)
+                continue
+
+            odata_type = c.valid_properties[name]['odata_type']
+            if odata_type.startswith("Collection("):
+                pt = odata_type_to_python[odata_type[11:-1]]
+                setattr(self, name, [pt(v) for v in value])
+            else:
+                setattr(self, name, odata_type_to_python[odata_type](value))
+
+    def get_entity_url(self):
+        """Returns url of the entity relative to the service root, i.e. "users('id')"."""
+        entity_sets = _extension().ODATA_ENTITY_SET
+
+        key = self.get_key()
+        if key is None:
+            raise ValueError("Entity of type {} has no key value.".format(type(self).__name__))
+
+        for c in type(self).__mro__:
+            if getattr(c, 'odata', None) in entity_sets:
+                return entity_sets[c.odata] + "(" + odata_literal(key) + ")"
+        raise ValueError("No entity set found for type {}.".format(type(self).__name__))
+
+    def action_request(self, odata_name, parameters, returns=None):
+        """Returns request to call a bound action on the entity.
+        :param odata_name: name of the action in odata format.
+        :param parameters: dictionary of parameters in odata format with their values. None values are skipped.
+        :param returns: odata type returned by the action. Optional.
+        :return: OdataRequest object.
+        """
+        body = {}
+        for k, v in parameters.items():
+            if isinstance(v, OdataObjectBase):
+                body[k] = v.serialized()
+            elif isinstance(v, list):
+                body[k] = [i.serialized() if isinstance(i, OdataObjectBase) else i for i in v]
+            elif v is not None:
+                body[k] = v
+        return OdataRequest("POST", self.get_entity_url() + "/" + odata_name, body=body, returns=returns)
+
+    def function_request(self, odata_name, parameters, returns=None):
+        """Returns request to call a bound function on the entity.
+        :param odata_name: name of the function in odata format.
+        :param parameters: dictionary of parameters in odata format with their values. None values are skipped.
+        :param returns: odata type returned by the function. Optional.
+        :return: OdataRequest object.
+        """
+        args = ",".join(k + "=" + odata_literal(v) for k, v in parameters.items() if v is not None)
+        return OdataRequest("GET", self.get_entity_url() + "/" + odata_name + "(" + args + ")", returns=returns)
+
+    def __reduce__(self):
+        """Returns compact pickled form of the object: its class and the state from __getstate__().
+        Projection classes are pickled as their full class, which can be imported by name.
+        """
+        cls = type(self)
+        while '_decode_plan' in cls.__dict__:
+            cls = cls.__bases__[0]
+        return _new_object, (cls,), self.__getstate__()
+
+    def __getstate__(self):
+        """Returns state of the object: tuple with the values of the properties in the order of
+        flattened_properties(), without property names and without the None values at the end.
+        If the object has attributes that are not properties, the state is a list [values, attributes].
+        """
+        names = self.flattened_properties()
+        attributes = self.__dict__
+        values = list(map(attributes.get, names))
+        while values and values[-1] is None:
+            values.pop()
+
+        # Objects created by the generated classes have exactly one attribute per property
+        if len(attributes) != len(names):
+            names = set(names)
+            extra = {k: v for k, v in attributes.items() if k not in names}
+            if extra:
+                return [tuple(values), extra]
+        return tuple(values)
+
+    def __setstate__(self, state):
+        """Restores the object from the state returned by __getstate__()."""
+        if isinstance(state, list):
+            values, extra = state
+        else:
+            values, extra = state, None
+        self.__dict__.update(zip(self.flattened_properties(), chain(values, repeat(None))))
+        if extra:
+            self.__dict__.update(extra)
+
+    def to_record(self):
+        """Returns compact picklable form of the object: tuple (odata type, tuple of values)
+        with values in the order of flattened_properties(). Objects in values are records too.
+        """
+        values = []
+        for name in self.flattened_properties():
+            value = getattr(self, name, None)
+            if isinstance(value, OdataObjectBase):
+                value = value.to_record()
+            elif isinstance(value, list):
+                value = [v.to_record() if isinstance(v, OdataObjectBase) else v for v in value]
+            values.append(value)
+        return self.odata, tuple(values)
+
+    @staticmethod
+    def from_record(record):
+        """Returns the object represented by a record created with to_record().
+        :param record: tuple (odata type, tuple of values).
+        """
+        odata_type_to_python = _extension().ODATA_TYPE_TO_PYTHON
+
+        def decode(record):
+            odata_type, values = record
+            cls = odata_type_to_python[odata_type]
+            obj = cls.__new__(cls)
+            attributes = obj.__dict__
+            for name, value in zip(cls.flattened_properties(), values):
+                # Only records of objects are tuples, property values are never tuples
+                if value.__class__ is tuple:
+                    value = decode(value)
+                elif value.__class__ is list:
+                    value = [decode(v) if v.__class__ is tuple else v for v in value]
+                attributes[name] = value
+            return obj
+
+        return decode(record)
+
+    @classmethod
+    def projection(cls, fields):
+        """Returns class derived from cls that decodes and stores only some properties, i.e. those in the
+        $select of a query. Other properties read as None without using memory in the objects.
+        The class is created once for each set of fields.
+        :param fields: iterable with property names in odata format. The key property is always included.
+        :return: class derived from cls.
+        """
+        # Projections of a projection use the full class
+        while '_decode_plan' in cls.__dict__:
+            cls = cls.__bases__[0]
+
+        fields = frozenset(fields)
+        projections = cls.__dict__.get('_projections')
+        if projections is not None and fields in projections:
+            return projections[fields]
+
+        # Created once even if several threads ask for it at the same time
+        with _lock:
+            if '_projections' not in cls.__dict__:
+                cls._projections = {}
+            if fields in cls._projections:
+                return cls._projections[fields]
+
+            selected = set(fields)
+            if cls.key_property:
+                selected.add(cls.key_property)
+
+            decode_plan = []
+            for odata_name in sorted(selected):
+                name = cls.get_property_python_name(odata_name)
+
+                # Get odata type from the class declaring the property
+                odata_type = next(c.__dict__['valid_properties'][name]['odata_type'] for c in cls.__mro__
+                                  if name in c.__dict__.get('valid_properties', {}))
+                is_list = odata_type.startswith("Collection(")
+                converter = _extension().ODATA_TYPE_TO_PYTHON[odata_type[11:-1] if is_list else odata_type]
+                decode_plan.append((odata_name, name, converter, is_list))
+
+            # Properties not selected are class attributes, so they read as None
+            attributes = dict.fromkeys(cls.flattened_properties())
+            attributes.update({'__module__': cls.__module__,
+                               '__init__': _projection_init,
+                               '_decode_plan': tuple(decode_plan),
+                               'selected_properties': frozenset(selected)})
+
+            projection = type(cls.__name__ + "Projection", (cls,), attributes)
+            cls._projections[fields] = projection
+            return projection
+
     def serialized(self):
         """Returns the serialized form of the object as a dict."""
         odata_dict = {}
 
         for prop in self.__dict__:
-            oname = self.get_property_odata_name(prop)
+            try:
+                oname = self.get_property_odata_name(prop)
+            except ValueError:
+                # Expanded navigation properties are not part of the entity, they are only looked up here
+                # so serializing doesn't need the extension tables
+                if prop in self.navigation_properties():
+                    continue
+                raise
 
             if isinstance(self.__dict__[prop], OdataObjectBase):
                 # if the property is an object, get its serialized form
@@ -116,6 +424,27 @@ class OdataObjectBase(object):
         return odata_dict
 
 
+def _new_object(cls):
+    """Returns new uninitialized object of the class, used to unpickle objects."""
+    return cls.__new__(cls)
+
+
+def _projection_init(self, odata_properties={}, **kwargs):
+    """Initialization of projection classes, see OdataObjectBase.projection().
+    :param odata_properties: dictionary of properties in their original odata name with their values.
+    """
+    try:
+        for odata_name, name, converter, is_list in self._decode_plan:
+            value = odata_properties.get(odata_name)
+            if value is not None:
+                setattr(self, name, [converter(v) for v in value] if is_list else converter(value))
+    except AttributeError:
+        raise ValueError("Positional parameter 'odata_properties' must be a dictionary.")
+
+    if kwargs:
+        self.set(**kwargs)
+
+
 class Guid(str):
     """Object represents a GUID which is a string."""
     def __new__(cls, *value):
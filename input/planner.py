@@ -0,0 +1,479 @@
+"""Planning of $select and $expand queries for property paths of an entity set or singleton, and reassembly
+of the responses into objects of the generated classes with their navigation properties set."""
+
+from urllib.parse import urlencode, quote
+from .odata_object_base import OdataObjectBase
+from .request import OdataRequest, odata_literal
+from .transport import decode_json
+from .batch import BatchComposer
+from .decoder import decode_object
+from .query import QueryPushdown, get_property_odata_type
+from .extension import ODATA_CONTAINER_TYPE, ODATA_TYPE_TO_PYTHON, ODATA_DERIVED_TYPES, ODATA_ENTITY_SET, \
+    ODATA_NAVIGATION_PROPERTY, get_object_class
+
+
+DEFAULT_MAX_DEPTH = 1
+NEXT_LINK = "@odata.nextLink"
+
+
+def get_navigation_property(cls, odata_name):
+    """Returns tuple (python name, odata type) of the navigation property of the class or its bases,
+    or None if it's not a navigation property.
+    :param cls: generated class.
+    :param odata_name: navigation property name in odata format.
+    """
+    for c in cls.__mro__:
+        navigation = ODATA_NAVIGATION_PROPERTY.get(getattr(c, 'odata', None), {})
+        if odata_name in navigation:
+            return navigation[odata_name]
+    return None
+
+
+def has_entity_set(cls):
+    """Returns True if entities of the class can be requested by their url."""
+    return any(getattr(c, 'odata', None) in ODATA_ENTITY_SET for c in cls.__mro__)
+
+
+class PlanNode(object):
+    """Node of a query plan: properties selected on an entity type and navigation properties expanded from it."""
+
+    def __init__(self, odata_type, odata_name=None, python_name=None, is_collection=False, cast=None):
+        """Initializes the node.
+        :param odata_type: odata type of the entities, without Collection().
+        :param odata_name: name of the navigation property of the parent in odata format. None for the root.
+        :param python_name: name of the navigation property of the parent in python format.
+        :param is_collection: True if the navigation property is a collection.
+        :param cast: derived type of the parent declaring the navigation property, if any.
+        """
+        self.odata_type = odata_type
+        self.cls = ODATA_TYPE_TO_PYTHON[odata_type]
+        self.odata_name = odata_name
+        self.python_name = python_name
+        self.is_collection = is_collection
+        self.cast = cast
+        self.all_properties = False
+
+        # $select item: (type cast or None, property name in odata format)
+        self.select = {}
+
+        # $expand item: PlanNode
+        self.expand = {}
+
+        # Class: property names decoded for objects of the class
+        self._fields = {}
+
+    def __repr__(self):
+        return '<ODATA PLAN NODE: ' + (self.odata_name or self.odata_type) + '>'
+
+    def fields(self, cls):
+        """Returns frozenset with the selected property names of an object of class cls, None if all properties
+        are selected. Properties selected with a type cast are only included if cls derives from it.
+        """
+        if self.all_properties:
+            return None
+        if cls not in self._fields:
+            odata_types = set(getattr(c, 'odata', None) for c in cls.__mro__)
+            self._fields[cls] = frozenset(name for cast, name in self.select.values()
+                                          if cast is None or cast in odata_types)
+        return self._fields[cls]
+
+
+class PlanRequest(object):
+    """GET request of a plan: node of the plan at the root of the request, navigation properties expanded
+    inline and what to do with the objects received.
+
+    Modes: 'root' objects are the result of the plan, 'merge' objects have expanded navigation properties
+    copied to the targets with the same key, 'append' objects are added to the navigation property attribute
+    of the targets (next pages of expanded collections).
+    """
+
+    def __init__(self, url, node, names, depth, mode, targets=None):
+        self.url = url
+        self.node = node
+        self.names = names
+        self.depth = depth
+        self.mode = mode
+        self.targets = targets
+
+        # Filled by QueryPlan._build()
+        self.inline = {}
+        self.deferred = []
+
+        # Objects received, once the request is sent
+        self.objects = None
+
+    def __repr__(self):
+        return '<ODATA PLAN REQUEST: ' + self.mode + ' ' + self.url + '>'
+
+
+class QueryPlan(object):
+    """Set of requests getting the properties requested as paths from an entity set or singleton.
+
+    Paths are property names in odata format separated by '/', i.e. "displayName", "manager/displayName",
+    "memberOf/microsoft.graph.group/mail" or "passwordProfile/password". A path ending in a navigation property
+    gets all the properties of the related entities. Paths are validated against the model.
+
+    The plan gets the properties with a single request using $select and $expand where possible.
+    Navigation properties nested deeper than max_depth, or beyond the max_expands of a $expand clause, are
+    requested afterwards for the entities received, several requests at once in $batch requests.
+    Objects returned have the navigation properties expanded as attributes in python format, i.e. member_of.
+    """
+
+    def __init__(self, container, paths, key=None, filter=None, orderby=None, top=None,
+                 max_depth=DEFAULT_MAX_DEPTH, max_expands=None):
+        """Initializes the plan.
+        :param container: name of entity set or singleton in odata format, i.e. "users".
+        :param paths: iterable with property paths in odata format.
+        :param key: key of an entity of the entity set. Optional.
+        :param filter: odata $filter expression of the entity set. Optional.
+        :param orderby: odata $orderby expression of the entity set. Optional.
+        :param top: maximum number of entities of the result. Optional.
+                    $filter, $orderby and $top are sent as far as the capabilities of the entity set allow,
+                    the rest is evaluated on the entities received, see QueryPushdown.
+        :param max_depth: maximum nesting of $expand in a request, 1 means no nested $expand.
+        :param max_expands: maximum number of navigation properties in a $expand clause. Optional.
+        """
+        if container not in ODATA_CONTAINER_TYPE:
+            raise ValueError("Unknown entity set or singleton: " + container)
+        if max_depth < 1:
+            raise ValueError("Parameter max_depth must be a positive integer.")
+        if max_expands is not None and max_expands < 1:
+            raise ValueError("Parameter max_expands must be a positive integer.")
+
+        self.container = container
+        self.key = key
+        self.max_depth = max_depth
+        self.max_expands = max_expands
+        self.root = PlanNode(ODATA_CONTAINER_TYPE[container])
+
+        self.pushdown = None
+        self.options = {}
+        if filter or orderby or top is not None:
+            self.pushdown = QueryPushdown(container, filter, orderby, top)
+            self.options = self.pushdown.options
+
+        for path in paths:
+            self.add_path(path)
+        if not self.root.select and not self.root.expand:
+            self.root.all_properties = True
+        elif self.pushdown is not None:
+            # Properties read by the local filter and order
+            for path in self.pushdown.local_paths:
+                self.add_path(path.split('/')[0])
+
+        # Statistics of the last execution
+        self.round_trips = 0
+        self.requests_sent = 0
+
+    def __repr__(self):
+        return '<ODATA PLAN: ' + self.url() + '>'
+
+    ######################################################################
+
+    def add_path(self, path):
+        """Adds a property path to the plan after validating it.
+        :param path: property path in odata format, i.e. "manager/displayName".
+        """
+        node = self.root
+        cls = node.cls
+        cast = None
+        segments = path.split('/')
+
+        for i, segment in enumerate(segments):
+            if '.' in segment:
+                # Type cast to a derived type
+                if cast is not None or segment not in ODATA_DERIVED_TYPES.get(cls.odata, ()):
+                    raise ValueError("Type {} not valid in path: {}".format(segment, path))
+                cast = segment
+                cls = ODATA_TYPE_TO_PYTHON[segment]
+                continue
+
+            navigation = get_navigation_property(cls, segment)
+            if navigation is not None:
+                python_name, odata_type = navigation
+                is_collection = odata_type.startswith("Collection(")
+                item = (cast + "/" if cast else "") + segment
+                if item not in node.expand:
+                    node.expand[item] = PlanNode(odata_type[11:-1] if is_collection else odata_type,
+                                                 segment, python_name, is_collection, cast)
+                node = node.expand[item]
+                cls = node.cls
+                cast = None
+                continue
+
+            # Structural property, the rest of the path must be properties of complex types
+            odata_type = get_property_odata_type(cls, segment)
+            for sub_segment in segments[i + 1:]:
+                complex_class = ODATA_TYPE_TO_PYTHON.get(odata_type)
+                if not isinstance(complex_class, type) or not issubclass(complex_class, OdataObjectBase):
+                    raise ValueError("Property '{}' not valid in path: {}".format(sub_segment, path))
+                odata_type = get_property_odata_type(complex_class, sub_segment)
+
+            # Complex properties are selected as a whole
+            node.select[(cast + "/" if cast else "") + segment] = (cast, segment)
+            return
+
+        # Path ends in an entity: all its properties
+        node.all_properties = True
+
+    ######################################################################
+
+    def _options(self, node, names, depth, request, path, select=True):
+        """Returns dictionary with the $select and $expand options of the node in a request, registering in
+        the request the navigation properties expanded inline and the ones deferred to later requests.
+        :param node: PlanNode.
+        :param names: $expand items of the node to get in the request.
+        :param depth: nesting of the node in the request, 0 for the root of the request.
+        :param request: PlanRequest.
+        :param path: tuple of nodes from the root of the request to the node.
+        :param select: False to select only the key of the entities.
+        """
+        options = {}
+        key_class = node.cls.get_key_class()
+        if not select:
+            if key_class is not None:
+                options['$select'] = key_class.key_property
+        elif not node.all_properties:
+            items = list(node.select)
+            if key_class is not None and key_class.key_property not in items:
+                items.insert(0, key_class.key_property)
+            options['$select'] = ",".join(items)
+
+        names = list(names)
+        inline = names[:self.max_expands] if depth < self.max_depth else []
+        step = self.max_expands or len(names) or 1
+        for start in range(len(inline), len(names), step):
+            request.deferred.append((path, node, names[start:start + step]))
+        request.inline[node] = (inline, depth)
+
+        expand = []
+        for name in inline:
+            child = node.expand[name]
+            child_options = self._options(child, list(child.expand), depth + 1, request, path + (child,))
+            if child_options:
+                expand.append(name + "(" + ";".join(k + "=" + v for k, v in child_options.items()) + ")")
+            else:
+                expand.append(name)
+        if expand:
+            options['$expand'] = ",".join(expand)
+        return options
+
+    def _build(self, url, node, names, depth, mode, targets=None, select=True, options=None):
+        """Returns PlanRequest for the node. The url gets the query options unless options is None."""
+        request = PlanRequest(url, node, names, depth, mode, targets)
+        node_options = self._options(node, names, depth, request, (), select)
+        if options is not None:
+            options = dict(options)
+            options.update(node_options)
+            if options:
+                request.url += "?" + urlencode(options, safe="$,'()=;/", quote_via=quote)
+        return request
+
+    def _check(self, node, depth):
+        """Raises ValueError if navigation properties of the node would need requests that can't be made."""
+        chunked = self.max_expands is not None and len(node.expand) > self.max_expands
+        if node.expand and (depth >= self.max_depth or chunked) and depth and not has_entity_set(node.cls):
+            raise ValueError("Entities of type {} have no entity set, navigation properties {} can't be "
+                             "requested with the limits of the plan.".format(node.odata_type, list(node.expand)))
+        for child in node.expand.values():
+            self._check(child, depth + 1 if depth < self.max_depth else 1)
+
+    def container_url(self):
+        """Returns url of the entity set, singleton or entity of the plan without query options."""
+        url = self.container
+        if self.key is not None:
+            url += "(" + quote(odata_literal(self.key), safe="'") + ")"
+        return url
+
+    def requests(self):
+        """Returns list of PlanRequest objects sent first: a request for the entity set, singleton or entity,
+        and a request for each additional chunk of max_expands navigation properties.
+        """
+        self._check(self.root, 0)
+        names = list(self.root.expand)
+        step = self.max_expands or len(names) or 1
+        chunks = [names[start:start + step] for start in range(0, len(names), step)] or [[]]
+
+        options = dict(self.options)
+        requests = [self._build(self.container_url(), self.root, chunks[0], 0, 'root', options=options)]
+
+        # Root deferred chunks are requested from the same url, selecting only the key
+        requests[0].deferred = [d for d in requests[0].deferred if d[0]]
+        for chunk in chunks[1:]:
+            requests.append(self._build(self.container_url(), self.root, chunk, 0, 'merge',
+                                        select=False, options=options))
+        return requests
+
+    def url(self):
+        """Returns url of the first request of the plan, relative to the service root."""
+        return self.requests()[0].url
+
+    ######################################################################
+
+    def _send(self, transport, requests, batch_url):
+        """Sends the requests, in $batch if there are more than one, and returns list of decoded bodies."""
+        self.round_trips += 1
+        self.requests_sent += len(requests)
+
+        relative = [r.url[len(transport.service_url):] if r.url.startswith(transport.service_url) else r.url
+                    for r in requests]
+        if len(requests) == 1 or any("://" in url for url in relative):
+            bodies = []
+            for url in relative:
+                status, headers, data = transport.request("GET", url, headers={'Accept': 'application/json'})
+                body = decode_json(data)
+                if status != 200:
+                    raise ValueError("Request {} failed with status {}: {}".format(url, status, body))
+                bodies.append(body)
+            self.round_trips += len(requests) - 1
+            return bodies
+
+        composer = BatchComposer()
+        ids = [composer.add(OdataRequest("GET", url)) for url in relative]
+        results = composer.send(transport, batch_url)
+        bodies = []
+        for request_id, url in zip(ids, relative):
+            result = results.get(request_id)
+            if result is None or not result.ok:
+                raise ValueError("Request {} failed: {}".format(url, result.error if result else "no response"))
+            bodies.append(result.body)
+        self.round_trips += len(composer.batches()) - 1
+        return bodies
+
+    def _assemble(self, item, node, request, follow_ups):
+        """Returns object of the item with its navigation properties expanded inline set as attributes."""
+        cls = node.cls
+        if '@odata.type' in item:
+            cls = get_object_class(None, item['@odata.type'])
+        fields = node.fields(cls)
+        obj = decode_object(item, cls if fields is None else cls.projection(fields))
+
+        names, depth = request.inline.get(node, ((), 0))
+        odata_types = None
+        for name in names:
+            child = node.expand[name]
+            if child.cast is not None:
+                if odata_types is None:
+                    odata_types = set(getattr(c, 'odata', None) for c in cls.__mro__)
+                if child.cast not in odata_types:
+                    continue
+
+            value = item.get(child.odata_name)
+            if child.is_collection:
+                value = [self._assemble(v, child, request, follow_ups) for v in value or ()]
+                if item.get(child.odata_name + NEXT_LINK):
+                    # Next pages of the expanded collection keep the options of the expansion
+                    follow_up = PlanRequest(item[child.odata_name + NEXT_LINK], child, list(child.expand),
+                                            depth + 1, 'append', [obj])
+                    self._options(child, follow_up.names, follow_up.depth, follow_up, ())
+                    follow_ups.append(follow_up)
+            elif value is not None:
+                value = self._assemble(value, child, request, follow_ups)
+            setattr(obj, child.python_name, value)
+        return obj
+
+    @staticmethod
+    def _merge(request, objects, targets, index):
+        """Copies the navigation properties expanded by a request from the objects received to the targets.
+        :param targets: objects receiving the properties, or None for the objects of the result with the same key.
+        :param index: dictionary key: objects of the result.
+        """
+        names = [request.node.expand[name].python_name for name in request.inline[request.node][0]]
+        for obj in objects:
+            for target in targets if targets is not None else index.get(obj.get_key(), ()):
+                for name in names:
+                    if name in obj.__dict__:
+                        setattr(target, name, getattr(obj, name))
+
+    @staticmethod
+    def _walk(objects, path):
+        """Returns list of the objects reached following the navigation properties of the nodes in path."""
+        for node in path:
+            reached = []
+            for obj in objects:
+                value = getattr(obj, node.python_name, None)
+                if isinstance(value, list):
+                    reached.extend(value)
+                elif value is not None:
+                    reached.append(value)
+            objects = reached
+        return objects
+
+    def execute(self, transport, batch_url="$batch"):
+        """Sends the requests of the plan and returns the objects with the navigation properties set.
+        :param transport: HttpTransport object of the service.
+        :param batch_url: url of the $batch endpoint relative to the service root.
+        :return: list of objects for entity sets, or a single object for singletons and entities with key.
+        """
+        self.round_trips = 0
+        self.requests_sent = 0
+
+        result = []
+        single = False
+
+        # Key: objects of the result, (url, node, $expand items): request of the entity
+        index = {}
+        requested = {}
+        pending = self.requests()
+        root_chunks, pending = pending[1:], pending[:1]
+
+        while pending:
+            bodies = self._send(transport, pending, batch_url)
+            follow_ups = []
+
+            for request, body in zip(pending, bodies):
+                if isinstance(body, dict) and isinstance(body.get('value'), list):
+                    items = body['value']
+                else:
+                    items = [body]
+                    single = single or request.mode == 'root'
+                objects = [self._assemble(item, request.node, request, follow_ups) for item in items]
+
+                if isinstance(body, dict) and body.get(NEXT_LINK):
+                    next_page = PlanRequest(body[NEXT_LINK], request.node, request.names, request.depth,
+                                            request.mode, request.targets)
+                    next_page.inline, next_page.deferred = request.inline, request.deferred
+                    follow_ups.append(next_page)
+
+                if request.mode == 'root':
+                    result.extend(objects)
+                    for obj in objects:
+                        index.setdefault(obj.get_key(), []).append(obj)
+                    if not body.get(NEXT_LINK) and root_chunks:
+                        # The whole result is known, get the other navigation properties of the root
+                        follow_ups.extend(root_chunks)
+                        root_chunks = []
+
+                elif request.mode == 'merge':
+                    request.objects = objects
+                    self._merge(request, objects, request.targets, index)
+
+                else:
+                    for target in request.targets:
+                        getattr(target, request.node.python_name).extend(objects)
+
+                # Navigation properties not expanded inline, requested from the url of each entity
+                for path, node, names in request.deferred:
+                    entities = {}
+                    for entity in self._walk(objects, path):
+                        entities.setdefault(entity.get_entity_url(), []).append(entity)
+                    for url, targets in entities.items():
+                        identity = (url, node, tuple(names))
+                        if identity in requested:
+                            # Entity already reached from other objects, they share the request
+                            previous = requested[identity]
+                            previous.targets.extend(targets)
+                            if previous.objects is not None:
+                                self._merge(previous, previous.objects, targets, index)
+                            continue
+                        requested[identity] = self._build(url, node, names, 0, 'merge', targets, select=False,
+                                                          options={})
+                        follow_ups.append(requested[identity])
+
+            pending = follow_ups
+
+        if single:
+            return result[0] if result else None
+        if self.pushdown is not None:
+            result = self.pushdown.apply(result)
+        return result
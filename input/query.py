@@ -0,0 +1,678 @@
+"""Local evaluation of odata $filter and $orderby expressions over collections of objects, and split of query
+options between the service and local evaluation following the capabilities of the entity sets."""
+
+from re import compile as re_compile, VERBOSE
+from bisect import bisect_left, bisect_right
+from .extension import ODATA_PROPERTY_TYPE, ODATA_TYPE_TO_PYTHON, ODATA_CONTAINER_TYPE, get_capabilities
+
+
+TOKEN_RE = re_compile(r"""\s*(?:
+    (?P<string>'(?:[^']|'')*')
+  | (?P<datetime>[0-9]{4}-[0-9]{2}-[0-9]{2}(?:T[0-9:.]+(?:Z|[+-][0-9]{2}:[0-9]{2})?)?)
+  | (?P<number>-?[0-9]+(?:\.[0-9]+)?(?:[eE][+-]?[0-9]+)?)
+  | (?P<symbol>[(),])
+  | (?P<name>[A-Za-z_][A-Za-z0-9_./]*)
+)""", VERBOSE)
+
+COMPARISON_OPERATORS = ('eq', 'ne', 'gt', 'ge', 'lt', 'le')
+RANGE_OPERATORS = ('gt', 'ge', 'lt', 'le')
+REVERSED_OPERATOR = {'eq': 'eq', 'ne': 'ne', 'gt': 'lt', 'ge': 'le', 'lt': 'gt', 'le': 'ge'}
+
+NUMERIC_TYPES = ('Edm.SByte', 'Edm.Int16', 'Edm.Int32', 'Edm.Int64', 'Edm.Decimal', 'Edm.Single', 'Edm.Double')
+
+# name: (number of arguments, function receiving evaluated arguments without None values)
+FUNCTIONS = {'startswith': (2, lambda a, b: a.startswith(b)),
+             'endswith': (2, lambda a, b: a.endswith(b)),
+             'contains': (2, lambda a, b: b in a),
+             'indexof': (2, lambda a, b: a.find(b)),
+             'tolower': (1, lambda a: a.lower()),
+             'toupper': (1, lambda a: a.upper()),
+             'trim': (1, lambda a: a.strip()),
+             'length': (1, lambda a: len(a))}
+
+
+def get_property_odata_type(cls, odata_name):
+    """Returns odata type of the property of the class or its bases, without Collection().
+    :param cls: generated class.
+    :param odata_name: property name in odata format.
+    :return: odata type name.
+    """
+    for c in cls.__mro__:
+        properties = ODATA_PROPERTY_TYPE.get(getattr(c, 'odata', None), {})
+        if odata_name in properties:
+            return properties[odata_name]
+    raise ValueError("Property '{}' not valid for {}.".format(odata_name, cls.__name__))
+
+
+def is_collection_property(cls, python_name):
+    """Returns True if the property of the class or its bases is a collection."""
+    for c in cls.__mro__:
+        properties = c.__dict__.get('valid_properties', {})
+        if python_name in properties:
+            return properties[python_name]['odata_type'].startswith("Collection(")
+    return False
+
+
+def tokenize(expression):
+    """Splits an odata expression into a list of (kind, value) tokens."""
+    tokens = []
+    pos = 0
+    expression = expression.rstrip()
+    while pos < len(expression):
+        m = TOKEN_RE.match(expression, pos)
+        if not m or m.end() == pos:
+            raise ValueError("Syntax error in expression at position {}: {}".format(pos, expression))
+        kind = m.lastgroup
+        value = m.group(kind)
+        if kind == 'string':
+            value = value[1:-1].replace("''", "'")
+        elif kind == 'datetime':
+            kind = 'string'
+        elif kind == 'number':
+            value = float(value) if '.' in value or 'e' in value.lower() else int(value)
+        tokens.append((kind, value))
+        pos = m.end()
+    return tokens
+
+
+class FilterParser(object):
+    """Recursive descent parser of odata $filter expressions producing a tuple based tree.
+
+    Nodes are ('literal', value), ('property', python_path, odata_type), ('call', name, args),
+    ('compare', operator, left, right), ('and', left, right), ('or', left, right) and ('not', operand).
+    """
+
+    def __init__(self, cls, expression):
+        self.cls = cls
+        self.expression = expression
+        self.tokens = tokenize(expression)
+        self.pos = 0
+
+        # Property paths in odata format and names of the functions found by parse()
+        self.odata_paths = []
+        self.functions = []
+
+    def _peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else (None, None)
+
+    def _next(self):
+        token = self._peek()
+        self.pos += 1
+        return token
+
+    def _expect(self, value):
+        if self._next()[1] != value:
+            raise ValueError("Expected '{}' in expression: {}".format(value, self.expression))
+
+    def parse(self):
+        node = self._or()
+        if self.pos != len(self.tokens):
+            raise ValueError("Unexpected '{}' in expression: {}".format(self._peek()[1], self.expression))
+        return node
+
+    def _or(self):
+        node = self._and()
+        while self._peek() == ('name', 'or'):
+            self._next()
+            node = ('or', node, self._and())
+        return node
+
+    def _and(self):
+        node = self._not()
+        while self._peek() == ('name', 'and'):
+            self._next()
+            node = ('and', node, self._not())
+        return node
+
+    def _not(self):
+        if self._peek() == ('name', 'not'):
+            self._next()
+            return 'not', self._not()
+        return self._comparison()
+
+    def _comparison(self):
+        left = self._operand()
+        kind, value = self._peek()
+        if kind == 'name' and value in COMPARISON_OPERATORS:
+            self._next()
+            right = self._operand()
+            check_operand_types(left, right, self.expression)
+            return 'compare', value, left, right
+        return left
+
+    def _operand(self):
+        kind, value = self._next()
+
+        if kind in ('string', 'number'):
+            return 'literal', value
+
+        if kind == 'symbol' and value == '(':
+            node = self._or()
+            self._expect(')')
+            return node
+
+        if kind == 'name':
+            if value in ('true', 'false'):
+                return 'literal', value == 'true'
+            if value == 'null':
+                return 'literal', None
+
+            if self._peek() == ('symbol', '('):
+                # Function call
+                if value not in FUNCTIONS:
+                    raise ValueError("Function '{}' not supported in expression: {}".format(value, self.expression))
+                self._next()
+                args = [self._or()]
+                while self._peek() == ('symbol', ','):
+                    self._next()
+                    args.append(self._or())
+                self._expect(')')
+                if len(args) != FUNCTIONS[value][0]:
+                    raise ValueError("Wrong number of arguments for '{}' in expression: {}".
+                                     format(value, self.expression))
+                self.functions.append(value)
+                return 'call', value, tuple(args)
+
+            return self._property(value)
+
+        if kind is None:
+            raise ValueError("Unexpected end of expression: " + self.expression)
+        raise ValueError("Unexpected '{}' in expression: {}".format(value, self.expression))
+
+    def _property(self, odata_path):
+        """Returns property node after validating the path against the model."""
+        cls = self.cls
+        python_path = []
+        odata_type = None
+        for segment in odata_path.split('/'):
+            if cls is None:
+                raise ValueError("Property '{}' not valid in expression: {}".format(odata_path, self.expression))
+            odata_type = get_property_odata_type(cls, segment)
+            python_path.append(cls.get_property_python_name(segment))
+            if is_collection_property(cls, python_path[-1]):
+                # Collections need lambda operators, which are not supported
+                raise ValueError("Collection property '{}' not valid in expression: {}".
+                                 format(odata_path, self.expression))
+            cls = ODATA_TYPE_TO_PYTHON.get(odata_type)
+            cls = cls if isinstance(cls, type) and hasattr(cls, 'valid_odata_properties') else None
+        self.odata_paths.append(odata_path)
+        return 'property', tuple(python_path), odata_type
+
+
+def check_operand_types(left, right, expression):
+    """Raises ValueError if a property is compared with a literal of the wrong type."""
+    for prop, literal in ((left, right), (right, left)):
+        if prop[0] != 'property' or literal[0] != 'literal' or literal[1] is None:
+            continue
+        odata_type, value = prop[2], literal[1]
+        if odata_type == 'Edm.Boolean':
+            valid = isinstance(value, bool)
+        elif odata_type in NUMERIC_TYPES:
+            valid = isinstance(value, (int, float)) and not isinstance(value, bool)
+        else:
+            valid = isinstance(value, str)
+        if not valid:
+            raise ValueError("Value {!r} not valid for property of type {} in expression: {}".
+                             format(value, odata_type, expression))
+
+
+def compile_getter(python_path):
+    """Returns function getting the value of the property path from an object, None if not set."""
+    if len(python_path) == 1:
+        name = python_path[0]
+        return lambda obj: getattr(obj, name, None)
+
+    def getter(obj):
+        for name in python_path:
+            obj = getattr(obj, name, None)
+            if obj is None:
+                return None
+        return obj
+    return getter
+
+
+def compile_node(node):
+    """Compiles a parsed filter node into a function receiving an object."""
+    kind = node[0]
+
+    if kind == 'literal':
+        value = node[1]
+        return lambda obj: value
+
+    if kind == 'property':
+        return compile_getter(node[1])
+
+    if kind == 'and':
+        left, right = compile_node(node[1]), compile_node(node[2])
+        return lambda obj: left(obj) is True and right(obj) is True
+
+    if kind == 'or':
+        left, right = compile_node(node[1]), compile_node(node[2])
+        return lambda obj: left(obj) is True or right(obj) is True
+
+    if kind == 'not':
+        operand = compile_node(node[1])
+        return lambda obj: operand(obj) is not True
+
+    if kind == 'call':
+        function = FUNCTIONS[node[1]][1]
+        args = [compile_node(arg) for arg in node[2]]
+        if len(args) == 1:
+            arg = args[0]
+
+            def call(obj):
+                a = arg(obj)
+                return None if a is None else function(a)
+        else:
+            arg1, arg2 = args
+
+            def call(obj):
+                a, b = arg1(obj), arg2(obj)
+                return None if a is None or b is None else function(a, b)
+        return call
+
+    if kind == 'compare':
+        operator, left, right = node[1], compile_node(node[2]), compile_node(node[3])
+        if operator == 'eq':
+            return lambda obj: left(obj) == right(obj)
+        if operator == 'ne':
+            return lambda obj: left(obj) != right(obj)
+
+        compare = {'gt': lambda a, b: a > b,
+                   'ge': lambda a, b: a >= b,
+                   'lt': lambda a, b: a < b,
+                   'le': lambda a, b: a <= b}[operator]
+
+        def range_compare(obj):
+            a, b = left(obj), right(obj)
+            return a is not None and b is not None and compare(a, b)
+        return range_compare
+
+    raise ValueError("Unknown expression node: " + str(kind))
+
+
+def compile_filter(cls, expression):
+    """Returns a function that receives an object of class cls and returns True if
+    it matches the odata $filter expression.
+    :param cls: generated class the expression applies to.
+    :param expression: odata $filter expression, i.e. "accountEnabled eq true".
+    """
+    predicate = compile_node(FilterParser(cls, expression).parse())
+    return lambda obj: predicate(obj) is True
+
+
+def compile_orderby(cls, expression):
+    """Returns list of (getter, descending) tuples for the odata $orderby expression.
+    :param cls: generated class the expression applies to.
+    :param expression: odata $orderby expression, i.e. "displayName desc,department".
+    """
+    keys = []
+    for item in expression.split(','):
+        words = item.split()
+        if not words or len(words) > 2 or (len(words) == 2 and words[1] not in ('asc', 'desc')):
+            raise ValueError("Syntax error in $orderby expression: " + expression)
+        node = FilterParser(cls, words[0])._property(words[0])
+        keys.append((compile_getter(node[1]), len(words) == 2 and words[1] == 'desc'))
+    return keys
+
+
+def split_expression(expression):
+    """Returns list of the expressions joined with 'and' at the top level of a $filter expression.
+    Expressions with 'or' at the top level are returned whole, in a list with one expression.
+    """
+    expression = expression.strip()
+    parts = []
+    start = 0
+    depth = 0
+    pos = 0
+    while pos < len(expression):
+        m = TOKEN_RE.match(expression, pos)
+        if not m or m.end() == pos:
+            raise ValueError("Syntax error in expression at position {}: {}".format(pos, expression))
+        kind = m.lastgroup
+        if kind == 'symbol':
+            depth += {'(': 1, ')': -1}.get(m.group(kind), 0)
+        elif kind == 'name' and depth == 0:
+            if m.group(kind) == 'or':
+                return [expression]
+            if m.group(kind) == 'and':
+                parts.append(expression[start:m.start(kind)].strip())
+                start = m.end()
+        pos = m.end()
+    parts.append(expression[start:].strip())
+    return parts
+
+
+def split_conjunction(node):
+    """Returns list of nodes that must all be true for the node to be true."""
+    if node[0] == 'and':
+        return split_conjunction(node[1]) + split_conjunction(node[2])
+    return [node]
+
+
+def prefix_bound(prefix):
+    """Returns the smallest string greater than all strings starting with prefix, None for an empty prefix.
+    The last character of prefix must not be the last unicode character.
+    """
+    if not prefix:
+        return None
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def indexable_predicate(node):
+    """Returns (operator, python_path, value) if the node compares a property with a literal, or is startswith()
+    of a string property and a literal with operator 'prefix', else None.
+    """
+    if node[0] == 'call' and node[1] == 'startswith':
+        prop, literal = node[2]
+        if prop[0] == 'property' and prop[2] == 'Edm.String' and literal[0] == 'literal' and \
+                isinstance(literal[1], str) and not literal[1].endswith(chr(0x10ffff)):
+            return 'prefix', prop[1], literal[1]
+        return None
+    if node[0] != 'compare' or node[1] == 'ne':
+        return None
+    operator, left, right = node[1], node[2], node[3]
+    if left[0] == 'literal' and right[0] == 'property':
+        operator, left, right = REVERSED_OPERATOR[operator], right, left
+    if left[0] != 'property' or right[0] != 'literal':
+        return None
+    if operator in RANGE_OPERATORS and right[1] is None:
+        return None
+    return operator, left[1], right[1]
+
+
+class HashIndex(object):
+    """Secondary index mapping property values to positions in a collection."""
+
+    def __init__(self, items, getter):
+        self.positions = {}
+        for pos, item in enumerate(items):
+            self.positions.setdefault(getter(item), []).append(pos)
+        self._sets = {}
+
+    def lookup(self, value):
+        return self.positions.get(value, [])
+
+    def lookup_set(self, value):
+        """Returns set of the positions with the value, built the first time."""
+        if value not in self._sets:
+            self._sets[value] = frozenset(self.lookup(value))
+        return self._sets[value]
+
+
+class SortedIndex(object):
+    """Secondary index of positions in a collection sorted by property value. Objects without value are ignored."""
+
+    def __init__(self, items, getter):
+        pairs = sorted((value, pos) for pos, value in ((pos, getter(item)) for pos, item in enumerate(items))
+                       if value is not None)
+        self.values = [value for value, pos in pairs]
+        self.positions = [pos for value, pos in pairs]
+
+    def lookup(self, operator, value):
+        if operator == 'gt':
+            return self.positions[bisect_right(self.values, value):]
+        if operator == 'ge':
+            return self.positions[bisect_left(self.values, value):]
+        if operator == 'lt':
+            return self.positions[:bisect_left(self.values, value)]
+        if operator == 'le':
+            return self.positions[:bisect_right(self.values, value)]
+        if operator == 'prefix':
+            bound = prefix_bound(value)
+            start = bisect_left(self.values, value)
+            return self.positions[start:bisect_left(self.values, bound) if bound is not None else None]
+        return self.positions[bisect_left(self.values, value):bisect_right(self.values, value)]
+
+
+class LocalCollection(object):
+    """Collection of objects of a generated class that can be queried with odata expressions.
+
+    Equality and range comparisons of properties with literals, and startswith() of string properties, use
+    hash and sorted indexes built the first time they are needed. Compiled expressions are cached.
+    """
+
+    def __init__(self, items, cls=None):
+        """Initializes the collection.
+        :param items: iterable with objects of the generated class or derived classes.
+        :param cls: generated class used to validate expressions. Defaults to the class of the first item.
+        """
+        self.items = list(items)
+        if cls is None:
+            if not self.items:
+                raise ValueError("Parameter cls is required for an empty collection.")
+            cls = type(self.items[0])
+        self.cls = cls
+        self._hash_indexes = {}
+        self._sorted_indexes = {}
+        self._filters = {}
+        self._orderbys = {}
+
+    def __len__(self):
+        return len(self.items)
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def append(self, item):
+        """Adds an object to the collection. Indexes are rebuilt when needed."""
+        self.items.append(item)
+        self._hash_indexes.clear()
+        self._sorted_indexes.clear()
+
+    def create_index(self, odata_path, sorted_index=False):
+        """Builds index for the property path. Indexes are also built automatically by filter().
+        :param odata_path: property path in odata format, i.e. "department" or "passwordProfile/password".
+        :param sorted_index: True for a sorted index for range comparisons, False for a hash index.
+        """
+        python_path = FilterParser(self.cls, odata_path)._property(odata_path)[1]
+        return self._get_index(python_path, sorted_index)
+
+    def _get_index(self, python_path, sorted_index):
+        indexes = self._sorted_indexes if sorted_index else self._hash_indexes
+        if python_path not in indexes:
+            index_class = SortedIndex if sorted_index else HashIndex
+            indexes[python_path] = index_class(self.items, compile_getter(python_path))
+        return indexes[python_path]
+
+    def _compile_filter(self, expression):
+        """Returns tuple (predicate, conjuncts) of the expression: its compiled predicate and list of tuples
+        (indexable predicate or None, compiled predicate) of the expressions joined with 'and' at the top level.
+        """
+        if expression not in self._filters:
+            node = FilterParser(self.cls, expression).parse()
+            conjuncts = [(indexable_predicate(n), compile_node(n)) for n in split_conjunction(node)]
+            self._filters[expression] = (compile_node(node), conjuncts)
+        return self._filters[expression]
+
+    def filter(self, expression):
+        """Returns list of objects matching the odata $filter expression, in collection order.
+        :param expression: odata $filter expression, i.e. "accountEnabled eq true and startswith(department,'Eng')".
+        """
+        predicate, conjuncts = self._compile_filter(expression)
+        indexed = [indexable for indexable, _ in conjuncts if indexable is not None]
+        if not indexed:
+            return [item for item in self.items if predicate(item) is True]
+
+        # The indexed comparison matching fewer objects gives the candidates
+        lookups = []
+        for operator, python_path, value in indexed:
+            if operator == 'eq':
+                lookups.append(self._get_index(python_path, False).lookup(value))
+            else:
+                lookups.append(self._get_index(python_path, True).lookup(operator, value))
+        selected = min(range(len(indexed)), key=lambda i: len(lookups[i]))
+        base = indexed[selected]
+        positions = lookups[selected]
+
+        # Other equalities are checked with the positions of their index, the rest are evaluated
+        for indexable in indexed:
+            if indexable is not base and indexable[0] == 'eq':
+                position_set = self._get_index(indexable[1], False).lookup_set(indexable[2])
+                positions = list(filter(position_set.__contains__, positions))
+        if base[0] != 'eq':
+            positions = sorted(positions)
+        residual = [function for indexable, function in conjuncts
+                    if indexable is None or (indexable is not base and indexable[0] != 'eq')]
+
+        items = self.items
+        if not residual:
+            return [items[pos] for pos in positions]
+        return [items[pos] for pos in positions if all(function(items[pos]) is True for function in residual)]
+
+    def order_by(self, expression, items=None):
+        """Returns list of objects sorted by the odata $orderby expression. Null values sort first.
+        :param expression: odata $orderby expression, i.e. "displayName desc,department".
+        :param items: objects to sort. Defaults to all objects in the collection.
+        """
+        if expression not in self._orderbys:
+            self._orderbys[expression] = compile_orderby(self.cls, expression)
+
+        result = list(self.items if items is None else items)
+        for getter, descending in reversed(self._orderbys[expression]):
+            result.sort(key=lambda obj: (getter(obj) is not None, getter(obj)), reverse=descending)
+        return result
+
+    def query(self, filter=None, orderby=None, top=None, skip=0):
+        """Returns list of objects applying the odata query options specified.
+        :param filter: odata $filter expression. Optional.
+        :param orderby: odata $orderby expression. Optional.
+        :param top: maximum number of objects returned. Optional.
+        :param skip: number of objects skipped. Optional.
+        """
+        result = self.filter(filter) if filter else self.items
+        if orderby:
+            result = self.order_by(orderby, result)
+        return result[skip:skip + top if top is not None else None]
+
+
+def _restricted(odata_path, restricted_paths):
+    """Returns True if the property path or a property containing it is in restricted_paths."""
+    return any(odata_path == path or odata_path.startswith(path + '/') for path in restricted_paths)
+
+
+class QueryPushdown(object):
+    """Split of the options of a query on an entity set between the service and local evaluation.
+
+    Options are sent to the service where the capability annotations of the entity set allow it, see
+    extension.get_capabilities(). The rest is evaluated with LocalCollection on the objects received:
+    the conjuncts of $filter on properties that can't be filtered, $orderby on properties that can't be
+    sorted, and $top and $skip when the filter or the order are local. Results are the same as evaluating
+    all options locally on the whole entity set.
+
+    options: dictionary of query options sent to the service.
+    local_filter, local_orderby, local_top: options evaluated locally, None if not needed.
+    local_skip: number of objects skipped locally.
+    local_paths: property paths in odata format read by the local filter and order.
+    """
+
+    def __init__(self, container, filter=None, orderby=None, top=None, skip=0, select=None, count=False):
+        """Splits the query options.
+        :param container: name of entity set in odata format, i.e. "users".
+        :param filter: odata $filter expression. Optional.
+        :param orderby: odata $orderby expression. Optional.
+        :param top: maximum number of objects of the result. Optional.
+        :param skip: number of objects skipped. Optional.
+        :param select: list of property names in odata format of the objects. Properties needed by local
+                       evaluation are selected too. Optional.
+        :param count: True to request @odata.count if the service can count the result.
+        """
+        if container not in ODATA_CONTAINER_TYPE:
+            raise ValueError("Unknown entity set: " + container)
+        self.container = container
+        self.cls = ODATA_TYPE_TO_PYTHON[ODATA_CONTAINER_TYPE[container]]
+        self.capabilities = capabilities = get_capabilities(container)
+
+        self.options = {}
+        self.local_filter = None
+        self.local_orderby = None
+        self.local_top = top
+        self.local_skip = skip
+
+        # Property paths needed by local evaluation
+        self.local_paths = local_paths = []
+
+        if filter:
+            pushed = []
+            pushed_paths = []
+            local = []
+            for part in split_expression(filter):
+                parser = FilterParser(self.cls, part)
+                parser.parse()
+                if self._filterable(parser):
+                    pushed.append(part)
+                    pushed_paths.extend(parser.odata_paths)
+                else:
+                    local.append(part)
+                    local_paths.extend(parser.odata_paths)
+            if pushed:
+                self.options['$filter'] = " and ".join(pushed)
+            if local:
+                self.local_filter = " and ".join(local)
+        else:
+            pushed_paths = []
+
+        if capabilities['requires_filter'] and '$filter' not in self.options:
+            raise ValueError("Entity set {} requires a $filter the service can evaluate.".format(container))
+        for path in capabilities['required_filter_properties']:
+            if path not in pushed_paths:
+                raise ValueError("Entity set {} requires a $filter on property {}.".format(container, path))
+
+        if orderby:
+            compile_orderby(self.cls, orderby)
+            paths = [item.split()[0] for item in orderby.split(',')]
+            if capabilities['sortable'] and \
+                    not any(_restricted(path, capabilities['non_sortable_properties']) for path in paths):
+                self.options['$orderby'] = orderby
+            else:
+                self.local_orderby = orderby
+                local_paths.extend(paths)
+
+        # Paging is only sent when the service returns the objects of the result in their final order
+        exact = self.local_filter is None and self.local_orderby is None
+        if skip and exact and capabilities['skip_supported']:
+            self.options['$skip'] = str(skip)
+            self.local_skip = 0
+        if top is not None and exact and capabilities['top_supported']:
+            self.options['$top'] = str(top + self.local_skip)
+        if count and self.local_filter is None and capabilities['countable']:
+            self.options['$count'] = 'true'
+
+        if select and capabilities['selectable']:
+            fields = set(select)
+            fields.update(path.split('/')[0] for path in local_paths)
+            if self.cls.key_property:
+                fields.add(self.cls.key_property)
+            for name in fields:
+                get_property_odata_type(self.cls, name)
+            self.options['$select'] = ",".join(sorted(fields))
+
+    def __repr__(self):
+        return '<ODATA PUSHDOWN: {} options sent{}{}>'.format(
+            len(self.options), ', local filter' if self.local_filter else '',
+            ', local orderby' if self.local_orderby else '')
+
+    def _filterable(self, parser):
+        """Returns True if the service can evaluate the parsed filter expression."""
+        capabilities = self.capabilities
+        if not capabilities['filterable']:
+            return False
+        if any(_restricted(path, capabilities['non_filterable_properties']) for path in parser.odata_paths):
+            return False
+        functions = capabilities['filter_functions']
+        return functions is None or all(name in functions for name in parser.functions)
+
+    def limit(self):
+        """Returns number of objects received from the service in order that are enough for the result,
+        or None if all of them are needed. Objects filtered locally may match anywhere in the collection.
+        """
+        if self.local_top is None or self.local_filter is not None or self.local_orderby is not None:
+            return None
+        return self.local_skip + self.local_top
+
+    def apply(self, objects):
+        """Returns list of the objects received from the service with the local options applied."""
+        if self.local_filter is None and self.local_orderby is None and not self.local_skip:
+            return list(objects)[:self.local_top]
+        return LocalCollection(objects, self.cls).query(self.local_filter, self.local_orderby,
+                                                        self.local_top, self.local_skip)
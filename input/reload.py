@@ -0,0 +1,203 @@
+"""Reload of a regenerated model in a running process, using the manifest written by the generator."""
+
+import os
+import sys
+from importlib import import_module, invalidate_caches, reload
+from json import load
+from time import perf_counter
+from .odata_object_base import OdataObjectBase, _resolved_classes
+
+
+MANIFEST_FILENAME = "manifest.json"
+
+# Modules that can't be replaced in a running process: objects and classes of the whole model depend on them
+BASE_MODULES = ("odata_object_base", "request")
+
+# Tables of extension.py updated in place, so modules that imported them see the new values
+EXTENSION_TABLES = ("ODATA_CONTAINER_TYPE", "ODATA_ENTITY_SET", "ODATA_TYPE_TO_PYTHON", "ODATA_TYPE_DISPATCH",
+                    "ODATA_DERIVED_TYPES", "ODATA_TYPE_DEPTH", "ODATA_PROPERTY_TYPE", "ODATA_NAVIGATION_PROPERTY",
+                    "ODATA_CAPABILITIES")
+
+
+def read_manifest(directory):
+    """Returns dictionary module name: hash from the manifest in the package directory."""
+    try:
+        with open(os.path.join(directory, MANIFEST_FILENAME)) as f:
+            return load(f)['modules']
+    except (OSError, ValueError, KeyError):
+        raise ValueError("No valid manifest in " + directory)
+
+
+class ReloadResult(object):
+    """Outcome of Reloader.reload().
+    reloaded: names of the modules reloaded.
+    added: names of new modules.
+    removed: names of modules no longer in the package.
+    stale: names of classes replaced by a new class. Existing objects keep the old class.
+    restart_required: names of changed modules that can't be reloaded, the process must be restarted
+                      to use them.
+    """
+
+    def __init__(self):
+        self.reloaded = []
+        self.added = []
+        self.removed = []
+        self.stale = []
+        self.restart_required = []
+        self.seconds = 0.0
+
+    def __repr__(self):
+        return '<ODATA RELOAD: {} reloaded, {} added, {} removed, {} stale classes{}>'.format(
+            len(self.reloaded), len(self.added), len(self.removed), len(self.stale),
+            ', restart required' if self.restart_required else '')
+
+
+class Reloader(object):
+    """Applies a new generation of the package to the running process.
+
+    Only modules whose hash changed are reloaded, plus the modules of the loaded classes derived from
+    a reloaded class. The tables of extension.py are updated in place, so no other thread may decode
+    objects during a reload.
+    """
+
+    def __init__(self, package=__package__):
+        """Initializes the reloader with the manifest of the package currently loaded.
+        :param package: name of the generated package.
+        """
+        self.package = package
+        self.directory = os.path.dirname(import_module(package).__file__)
+        self.manifest = read_manifest(self.directory)
+
+        # Class replaced by a reload: class that replaces it
+        self._replaced = {}
+
+    def changed_modules(self):
+        """Returns tuple (changed, added, removed) of module names in the package directory compared to
+        the manifest loaded.
+        """
+        manifest = read_manifest(self.directory)
+        changed = [name for name, h in manifest.items() if name in self.manifest and self.manifest[name] != h]
+        added = [name for name in manifest if name not in self.manifest]
+        removed = [name for name in self.manifest if name not in manifest]
+        return changed, added, removed
+
+    def reload(self):
+        """Reloads the modules changed since the manifest was loaded.
+        :return: ReloadResult object.
+        """
+        started = perf_counter()
+        result = ReloadResult()
+        changed, result.added, result.removed = self.changed_modules()
+        invalidate_caches()
+
+        package = sys.modules[self.package]
+        extension_name = self.package + ".extension"
+        class_modules = set(getattr(package, 'CLASS_MODULES', {}).values())
+
+        # Runtime modules other than the base can be reloaded, but objects created by them are not updated
+        result.restart_required = [name for name in changed if name in BASE_MODULES]
+        changed = [name for name in changed if name not in BASE_MODULES]
+
+        # Modules loaded whose classes derive from a class of a changed module are reloaded too
+        loaded = {name: sys.modules[self.package + "." + name] for name in class_modules
+                  if self.package + "." + name in sys.modules}
+        to_reload = set(name for name in changed if name in loaded)
+        while True:
+            reloaded_modules = set(self.package + "." + name for name in to_reload)
+            derived = set(name for name, module in loaded.items() if name not in to_reload and
+                          any(base.__module__ in reloaded_modules
+                              for cls in _module_classes(module) for base in cls.__mro__[1:]))
+            if not derived:
+                break
+            to_reload |= derived
+
+        if "__init__" in changed:
+            reload(package)
+            result.reloaded.append("__init__")
+
+        # Base classes first
+        def depth(name):
+            return max([len(cls.__mro__) for cls in _module_classes(loaded[name])] or [0])
+
+        for name in sorted(to_reload, key=depth):
+            old_classes = _module_classes(loaded[name])
+            module = reload(loaded[name])
+            for cls in old_classes:
+                new_cls = getattr(module, cls.__name__, None)
+                if new_cls is not None and new_cls is not cls:
+                    self._replaced[cls] = new_cls
+                    result.stale.append(cls.__name__)
+                _resolved_classes.pop(cls.__name__, None)
+            result.reloaded.append(name)
+
+        for name in result.removed:
+            _resolved_classes.pop(name, None)
+
+        # Other runtime modules, the extension is reloaded after the classes
+        for name in changed:
+            full_name = self.package + "." + name
+            if name not in class_modules and name not in ("__init__", "extension") and full_name in sys.modules:
+                reload(sys.modules[full_name])
+                result.reloaded.append(name)
+
+        if extension_name in sys.modules and (to_reload or result.added or result.removed or "extension" in changed):
+            self._reload_extension(sys.modules[extension_name])
+            result.reloaded.append("extension")
+
+        # Compiled decoders refer to the classes of the properties
+        decoder = sys.modules.get(self.package + ".decoder")
+        if decoder is not None and (to_reload or result.removed):
+            decoder._decoders.clear()
+
+        self.manifest = read_manifest(self.directory)
+        result.seconds = perf_counter() - started
+        return result
+
+    @staticmethod
+    def _reload_extension(extension):
+        """Reloads the extension module keeping the same table objects, updated with the new values."""
+        tables = {name: getattr(extension, name) for name in EXTENSION_TABLES if hasattr(extension, name)}
+        reload(extension)
+        for name, table in tables.items():
+            new_table = getattr(extension, name, {})
+            if hasattr(table, 'reset'):
+                # Class tables keep the names, classes are imported again when looked up
+                table.reset(getattr(new_table, 'types', new_table))
+            else:
+                table.clear()
+                table.update(new_table)
+            setattr(extension, name, table)
+
+    def is_stale(self, obj):
+        """Returns True if the object's class was replaced by a reload."""
+        return type(obj) in self._replaced
+
+    def current_class(self, cls):
+        """Returns the class that replaces cls after the reloads, or cls if it wasn't replaced."""
+        while cls in self._replaced:
+            cls = self._replaced[cls]
+        return cls
+
+    def refresh(self, obj):
+        """Returns object of the current class with the same properties, or the same object if it isn't stale.
+        Properties are copied by name: the ones removed from the class are dropped and new ones are None.
+        Objects in the properties are refreshed too.
+        """
+        if not self.is_stale(obj):
+            return obj
+        cls = self.current_class(type(obj))
+        new_obj = cls.__new__(cls)
+        for name in cls.flattened_properties():
+            value = obj.__dict__.get(name)
+            if isinstance(value, OdataObjectBase):
+                value = self.refresh(value)
+            elif isinstance(value, list):
+                value = [self.refresh(v) if isinstance(v, OdataObjectBase) else v for v in value]
+            setattr(new_obj, name, value)
+        return new_obj
+
+
+def _module_classes(module):
+    """Returns the generated classes defined in a module."""
+    return [value for value in vars(module).values()
+            if isinstance(value, type) and value.__module__ == module.__name__]
@@ -0,0 +1,58 @@
+"""Requests for bound actions and functions of the model."""
+
+from json import dumps
+
+
+def odata_literal(value):
+    """Returns value formatted as an odata url literal.
+    :param value: str, int, float, bool or None.
+    """
+    if value is None:
+        return "null"
+    elif isinstance(value, bool):
+        return "true" if value else "false"
+    elif isinstance(value, (int, float)):
+        return str(value)
+    else:
+        return "'" + str(value).replace("'", "''") + "'"
+
+
+class OdataRequest(object):
+    """Represents a request to the odata service that can be sent alone or inside a $batch."""
+
+    def __init__(self, method, url, body=None, returns=None, headers=None):
+        """Initializes the request.
+        :param method: http method.
+        :param url: url relative to the service root, i.e. "users('id')/assignLicense".
+        :param body: dictionary sent as json body. Optional.
+        :param returns: odata type returned, i.e. "microsoft.graph.user" or "Collection(Edm.String)". Optional.
+        :param headers: dictionary with additional http headers. Optional.
+        """
+        self.method = method
+        self.url = url
+        self.body = body
+        self.returns = returns
+        self.headers = dict(headers) if headers else {}
+        if body is not None:
+            self.headers.setdefault('Content-Type', 'application/json')
+
+    def __repr__(self):
+        return '<ODATA REQUEST: ' + self.method + ' ' + self.url + '>'
+
+    def encoded_body(self):
+        """Returns body encoded as json bytes, or None if the request has no body."""
+        return dumps(self.body).encode('utf-8') if self.body is not None else None
+
+    def batch_item(self, request_id, depends_on=None):
+        """Returns the request in json $batch format.
+        :param request_id: id of the request inside the batch.
+        :param depends_on: list of ids of requests that must run before. Optional.
+        """
+        item = {'id': request_id, 'method': self.method, 'url': '/' + self.url.lstrip('/')}
+        if self.headers:
+            item['headers'] = self.headers
+        if self.body is not None:
+            item['body'] = self.body
+        if depends_on:
+            item['dependsOn'] = list(depends_on)
+        return item
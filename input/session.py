@@ -0,0 +1,172 @@
+"""Identity map session to avoid building the same entity more than once."""
+
+from collections import OrderedDict
+from weakref import WeakValueDictionary
+from .extension import get_object_class
+from .decoder import decode_object
+
+
+EVICTION_LRU = "lru"
+EVICTION_FIFO = "fifo"
+EVICTION_WEAK = "weak"
+EVICTION_POLICIES = (EVICTION_LRU, EVICTION_FIFO, EVICTION_WEAK)
+
+
+class Session(object):
+    """Identity map of entities keyed on the key property of their entity type.
+
+    Decoding an entity whose key is already known returns the instance kept in the
+    session after merging the newly received properties into it.
+    """
+
+    def __init__(self, max_size=None, eviction=EVICTION_LRU):
+        """Initializes the session.
+        :param max_size: maximum number of entities kept. None means no limit.
+                         Ignored by the weak eviction policy.
+        :param eviction: eviction policy: 'lru', 'fifo' or 'weak'. With 'weak' entities are
+                         kept only while something else holds a reference to them.
+        """
+        if eviction not in EVICTION_POLICIES:
+            raise ValueError("Eviction policy must be one of: " + ", ".join(EVICTION_POLICIES))
+        if max_size is not None and max_size < 1:
+            raise ValueError("Parameter max_size must be a positive integer.")
+
+        self.max_size = max_size
+        self.eviction = eviction
+        self._entities = WeakValueDictionary() if eviction == EVICTION_WEAK else OrderedDict()
+
+        # Statistics
+        self.constructed = 0
+        self.merged = 0
+        self.evicted = 0
+
+    def __len__(self):
+        return len(self._entities)
+
+    def __contains__(self, entity):
+        return self._identity(type(entity), entity.get_key()) in self._entities
+
+    @staticmethod
+    def _identity(cls, key):
+        """Returns the identity map key of an entity of class cls with key value key."""
+        key_class = cls.get_key_class()
+        if key_class is None or key is None:
+            return None
+        return key_class.odata, key
+
+    def get(self, cls, key):
+        """Returns the entity of class cls (or derived) with the key specified, or None if not in the session.
+        :param cls: generated entity class.
+        :param key: value of the key property.
+        """
+        identity = self._identity(cls, key)
+        entity = self._entities.get(identity)
+        if entity is not None and self.eviction == EVICTION_LRU:
+            self._entities.move_to_end(identity)
+        return entity if isinstance(entity, cls) else None
+
+    def add(self, entity):
+        """Adds an entity to the session replacing any entity with the same identity.
+        :param entity: instance of a generated entity class.
+        """
+        identity = self._identity(type(entity), entity.get_key())
+        if identity is None:
+            raise ValueError("Entity of type {} has no key.".format(type(entity).__name__))
+        self._store(identity, entity)
+
+    def _store(self, identity, entity):
+        self._entities[identity] = entity
+
+        if self.eviction == EVICTION_WEAK or self.max_size is None:
+            return
+
+        if self.eviction == EVICTION_LRU:
+            self._entities.move_to_end(identity)
+        while len(self._entities) > self.max_size:
+            self._entities.popitem(last=False)
+            self.evicted += 1
+
+    def decode(self, odata_properties, odata_context=None, odata_type=None):
+        """Returns the entity represented by the odata properties. If an entity with the same key
+        is already in the session, properties are merged into it and the same instance is returned.
+        :param odata_properties: dictionary of properties in their original odata name with their values.
+        :param odata_context: odata context of the response. Optional if odata_type is specified or
+                              the properties include @odata.type.
+        :param odata_type: odata type of the entity. Optional.
+        :return: instance of the generated class.
+        """
+        cls = get_object_class(odata_context, odata_properties.get('@odata.type') or odata_type)
+        key_class = cls.get_key_class()
+
+        if key_class is None or key_class.key_property not in odata_properties:
+            # Nothing to de-duplicate on
+            self.constructed += 1
+            return decode_object(odata_properties, cls)
+
+        identity = key_class.odata, odata_properties[key_class.key_property]
+        entity = self._entities.get(identity)
+
+        if entity is None:
+            entity = decode_object(odata_properties, cls)
+            self.constructed += 1
+
+        elif isinstance(entity, cls):
+            entity.update(odata_properties)
+            self.merged += 1
+
+        else:
+            # Received a more specific type than the one known, keep the old values
+            # that are not in the new properties
+            new_entity = decode_object(odata_properties, cls)
+            self.constructed += 1
+            for k, v in entity.__dict__.items():
+                if v is not None and getattr(new_entity, k, None) is None:
+                    setattr(new_entity, k, v)
+            entity = new_entity
+
+        self._store(identity, entity)
+        return entity
+
+    def merge(self, entity):
+        """Returns the entity of the session with the identity of an object not decoded by the session, i.e.
+        taken from a cache. Values of the object that are not None are merged into the entity of the session,
+        like decode() does with the properties received. The object is added if the session has no entity.
+        :param entity: instance of a generated class.
+        :return: instance of the generated class.
+        """
+        identity = self._identity(type(entity), entity.get_key())
+        if identity is None:
+            return entity
+        existing = self._entities.get(identity)
+
+        if isinstance(existing, type(entity)):
+            for k, v in entity.__dict__.items():
+                if v is not None:
+                    setattr(existing, k, v)
+            entity = existing
+            self.merged += 1
+
+        elif existing is not None:
+            # More specific type than the one known, keep the old values the object doesn't have
+            for k, v in existing.__dict__.items():
+                if v is not None and getattr(entity, k, None) is None:
+                    setattr(entity, k, v)
+
+        self._store(identity, entity)
+        return entity
+
+    def decode_page(self, page, odata_type=None):
+        """Returns the list of entities in a response page.
+        :param page: decoded json response, either a collection with 'value' or a single entity.
+        :param odata_type: odata type of the items, used if the response has no context. Optional.
+        :return: list of instances of the generated classes.
+        """
+        odata_context = page.get('@odata.context')
+        if 'value' in page and isinstance(page['value'], list):
+            return [self.decode(item, odata_context, odata_type) for item in page['value']]
+        else:
+            return [self.decode(page, odata_context, odata_type)]
+
+    def clear(self):
+        """Removes all entities from the session."""
+        self._entities.clear()
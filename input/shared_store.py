@@ -0,0 +1,367 @@
+"""Read only columnar store of a collection of objects in shared memory, attached by name from other processes.
+
+Layout of the shared memory block:
+    header: magic and length of the json description of the columns
+    description: json with the odata type, number of rows, columns and offset of the key hash table
+    columns: for each property of the class, an array of values (bool, int and float properties) or
+             an array of offsets into a data area (str properties and pickled records of other values),
+             and an array of null flags
+    hash table: slots of (key hash, row + 1), empty slots have hash 0
+"""
+
+import os
+import pickle
+import sys
+from array import array
+from json import dumps, loads
+from multiprocessing import shared_memory, resource_tracker
+from struct import Struct
+from .odata_object_base import OdataObjectBase
+from .extension import ODATA_TYPE_TO_PYTHON
+from .snapshot import key_hash
+
+
+MAGIC = b'ODSHM001'
+HEADER = Struct('<8sQ')
+SLOT = Struct('<QQ')
+ALIGNMENT = 8
+
+KIND_BOOL = 'bool'
+KIND_INT = 'int'
+KIND_FLOAT = 'float'
+KIND_STR = 'str'
+KIND_PICKLE = 'pickle'
+ARRAY_TYPES = {KIND_BOOL: 'b', KIND_INT: 'q', KIND_FLOAT: 'd'}
+
+# Names of the blocks created by this process and not unlinked yet
+_created = set()
+
+
+def _align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def column_kind(odata_type):
+    """Returns how values of the odata type are stored: bool, int, float, str or pickle."""
+    if odata_type.startswith("Collection("):
+        return KIND_PICKLE
+    python_type = ODATA_TYPE_TO_PYTHON.get(odata_type)
+    if python_type is bool:
+        return KIND_BOOL
+    if python_type is int:
+        return KIND_INT
+    if python_type is float:
+        return KIND_FLOAT
+    if isinstance(python_type, type) and issubclass(python_type, str):
+        return KIND_STR
+    return KIND_PICKLE
+
+
+def _column_types(cls):
+    """Returns dictionary python name: python type of the properties of the class stored as str, for the ones
+    whose type is a subclass of str like enumerations.
+    """
+    types = {}
+    for c in reversed(cls.__mro__):
+        for prop_name, prop in c.__dict__.get('valid_properties', {}).items():
+            python_type = ODATA_TYPE_TO_PYTHON.get(prop['odata_type'])
+            if column_kind(prop['odata_type']) == KIND_STR and python_type is not str:
+                types[prop_name] = python_type
+    return types
+
+
+def _encode_value(value):
+    """Returns picklable form of a value, with objects converted to records."""
+    if isinstance(value, OdataObjectBase):
+        return value.to_record()
+    if isinstance(value, list):
+        return [v.to_record() if isinstance(v, OdataObjectBase) else v for v in value]
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, tuple):
+        return OdataObjectBase.from_record(value)
+    if isinstance(value, list):
+        return [OdataObjectBase.from_record(v) if isinstance(v, tuple) else v for v in value]
+    return value
+
+
+def _encode_column(kind, values):
+    """Returns list of (part name, bytes) of a column."""
+    nulls = bytes(value is None for value in values)
+    if kind in ARRAY_TYPES:
+        data = array(ARRAY_TYPES[kind], (0 if value is None else value for value in values))
+        return [('values', data.tobytes()), ('nulls', nulls)]
+
+    offsets = array('Q', [0])
+    chunks = []
+    for value in values:
+        if value is not None:
+            chunks.append(value.encode('utf-8') if kind == KIND_STR
+                          else pickle.dumps(_encode_value(value), pickle.HIGHEST_PROTOCOL))
+            offsets.append(offsets[-1] + len(chunks[-1]))
+        else:
+            offsets.append(offsets[-1])
+    return [('offsets', offsets.tobytes()), ('data', b''.join(chunks)), ('nulls', nulls)]
+
+
+class SharedStore(object):
+    """Columnar copy of a collection of objects of a generated class in a shared memory block.
+
+    The process creating the store with create() owns the block and must call unlink() when no process
+    needs it anymore. Other processes attach with SharedStore(name). Values are read directly from the
+    shared block when requested, so attached processes don't keep copies of the objects.
+    """
+
+    def __init__(self, name, _memory=None):
+        """Attaches to an existing store.
+        :param name: name of the shared memory block, see the name attribute of the store.
+        """
+        if _memory is None:
+            _memory = _attach(name)
+        self._memory = _memory
+        self.name = _memory.name
+        self._views = []
+
+        buffer = _memory.buf
+        magic, length = HEADER.unpack_from(buffer, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError("Shared memory block {} is not a store.".format(name))
+        description = loads(bytes(buffer[HEADER.size:HEADER.size + length]).decode('utf-8'))
+
+        self.odata_type = description['odata_type']
+        self.cls = ODATA_TYPE_TO_PYTHON[self.odata_type]
+        self.count = description['count']
+        self.table_size = description['table_size']
+        self._table = self._view(description['table_offset'], self.table_size * SLOT.size)
+
+        # Property name: (kind, values or offsets, data, nulls, type of str values)
+        self._columns = {}
+        str_types = _column_types(self.cls)
+        for name, kind, parts in description['columns']:
+            views = {part: self._view(offset, size, ARRAY_TYPES.get(kind) if part == 'values' else
+                                      'Q' if part == 'offsets' else None)
+                     for part, offset, size in parts}
+            self._columns[name] = (kind, views.get('values', views.get('offsets')), views.get('data'),
+                                   views['nulls'], str_types.get(name, str))
+
+        key_class = self.cls.get_key_class()
+        self._key_name = self.cls.get_property_python_name(key_class.key_property) if key_class else None
+
+    @classmethod
+    def create(cls, objects, object_class, name=None):
+        """Creates a store with the objects.
+        :param objects: list of objects of object_class. Only properties of object_class are stored,
+                        properties of derived classes are not.
+        :param object_class: generated class.
+        :param name: name of the shared memory block. Defaults to a random name.
+        :return: SharedStore object.
+        """
+        objects = list(objects)
+        columns = []
+        for c in reversed(object_class.__mro__):
+            for prop_name, prop in c.__dict__.get('valid_properties', {}).items():
+                kind = column_kind(prop['odata_type'])
+                values = [getattr(obj, prop_name, None) for obj in objects]
+                columns.append((prop_name, kind, _encode_column(kind, values)))
+
+        # Open addressing hash table on the key, at most half full
+        key_class = object_class.get_key_class()
+        key_name = object_class.get_property_python_name(key_class.key_property) if key_class else None
+        keys = [getattr(obj, key_name, None) for obj in objects] if key_name else []
+        table_size = 1
+        while table_size < 2 * len(keys):
+            table_size *= 2
+        table = bytearray(table_size * SLOT.size)
+        mask = table_size - 1
+        for row, key in enumerate(keys):
+            if key is None:
+                continue
+            h = key_hash(key)
+            slot = h & mask
+            while SLOT.unpack_from(table, slot * SLOT.size)[0]:
+                slot = (slot + 1) & mask
+            SLOT.pack_into(table, slot * SLOT.size, h, row + 1)
+
+        # Offsets of the parts depend on the length of the description, which contains them.
+        # Repeat until the description fits before the first part.
+        start = 0
+        while True:
+            offset = start
+            described = []
+            for prop_name, kind, parts in columns:
+                placed = []
+                for part, data in parts:
+                    placed.append((part, offset, len(data)))
+                    offset = _align(offset + len(data))
+                described.append((prop_name, kind, placed))
+            description = dumps({'odata_type': object_class.odata, 'count': len(objects),
+                                 'table_size': table_size, 'table_offset': offset,
+                                 'columns': described}).encode('utf-8')
+            data_start = _align(HEADER.size + len(description))
+            if data_start == start:
+                break
+            start = data_start
+        size = max(offset + len(table), 1)
+
+        memory = shared_memory.SharedMemory(name=name, create=True, size=size)
+        _created.add(memory.name)
+        buffer = memory.buf
+        HEADER.pack_into(buffer, 0, MAGIC, len(description))
+        buffer[HEADER.size:HEADER.size + len(description)] = description
+        for (prop_name, kind, parts), (_, _, placed) in zip(columns, described):
+            for (part, data), (_, part_offset, part_size) in zip(parts, placed):
+                buffer[part_offset:part_offset + part_size] = data
+        buffer[offset:offset + len(table)] = table
+        del buffer
+
+        return cls(memory.name, memory)
+
+    def _view(self, offset, size, typecode=None):
+        view = self._memory.buf[offset:offset + size]
+        if typecode:
+            view = view.cast(typecode)
+        self._views.append(view)
+        return view
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, row):
+        """Returns lazy view of the row. Negative indexes are supported."""
+        if row < 0:
+            row += self.count
+        if not 0 <= row < self.count:
+            raise IndexError("Store row out of range.")
+        return RowView(self, row)
+
+    def __iter__(self):
+        for row in range(self.count):
+            yield RowView(self, row)
+
+    def __contains__(self, key):
+        return self.find(key) is not None
+
+    def properties(self):
+        """Returns list with the python names of the stored properties."""
+        return list(self._columns)
+
+    def value(self, row, name):
+        """Returns the value of a property of a row.
+        :param row: row number.
+        :param name: property name in python format.
+        """
+        try:
+            kind, values, data, nulls, str_type = self._columns[name]
+        except KeyError:
+            raise ValueError("Property '{}' not valid.".format(name))
+        if nulls[row]:
+            return None
+        if kind == KIND_BOOL:
+            return bool(values[row])
+        if kind in ARRAY_TYPES:
+            return values[row]
+        chunk = data[values[row]:values[row + 1]]
+        if kind == KIND_STR:
+            if str_type is str:
+                return str(chunk, 'utf-8')
+            # Enumeration values were valid when stored, no need to check them again
+            return str.__new__(str_type, str(chunk, 'utf-8'))
+        return _decode_value(pickle.loads(chunk))
+
+    def column(self, name):
+        """Generator of the values of a property in row order."""
+        for row in range(self.count):
+            yield self.value(row, name)
+
+    def find(self, key):
+        """Returns the row of the object with the key specified, or None if it's not in the store."""
+        if not self.table_size:
+            return None
+        h = key_hash(key)
+        mask = self.table_size - 1
+        slot = h & mask
+        while True:
+            slot_hash, row = SLOT.unpack_from(self._table, slot * SLOT.size)
+            if not slot_hash:
+                return None
+            if slot_hash == h and self.value(row - 1, self._key_name) == key:
+                return row - 1
+            slot = (slot + 1) & mask
+
+    def get(self, key):
+        """Returns lazy view of the object with the key specified, or None if it's not in the store."""
+        row = self.find(key)
+        return RowView(self, row) if row is not None else None
+
+    def to_object(self, row):
+        """Returns a new object of the class of the store with the values of the row."""
+        obj = self.cls.__new__(self.cls)
+        for name in self._columns:
+            obj.__dict__[name] = self.value(row, name)
+        return obj
+
+    def close(self):
+        """Detaches from the shared memory block. The block is kept for other processes."""
+        for view in reversed(self._views):
+            view.release()
+        self._views = []
+        self._memory.close()
+
+    def unlink(self):
+        """Closes the store and removes the shared memory block. Only the process that created it should do it."""
+        self.close()
+        self._memory.unlink()
+        _created.discard(self.name)
+
+
+class RowView(object):
+    """Row of a SharedStore with its properties read from shared memory as attributes."""
+
+    __slots__ = ('_store', '_row')
+
+    def __init__(self, store, row):
+        self._store = store
+        self._row = row
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        try:
+            return self._store.value(self._row, name)
+        except ValueError:
+            raise AttributeError("'{}' object has no attribute '{}'".format(self._store.cls.__name__, name))
+
+    def __repr__(self):
+        return '<ODATA ROW ' + self._store.cls.__name__ + ': ' + str(self._row) + '>'
+
+    def get_key(self):
+        if self._store._key_name is None:
+            return None
+        return self._store.value(self._row, self._store._key_name)
+
+    def to_object(self):
+        """Returns a new object of the generated class with the values of the row."""
+        return self._store.to_object(self._row)
+
+
+def _attach(name):
+    """Returns existing shared memory block without registering it to be removed when this process exits."""
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+
+    # Before python 3.13 attaching registers the block in the resource tracker, which removes it when
+    # this process exits even if the creator still uses it. Only this block is unregistered, unless this
+    # process created it and the registration is the creator's.
+    memory = shared_memory.SharedMemory(name=name)
+    if memory.name not in _created and os.name == 'posix':
+        resource_tracker.unregister(memory._name, "shared_memory")
+    return memory
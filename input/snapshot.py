@@ -0,0 +1,153 @@
+"""Binary snapshot files of collections of objects, memory mapped for random access by key.
+
+File layout:
+    header: magic, number of records, size of the hash table, offset of the types table, offset of the hash table
+    records: for each object, index of its odata type, length of the values and the pickled tuple of
+             values of its record in the order of the properties of its class, without their names,
+             see OdataObjectBase.to_record()
+    types table: json list of the odata types of the records
+    hash table: slots of (key hash, record offset), empty slots have hash 0
+"""
+
+import mmap
+import os
+import pickle
+from array import array
+from hashlib import blake2b
+from json import dumps, loads
+from struct import Struct
+from .odata_object_base import OdataObjectBase
+
+
+MAGIC = b'ODSNAP01'
+HEADER = Struct('<8sQQQQ')
+SLOT = Struct('<QQ')
+RECORD = Struct('<HI')
+
+
+def key_hash(key):
+    """Returns non zero 64 bit hash of a key value, stable across processes."""
+    h = int.from_bytes(blake2b(repr(key).encode('utf-8'), digest_size=8).digest(), 'little')
+    return h or 1
+
+
+def write_snapshot(path, objects):
+    """Writes objects into a snapshot file.
+    :param path: path to the file.
+    :param objects: iterable with objects of the generated classes. Objects without key can only be
+                    read by iterating the snapshot.
+    :return: number of objects written.
+    """
+    types = {}
+    hashes, offsets = array('Q'), array('Q')
+    count = 0
+
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, 0, 0, 0, 0))
+
+        for obj in objects:
+            odata_type, values = obj.to_record()
+            if odata_type not in types:
+                types[odata_type] = len(types)
+            data = pickle.dumps(values, pickle.HIGHEST_PROTOCOL)
+
+            key = obj.get_key()
+            if key is not None:
+                hashes.append(key_hash(key))
+                offsets.append(f.tell())
+            f.write(RECORD.pack(types[odata_type], len(data)))
+            f.write(data)
+            count += 1
+
+        types_offset = f.tell()
+        f.write(dumps(sorted(types, key=types.get)).encode('utf-8'))
+
+        # Open addressing hash table, at most half full
+        table_size = 1
+        while table_size < 2 * len(hashes):
+            table_size *= 2
+        table = bytearray(table_size * SLOT.size)
+        mask = table_size - 1
+        for h, offset in zip(hashes, offsets):
+            slot = h & mask
+            while SLOT.unpack_from(table, slot * SLOT.size)[0]:
+                slot = (slot + 1) & mask
+            SLOT.pack_into(table, slot * SLOT.size, h, offset)
+
+        index_offset = f.tell()
+        f.write(table)
+
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, count, table_size, types_offset, index_offset))
+
+    return count
+
+
+class Snapshot(object):
+    """Read only access to a snapshot file. Records are decoded only when requested."""
+
+    def __init__(self, path):
+        """Opens the snapshot file.
+        :param path: path to the file.
+        """
+        self.path = path
+        self._file = open(path, 'rb')
+        if os.fstat(self._file.fileno()).st_size < HEADER.size:
+            self._file.close()
+            raise ValueError("File {} is not a snapshot.".format(path))
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, self.count, self.table_size, types_offset, self.index_offset = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError("File {} is not a snapshot.".format(path))
+        self.types = loads(self._map[types_offset:self.index_offset].decode('utf-8'))
+        self._records_end = types_offset
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def _decode(self, offset):
+        """Returns tuple (object of the record at the offset, offset of the next record)."""
+        type_index, length = RECORD.unpack_from(self._map, offset)
+        start = offset + RECORD.size
+        values = pickle.loads(self._map[start:start + length])
+        return OdataObjectBase.from_record((self.types[type_index], values)), start + length
+
+    def get(self, key):
+        """Returns the object with the key specified, or None if it's not in the snapshot.
+        :param key: value of the key property.
+        """
+        h = key_hash(key)
+        mask = self.table_size - 1
+        slot = h & mask
+        while True:
+            slot_hash, offset = SLOT.unpack_from(self._map, self.index_offset + slot * SLOT.size)
+            if not slot_hash:
+                return None
+            if slot_hash == h:
+                obj = self._decode(offset)[0]
+                if obj.get_key() == key:
+                    return obj
+            slot = (slot + 1) & mask
+
+    def __iter__(self):
+        """Iterates over all objects in the order they were written."""
+        offset = HEADER.size
+        while offset < self._records_end:
+            obj, offset = self._decode(offset)
+            yield obj
+
+    def close(self):
+        """Closes the file."""
+        self._map.close()
+        self._file.close()
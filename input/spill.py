@@ -0,0 +1,255 @@
+"""Collection of objects of the generated classes with a memory budget, spilling the oldest objects to a
+temporary segment file and reading them back when needed.
+
+Segment file layout: records like the ones of snapshot files, for each object the index of its odata type,
+the length of the values and the pickled tuple of values of its record, see OdataObjectBase.to_record().
+"""
+
+import os
+import pickle
+import sys
+from array import array
+from bisect import bisect_left
+from tempfile import TemporaryFile
+from .odata_object_base import OdataObjectBase
+from .snapshot import RECORD
+
+
+DEFAULT_MEMORY_BUDGET = 256 * 1024 * 1024
+DEFAULT_READ_AHEAD = 4 * 1024 * 1024
+DEFAULT_SAMPLE_EVERY = 64
+
+# Objects are spilled until the estimated memory is below this fraction of the budget
+SPILL_TARGET = 0.5
+
+
+def object_size(value):
+    """Returns estimated bytes of memory used by a value, including objects and lists in it."""
+    if isinstance(value, OdataObjectBase):
+        return sys.getsizeof(value) + sys.getsizeof(value.__dict__) + \
+            sum(object_size(v) for v in value.__dict__.values())
+    if isinstance(value, list):
+        return sys.getsizeof(value) + sum(object_size(v) for v in value)
+    if value is None or isinstance(value, bool):
+        return 0
+    return sys.getsizeof(value)
+
+
+class SpillCollection(object):
+    """List of objects of the generated classes that keeps in memory only the most recent ones.
+
+    When the estimated memory of the objects goes over the budget, the oldest ones are encoded as records and
+    appended to a segment file in a temporary directory, which is removed when the collection is closed.
+    Objects are read back from the file when they are accessed by position or key, or when the collection is
+    iterated. Iteration reads the file in blocks of read_ahead bytes, hinting the system to read the next block
+    in advance. Objects read from the file are new objects, changes made to them are not kept.
+
+    Memory of the objects is estimated by measuring one of every sample_every objects of each class.
+    Offsets of the records and the keys index use memory outside the budget, some tens of bytes per object.
+    """
+
+    def __init__(self, objects=(), memory_budget=DEFAULT_MEMORY_BUDGET, directory=None,
+                 read_ahead=DEFAULT_READ_AHEAD, index_keys=True, sample_every=DEFAULT_SAMPLE_EVERY):
+        """Initializes the collection.
+        :param objects: iterable with objects of the generated classes added to the collection. Optional.
+        :param memory_budget: maximum estimated bytes of the objects kept in memory.
+        :param directory: directory of the segment file. Defaults to the system temporary directory.
+        :param read_ahead: bytes read at once from the segment file when iterating.
+        :param index_keys: True to keep an index of the positions of the objects by key, used by get().
+        :param sample_every: memory of one of every sample_every objects of each class is measured.
+        """
+        if memory_budget < 0:
+            raise ValueError("Parameter memory_budget must not be negative.")
+        if read_ahead < 1:
+            raise ValueError("Parameter read_ahead must be a positive integer.")
+        if sample_every < 1:
+            raise ValueError("Parameter sample_every must be a positive integer.")
+
+        self.memory_budget = memory_budget
+        self.directory = directory
+        self.read_ahead = read_ahead
+        self.sample_every = sample_every
+
+        # Objects not spilled and their estimated sizes, they are the last ones of the collection
+        self._memory = []
+        self._sizes = array('Q')
+        self.memory_bytes = 0
+
+        # Segment file, created when the first objects are spilled. Offsets of the records and the end.
+        self._file = None
+        self._dirty = False
+        self._offsets = array('Q', [0])
+        self._types = []
+        self._type_indexes = {}
+
+        # Class: [objects added, estimated size]
+        self._estimates = {}
+        self._keys = {} if index_keys else None
+
+        # Statistics
+        self.spilled = 0
+        self.reads = 0
+
+        self.extend(objects)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return self.spilled + len(self._memory)
+
+    def __repr__(self):
+        return '<ODATA SPILL COLLECTION: {} objects, {} spilled>'.format(len(self), self.spilled)
+
+    ######################################################################
+
+    def _estimate(self, obj):
+        cls = type(obj)
+        estimate = self._estimates.get(cls)
+        if estimate is None:
+            estimate = self._estimates[cls] = [0, object_size(obj)]
+        elif not estimate[0] % self.sample_every:
+            # Moving average of the sampled objects
+            estimate[1] = (estimate[1] * 3 + object_size(obj)) // 4
+        estimate[0] += 1
+        return estimate[1]
+
+    def append(self, obj):
+        """Adds an object at the end of the collection, spilling the oldest ones if the budget is exceeded."""
+        if self._keys is not None:
+            key = obj.get_key()
+            if key is not None:
+                self._keys[key] = len(self)
+
+        size = self._estimate(obj)
+        self._memory.append(obj)
+        self._sizes.append(size)
+        self.memory_bytes += size
+        if self.memory_bytes > self.memory_budget:
+            self._spill()
+
+    def extend(self, objects):
+        """Adds the objects at the end of the collection."""
+        for obj in objects:
+            self.append(obj)
+
+    def _spill(self):
+        """Writes the oldest objects in memory to the segment file until the memory is below the target."""
+        if self._file is None:
+            self._file = TemporaryFile(prefix="odata-spill-", dir=self.directory)
+
+        target = self.memory_budget * SPILL_TARGET
+        count = 0
+        freed = 0
+        while count < len(self._memory) and self.memory_bytes - freed > target:
+            freed += self._sizes[count]
+            count += 1
+
+        chunks = []
+        offset = self._offsets[-1]
+        for obj in self._memory[:count]:
+            odata_type, values = obj.to_record()
+            if odata_type not in self._type_indexes:
+                self._type_indexes[odata_type] = len(self._types)
+                self._types.append(odata_type)
+            data = pickle.dumps(values, pickle.HIGHEST_PROTOCOL)
+            chunks.append(RECORD.pack(self._type_indexes[odata_type], len(data)))
+            chunks.append(data)
+            offset += RECORD.size + len(data)
+            self._offsets.append(offset)
+        self._file.write(b''.join(chunks))
+        self._dirty = True
+
+        del self._memory[:count]
+        del self._sizes[:count]
+        self.memory_bytes -= freed
+        self.spilled += count
+
+    ######################################################################
+
+    def _read(self, start, end):
+        """Returns the bytes of the segment file between the offsets."""
+        if self._dirty:
+            self._file.flush()
+            self._dirty = False
+        self.reads += 1
+        return os.pread(self._file.fileno(), end - start, start)
+
+    def _decode_records(self, data, count):
+        """Generator of the objects of the first count records in data."""
+        offset = 0
+        for _ in range(count):
+            type_index, length = RECORD.unpack_from(data, offset)
+            start = offset + RECORD.size
+            offset = start + length
+            yield OdataObjectBase.from_record((self._types[type_index], pickle.loads(data[start:offset])))
+
+    def __getitem__(self, position):
+        """Returns the object at the position. Negative positions are supported."""
+        if position < 0:
+            position += len(self)
+        if not 0 <= position < len(self):
+            raise IndexError("Collection position out of range.")
+        if position >= self.spilled:
+            return self._memory[position - self.spilled]
+        data = self._read(self._offsets[position], self._offsets[position + 1])
+        return next(self._decode_records(data, 1))
+
+    def __iter__(self):
+        """Iterates over the objects in the order they were added. Spilled objects are read in blocks."""
+        count = len(self)
+        spilled = self.spilled
+        position = 0
+        fadvise = getattr(os, 'posix_fadvise', None)
+
+        while position < spilled:
+            # Block of whole records of about read_ahead bytes
+            start = self._offsets[position]
+            end_position = min(max(bisect_left(self._offsets, start + self.read_ahead, position + 1), position + 1),
+                               spilled)
+            end = self._offsets[end_position]
+            data = self._read(start, end)
+
+            if fadvise is not None and end_position < spilled:
+                fadvise(self._file.fileno(), end, self.read_ahead, os.POSIX_FADV_WILLNEED)
+
+            for obj in self._decode_records(data, end_position - position):
+                yield obj
+            position = end_position
+
+        # Objects in memory when the iteration started, they may have been spilled since
+        for position in range(spilled, count):
+            yield self[position]
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def get(self, key):
+        """Returns the last object added with the key specified, or None if there is none."""
+        if self._keys is not None:
+            position = self._keys.get(key)
+            return self[position] if position is not None else None
+        result = None
+        for obj in self:
+            if obj.get_key() == key:
+                result = obj
+        return result
+
+    def file_bytes(self):
+        """Returns size of the segment file."""
+        return self._offsets[-1]
+
+    def close(self):
+        """Removes the segment file and the objects of the collection."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._memory = []
+        self._sizes = array('Q')
+        self._offsets = array('Q', [0])
+        self._keys = {} if self._keys is not None else None
+        self.memory_bytes = 0
+        self.spilled = 0
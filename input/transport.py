@@ -0,0 +1,103 @@
+"""HTTP transport with a pool of keep-alive connections to the odata service."""
+
+from http.client import HTTPConnection, HTTPSConnection, HTTPException
+from urllib.parse import urlsplit, urljoin
+from queue import LifoQueue, Empty, Full
+from json import loads
+
+
+def decode_json(data):
+    """Returns json bytes decoded, or None if there is no data."""
+    return loads(data.decode('utf-8')) if data else None
+
+
+class HttpTransport(object):
+    """Sends requests to a single odata service reusing a bounded pool of keep-alive connections.
+    It is safe to use from several threads at once.
+    """
+
+    def __init__(self, service_url, headers=None, max_connections=4, timeout=60):
+        """Initializes the transport.
+        :param service_url: service root url, i.e. "https://graph.microsoft.com/v1.0/".
+        :param headers: dictionary with http headers sent on every request, i.e. Authorization. Optional.
+        :param max_connections: number of connections kept open.
+        :param timeout: socket timeout in seconds.
+        """
+        self.service_url = service_url.rstrip('/') + '/'
+        self.headers = dict(headers) if headers else {}
+        self.max_connections = max_connections
+        self.timeout = timeout
+
+        url = urlsplit(self.service_url)
+        self._scheme = url.scheme
+        self._netloc = url.netloc
+        self._connection_class = HTTPSConnection if url.scheme == "https" else HTTPConnection
+        self._pool = LifoQueue(maxsize=max_connections)
+
+    def _get_connection(self):
+        try:
+            return self._pool.get_nowait()
+        except Empty:
+            return self._connection_class(self._netloc, timeout=self.timeout)
+
+    def _release_connection(self, connection):
+        try:
+            self._pool.put_nowait(connection)
+        except Full:
+            connection.close()
+
+    def url(self, url):
+        """Returns absolute url for an url relative to the service root."""
+        return urljoin(self.service_url, url.lstrip('/')) if not urlsplit(url).scheme else url
+
+    def request(self, method, url, body=None, headers=None):
+        """Sends a request and returns the response.
+        :param method: http method.
+        :param url: url relative to the service root or absolute url of the same service.
+        :param body: bytes sent as body. Optional.
+        :param headers: dictionary with additional http headers. Optional.
+        :return: tuple (status, headers dictionary with lower case names, body bytes).
+        """
+        url = urlsplit(self.url(url))
+        if url.netloc != self._netloc:
+            raise ValueError("Url {} is not part of the service {}.".format(url.geturl(), self.service_url))
+        path = url.path + ("?" + url.query if url.query else "")
+
+        all_headers = dict(self.headers)
+        if headers:
+            all_headers.update(headers)
+
+        # A connection kept in the pool may have been closed by the server, retry once with a new one
+        for attempt in range(2):
+            connection = self._get_connection()
+            try:
+                connection.request(method, path, body=body, headers=all_headers)
+                response = connection.getresponse()
+                data = response.read()
+            except (HTTPException, ConnectionError):
+                connection.close()
+                if attempt:
+                    raise
+                continue
+
+            response_headers = {k.lower(): v for k, v in response.getheaders()}
+            if response.will_close:
+                connection.close()
+            else:
+                self._release_connection(connection)
+            return response.status, response_headers, data
+
+    def request_json(self, method, url, body=None, headers=None):
+        """Sends a request and returns the response body decoded from json.
+        :return: tuple (status, headers dictionary, decoded body or None if the response has no body).
+        """
+        status, response_headers, data = self.request(method, url, body, headers)
+        return status, response_headers, decode_json(data)
+
+    def close(self):
+        """Closes all pooled connections."""
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except Empty:
+                break
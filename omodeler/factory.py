@@ -4,20 +4,34 @@ Licensed under the MIT License.
 
 from . import metadata
 from urllib.request import urlretrieve
-from keyword import iskeyword
 from string import Template
-from shutil import copyfile
+from shutil import copyfile, rmtree
+from hashlib import sha256
+from py_compile import compile as compile_file, PycInvalidationMode
+from tempfile import TemporaryDirectory
+from zipfile import ZipFile, ZipInfo, ZIP_DEFLATED
+import compileall
 import logging
 import json
+import os
 
 
 BASE_CLASS = "OdataObjectBase"
 EXTENSION_FILENAME = "extension.py"
+RUNTIME_FILENAMES = ("session.py", "query.py", "request.py", "transport.py", "batch.py",
+                     "async_client.py", "bulk.py", "cache.py",
+                     "snapshot.py", "diff.py", "export.py", "instrumentation.py",
+                     "shared_store.py", "reload.py", "planner.py",
+                     "delta.py", "spill.py", "decoder.py")
 METADATA_FILENAME = "metadata.xml"
 CLASSES_FILENAME = "classes.json"
 SETS_FILENAME = "sets.json"
 ODATA_TYPES_FILENAME = "odata_types.json"
+MANIFEST_FILENAME = "manifest.json"
+STAGING_SUFFIX = ".staging"
+GENERATION_SUFFIX = ".generation-"
 MODULE_DOCSTRING = '"""Written by odataPyModel."""'
+ZIP_DATE_TIME = (1980, 1, 1, 0, 0, 0)
 
 
 def camel_to_lowercase(name):
@@ -25,12 +39,7 @@ def camel_to_lowercase(name):
     :param name: string with name in thisFormat
     :return: string with name in this_format
     """
-    name = name[0].lower() + name[1:]
-    name = ''.join(["_" + c.lower() if c.isupper() else c for c in name])
-
-    while iskeyword(name):
-        name = "_" + name
-    return name
+    return metadata.pythonize_attribute(name)
 
 
 class ClassFactory(object):
@@ -49,8 +58,13 @@ class ClassFactory(object):
 
         self.odata_types = {}
         self.odata_containers = {}
+        self.odata_entity_sets = {}
+        self.odata_bases = {}
         self.odata_properties = {}
+        self.odata_navigation = {}
+        self.odata_capabilities = {}
         self.classes = {}
+        self._import_lines = {}
 
         # Download metadata file
         urlretrieve(metadata_url, self.metadata_file)
@@ -60,10 +74,10 @@ class ClassFactory(object):
 
         # Save model to json file for review
         with open(self.temp_location + CLASSES_FILENAME, 'w') as f:
-            json.dump(self.metadata.classes, f, indent=4)
+            json.dump(metadata.to_dict(self.metadata.classes), f, indent=4)
 
         with open(self.temp_location + SETS_FILENAME, 'w') as f:
-            json.dump(self.metadata.sets, f, indent=4)
+            json.dump(metadata.to_dict(self.metadata.sets), f, indent=4)
 
         with open(self.temp_location + ODATA_TYPES_FILENAME, 'w') as f:
             json.dump(self.metadata.odata_types, f, indent=4)
@@ -125,35 +139,38 @@ class $class_name(str):
 
     def add_complextype(self, name, schema):
 
-        d_prop = {}
-        for k, v in {np.odata_name: np.odata_type for np in schema.navigation_properties.values()}.items():
-            d_prop[k] = v.replace("Collection(", "").rstrip(')')
-        for k, v in {np.odata_name: np.odata_type for np in schema.properties.values()}.items():
-            d_prop[k] = v.replace("Collection(", "").rstrip(')')
-        self.odata_properties[schema['odata_name']] = d_prop
+        self.odata_properties[schema.odata_name] = self.metadata.type_index[schema.odata_name].property_types
+        self.odata_bases[schema.odata_name] = None
+        self.add_navigation_properties(schema)
 
         imports = [self.get_import_line(BASE_CLASS)]
 
-        odata_properties = {value['odata_name']: key for (key, value) in schema.properties.items()}
+        odata_properties = {value.odata_name: key for (key, value) in schema.properties.items()}
 
         attributes = "# Properties\n"
         for p_name, p_item in schema.properties.items():
             attributes += "        self." + p_name + " = "
 
             # Find out if it's a list and get the type
-            if p_item['python_type'].startswith('*'):
+            if p_item.python_type.startswith('*'):
                 is_list = True
-                p_type = p_item['python_type'][1:]
+                p_type = p_item.python_type[1:]
             else:
                 is_list = False
-                p_type = p_item['python_type']
+                p_type = p_item.python_type
 
-            # Collect necessary imports
-            import_line = self.get_import_line(p_type)
+            # Collect necessary imports, generated classes are resolved when first used
+            if p_type in self.metadata.classes:
+                p_type = "resolve_class('" + p_type + "')"
+                import_line = self.get_import_line("resolve_class")
+            else:
+                import_line = self.get_import_line(p_type)
             if import_line and import_line not in imports:
                 imports.append(import_line)
 
-            if is_list:
+            if is_list and p_type.startswith("resolve_class("):
+                attributes += "list(map(" + p_type + ", properties['" + p_name + "']))"
+            elif is_list:
                 attributes += "[" + p_type + "(prop) for prop in properties['" + p_name + "']]"
             else:
                 attributes += p_type + "(properties['" + p_name + "'])"
@@ -193,39 +210,58 @@ class $class_name($base_class_name):
                       'base_class_name': BASE_CLASS,
                       'imports': str_imports,
                       'odata_name': schema.odata_name,
-                      'python_properties': str(schema.properties).replace('}, ', '},\n' + ' ' * 24),
+                      'python_properties': str(metadata.to_dict(schema.properties)).replace('}, ', '},\n' + ' ' * 24),
                       'odata_properties': str(odata_properties).replace(', ', ',\n' + ' ' * 30),
                       'attributes': attributes,
                       'module_docstring': MODULE_DOCSTRING}
 
         self.classes[name] = Template(str_class).substitute(dic_values)
 
-    '''
-    def action_name(self, param1, param2, paramN):
-
-        # https://developer.microsoft.com/en-us/graph/docs/api-reference/beta/api/user_assignlicense
-        POST / users / {id | userPrincipalName} / assignLicense
-
-        POST
-        https: // graph.microsoft.com / beta / me / assignLicense
-        Content - type: application / json
-        Content - length: 185
-
-        {
-            "addLicenses": [
-                {
-                    "disabledPlans": ["11b0131d-43c8-4bbb-b2c8-e80f9a50834a"],
-                    "skuId": "skuId-value"
-                }
-            ],
-            "removeLicenses": ["bea13e0c-3828-4daa-a392-28af7ff61a0f"]
-        }
-    '''
+    ######################################################################
+
+    def get_operation_methods(self, schema):
+        """Returns code of the methods creating requests for the bound actions and functions of the type."""
+        str_methods = ""
+
+        operations = [(name, op, "action") for name, op in schema.actions.items()]
+        operations += [(name, op, "function") for name, op in schema.functions.items()]
+
+        for op_name, op, op_kind in operations:
+
+            str_method = '''
+    def $method_name(self$arguments):
+        """Returns request for bound $op_kind $odata_name
+        :return: OdataRequest object
+        """
+        return self.${op_kind}_request('$odata_name', {$parameters}, $returns)
+'''
+            dic_values = {'method_name': op_name,
+                          'op_kind': op_kind,
+                          'odata_name': op.odata_name,
+                          'arguments': "".join([", " + p_name + "=None" for p_name in op.parameters]),
+                          'parameters': ", ".join(["'" + p.odata_name + "': " + p_name
+                                                   for p_name, p in op.parameters.items()]),
+                          'returns': "'" + op.odata_returns + "'" if op.odata_returns else "None"}
+
+            str_methods += Template(str_method).substitute(dic_values)
+
+        return str_methods
+
+    ######################################################################
+
+    def add_navigation_properties(self, schema):
+        """Adds the navigation properties declared by the type to the ODATA_NAVIGATION_PROPERTY dictionary."""
+        if schema.navigation_properties:
+            self.odata_navigation[schema.odata_name] = {prop.odata_name: (name, prop.odata_type)
+                                                        for name, prop in schema.navigation_properties.items()}
 
     ######################################################################
 
     def add_entityset(self, name, schema):
         self.odata_containers[schema.odata_name] = schema.odata_entity_type.lstrip('*')
+        self.odata_entity_sets.setdefault(schema.odata_entity_type.lstrip('*'), schema.odata_name)
+        if schema.capabilities:
+            self.odata_capabilities[schema.odata_name] = schema.capabilities
 
     '''
     < EntitySet    Name = "users"    EntityType = "microsoft.graph.user" >
@@ -243,64 +279,77 @@ class $class_name($base_class_name):
 
     def add_singleton(self, name, schema):
         self.odata_containers[schema.odata_name] = schema.odata_entity_type.lstrip('*')
+        if schema.capabilities:
+            self.odata_capabilities[schema.odata_name] = schema.capabilities
 
     ######################################################################
 
     def get_import_line(self, object_type):
         """Returns string with import line for the type."""
-        if object_type in ("str", "int", "float", "bool", "bytes"):
+        if object_type in self._import_lines:
+            return self._import_lines[object_type]
+
+        if object_type in self.metadata.class_index:
+            output = self.metadata.class_index[object_type].import_line
+
+        elif object_type in ("str", "int", "float", "bool", "bytes"):
             output = None
 
         elif object_type in ("time", "date", "datetime", "timedelta"):
             output = "from datetime import " + object_type
 
-        elif object_type == "Guid":
-            output = "from .{} import Guid".format(camel_to_lowercase(BASE_CLASS))
+        elif object_type in ("Guid", "resolve_class"):
+            output = "from .{} import {}".format(camel_to_lowercase(BASE_CLASS), object_type)
 
         else:
             type_file = camel_to_lowercase(object_type)
             output = "from ." + type_file + " import " + object_type
 
+        self._import_lines[object_type] = output
         return output
 
     ######################################################################
 
     def add_entitytype(self, name, schema):
 
-        d_prop = {}
         attributes = "# Properties\n"
 
-        # Build ODATA_PROPERTY_TYPE dictionary
-        for k, v in {np.odata_name: np.odata_type for np in schema.navigation_properties.values()}.items():
-            d_prop[k] = v.replace("Collection(", "").rstrip(')')
-        for k, v in {np.odata_name: np.odata_type for np in schema.properties.values()}.items():
-            d_prop[k] = v.replace("Collection(", "").rstrip(')')
-        self.odata_properties[schema['odata_name']] = d_prop
+        # ODATA_PROPERTY_TYPE dictionary and base type come from the type index
+        type_info = self.metadata.type_index[schema.odata_name]
+        self.odata_properties[schema.odata_name] = type_info.property_types
+        self.odata_bases[schema.odata_name] = type_info.base
+        self.add_navigation_properties(schema)
 
         base_class_name = schema.base if schema.base else BASE_CLASS
         imports = [self.get_import_line(base_class_name)]
 
         # Build value for valid_odata_properties
-        odata_properties = {value['odata_name']: key for (key, value) in schema.properties.items()}
+        odata_properties = {value.odata_name: key for (key, value) in schema.properties.items()}
 
         # Build class attributes assigment code
         for p_name, p_item in schema.properties.items():
             attributes += "        self." + p_name + " = "
 
             # Find out if it's a list and get the type
-            if p_item['python_type'].startswith('*'):
+            if p_item.python_type.startswith('*'):
                 is_list = True
-                p_type = p_item['python_type'][1:]
+                p_type = p_item.python_type[1:]
             else:
                 is_list = False
-                p_type = p_item['python_type']
+                p_type = p_item.python_type
 
-            # Collect necessary imports
-            import_line = self.get_import_line(p_type)
+            # Collect necessary imports, generated classes are resolved when first used
+            if p_type in self.metadata.classes:
+                p_type = "resolve_class('" + p_type + "')"
+                import_line = self.get_import_line("resolve_class")
+            else:
+                import_line = self.get_import_line(p_type)
             if import_line not in imports:
                 imports.append(import_line)
 
-            if is_list:
+            if is_list and p_type.startswith("resolve_class("):
+                attributes += "list(map(" + p_type + ", properties['" + p_name + "']))"
+            elif is_list:
                 attributes += "[" + p_type + "(prop) for prop in properties['" + p_name + "']]"
             else:
                 attributes += p_type + "(properties['" + p_name + "'])"
@@ -314,7 +363,7 @@ class $class_name($base_class_name):
     """Represents odata entity type object: $odata_name""" 
 
     odata = '$odata_name'
-    valid_odata_properties = $odata_properties
+$key_property    valid_odata_properties = $odata_properties
     valid_properties = $python_properties
 
     def __init__(self, odata_properties={}, **kwargs):
@@ -336,13 +385,15 @@ class $class_name($base_class_name):
             raise ValueError("Positional parameter 'odata_properties' must be a dictionary.")\n'''
 
         str_class += '''\n        $attributes\n'''
-        str_class += '''        if kwargs:\n            self.set(**kwargs)\n\n'''
+        str_class += '''        if kwargs:\n            self.set(**kwargs)\n'''
+        str_class += self.get_operation_methods(schema).replace('$', '$$') + '\n'
 
         dic_values = {'class_name': name,
                       'base_class_name': base_class_name,
                       'imports': str_imports,
                       'odata_name': schema.odata_name,
-                      'python_properties': str(schema.properties).replace('}, ', '},\n' + ' ' * 24),
+                      'key_property': "    key_property = '" + schema.key_property + "'\n" if schema.key_property else "",
+                      'python_properties': str(metadata.to_dict(schema.properties)).replace('}, ', '},\n' + ' ' * 24),
                       'odata_properties': str(odata_properties).replace(', ', ',\n' + ' ' * 30),
                       'attributes': attributes,
                       'module_docstring': MODULE_DOCSTRING}
@@ -351,29 +402,64 @@ class $class_name($base_class_name):
 
     ######################################################################
 
-    def save(self, output_loc):
+    def get_type_hierarchy(self):
+        """Returns inheritance index of the entity types.
+        :return: tuple of two dictionaries: odata type: sorted list of the type and all types derived from it,
+                 and odata type: depth in the hierarchy, 0 for types without base.
+        """
+        derived = {name: [name] for name in self.odata_bases}
+        depth = {}
+        for name in self.odata_bases:
+            base = self.odata_bases[name]
+            depth[name] = 0
+            while base:
+                derived[base].append(name)
+                depth[name] += 1
+                base = self.odata_bases[base]
+        return {name: sorted(types) for name, types in derived.items()}, depth
+
+    ######################################################################
+
+    def get_table_type(self, python_type):
+        """Returns the python type as written in the tables of the extension file: the name of generated
+        classes as a string, see ClassTable, other types as they are.
+        :param python_type: name of the python type.
+        """
+        if python_type in self.classes:
+            return "'" + python_type + "'"
+        return python_type
+
+    def save(self, output_loc, compile_bytecode=False, zip_path=None):
         """Saves classes into module files
         :param output_loc: path to directory where files will be saved
+        :param compile_bytecode: True to also write hash based .pyc files, so they are never compiled on import
+        :param zip_path: path to a zip file to write with the package compiled, to be imported with zipimport.
+                         The package name is the name of the output directory. Optional.
         """
-        # string containing imports to all classes
-        str_package = ""
-
         # object classes files
         for class_name, str_class in self.classes.items():
-            file_name = camel_to_lowercase(class_name)
-            str_package += "from ." + file_name + " import " + class_name + "\n"
+            file_name = self.metadata.class_index[class_name].module_name
             with open(output_loc + file_name + ".py", 'w') as f:
                 f.write(str_class)
 
-        # __init__.py
+        # __init__.py, classes are imported when first used
         copyfile(self.input_location + "__init__.py",output_loc + "__init__.py")
         with open(output_loc + "__init__.py", 'a') as f:
-            f.write(str_package)
+            f.write("\nCLASS_MODULES = {")
+            f.write((",\n" + " " * 17).join("'" + class_name + "': '" +
+                                             self.metadata.class_index[class_name].module_name + "'"
+                                             for class_name in self.classes))
+            f.write("}\n\n")
+            f.write("__all__ = [name for name in dir() if not name.startswith('_')] + list(CLASS_MODULES)\n")
 
         # object base file
         base_class_file = camel_to_lowercase(BASE_CLASS) + ".py"
         copyfile(self.input_location + base_class_file, output_loc + base_class_file)
 
+        # runtime support files
+        for file_name in RUNTIME_FILENAMES:
+            copyfile(self.input_location + file_name, output_loc + file_name)
+
         # extension file
         copyfile(self.input_location + EXTENSION_FILENAME, output_loc + EXTENSION_FILENAME)
         with open(output_loc + EXTENSION_FILENAME, 'a') as f:
@@ -383,9 +469,33 @@ class $class_name($base_class_name):
                 f.write("'" + k + "': '" + v + "',\n                        ")
             f.write("}\n\n")
 
-            f.write("ODATA_TYPE_TO_PYTHON = {")
+            f.write("ODATA_ENTITY_SET = {")
+            for k, v in self.odata_entity_sets.items():
+                f.write("'" + k + "': '" + v + "',\n                    ")
+            f.write("}\n\n")
+
+            # Generated classes by name, imported when first looked up
+            f.write("ODATA_TYPE_TO_PYTHON = ClassTable({")
             for k, v in self.metadata.odata_types.items():
-                f.write("'" + k + "': " + v + ",\n                        ")
+                f.write("'" + k + "': " + self.get_table_type(v) + ",\n                                   ")
+            f.write("})\n\n")
+
+            f.write("ODATA_TYPE_DISPATCH = ClassTable({")
+            for k in self.odata_bases:
+                v = self.get_table_type(self.metadata.odata_types[k])
+                f.write("'" + k + "': " + v + ",\n                                  ")
+                f.write("'#" + k + "': " + v + ",\n                                  ")
+            f.write("})\n\n")
+
+            derived_types, type_depth = self.get_type_hierarchy()
+            f.write("ODATA_DERIVED_TYPES = {")
+            for k, types in derived_types.items():
+                f.write("'" + k + "': frozenset(" + str(types) + "),\n                       ")
+            f.write("}\n\n")
+
+            f.write("ODATA_TYPE_DEPTH = {")
+            for k, v in type_depth.items():
+                f.write("'" + k + "': " + str(v) + ",\n                    ")
             f.write("}\n\n")
 
             f.write("ODATA_PROPERTY_TYPE = {")
@@ -396,5 +506,135 @@ class $class_name($base_class_name):
                 f.write("                           },\n                       ")
             f.write("}\n\n")
 
+            f.write("ODATA_NAVIGATION_PROPERTY = {")
+            for obj, d in self.odata_navigation.items():
+                f.write("'" + obj + "': {\n")
+                for p, (n, t) in d.items():
+                    f.write("                                 '" + p + "': ('" + n + "', '" + t + "'),\n")
+                f.write("                                 },\n                             ")
+            f.write("}\n\n")
+
+            f.write("ODATA_CAPABILITIES = {")
+            for k, v in self.odata_capabilities.items():
+                f.write("'" + k + "': " + str(v) + ",\n                      ")
+            f.write("}\n\n")
+
+        self.save_manifest(output_loc)
+
+        if compile_bytecode:
+            self.save_bytecode(output_loc)
 
+        if zip_path:
+            self.save_zip(output_loc, zip_path)
 
+    def save_staged(self, output_loc, compile_bytecode=False, zip_path=None):
+        """Saves classes into a new generation directory next to output_loc and publishes it atomically:
+        output_loc is a symbolic link to the current generation, replaced with a single rename. Processes
+        importing the package see either the previous or the new package, never a partial or missing one.
+        The previous generation is kept for imports in progress, older ones are removed.
+        :param output_loc: path of the symbolic link to the package. It can't be a directory.
+        :param compile_bytecode: True to also write hash based .pyc files, see save()
+        :param zip_path: path to a zip file to write with the package compiled, see save(). Optional.
+        """
+        output_dir = os.path.normpath(output_loc)
+        if os.path.isdir(output_dir) and not os.path.islink(output_dir):
+            raise ValueError("Can't publish over directory {}, remove it or use save().".format(output_dir))
+
+        generation_dir = self.make_generation_dir(output_dir)
+        self.save(generation_dir + os.sep, compile_bytecode)
+        if zip_path:
+            staging_zip = zip_path + STAGING_SUFFIX
+            self.save_zip(generation_dir + os.sep, staging_zip, os.path.basename(output_dir))
+            os.replace(staging_zip, zip_path)
+
+        # Relative target so the directories can be moved together
+        staging_link = output_dir + STAGING_SUFFIX
+        if os.path.lexists(staging_link):
+            os.remove(staging_link)
+        os.symlink(os.path.basename(generation_dir), staging_link)
+        os.replace(staging_link, output_dir)
+
+        for old_dir in self.generation_dirs(output_dir)[:-2]:
+            rmtree(old_dir, ignore_errors=True)
+
+    @staticmethod
+    def generation_dirs(output_dir):
+        """Returns list of the generation directories of the package, oldest first.
+        :param output_dir: path of the symbolic link to the package
+        """
+        parent, name = os.path.split(output_dir)
+        prefix = name + GENERATION_SUFFIX
+        numbers = sorted(int(file_name[len(prefix):]) for file_name in os.listdir(parent or os.curdir)
+                         if file_name.startswith(prefix) and file_name[len(prefix):].isdigit())
+        return [os.path.join(parent, prefix + str(number)) for number in numbers]
+
+    @classmethod
+    def make_generation_dir(cls, output_dir):
+        """Creates and returns the directory of the next generation of the package.
+        :param output_dir: path of the symbolic link to the package
+        """
+        existing = cls.generation_dirs(output_dir)
+        number = int(existing[-1].rsplit(GENERATION_SUFFIX, 1)[1]) + 1 if existing else 1
+        while True:
+            generation_dir = output_dir + GENERATION_SUFFIX + str(number)
+            try:
+                os.mkdir(generation_dir)
+                return generation_dir
+            except FileExistsError:
+                # Another generator created it
+                number += 1
+
+    ######################################################################
+
+    @staticmethod
+    def save_manifest(output_loc):
+        """Writes the manifest of the package: sha256 hash of each module, used to reload only
+        the modules that changed in a new generation of the package.
+        :param output_loc: path to directory of the package
+        """
+        modules = {}
+        for file_name in sorted(os.listdir(output_loc)):
+            if file_name.endswith(".py"):
+                with open(os.path.join(output_loc, file_name), 'rb') as f:
+                    modules[file_name[:-3]] = sha256(f.read()).hexdigest()
+
+        with open(os.path.join(output_loc, MANIFEST_FILENAME), 'w') as f:
+            json.dump({'modules': modules}, f, indent=4)
+
+    ######################################################################
+
+    @staticmethod
+    def save_bytecode(output_loc):
+        """Compiles the package modules into __pycache__ with hash based .pyc files, which are
+        reproducible and validated against the source hash instead of its timestamp.
+        :param output_loc: path to directory of the package
+        """
+        if not compileall.compile_dir(output_loc, maxlevels=0, quiet=1, force=True,
+                                      invalidation_mode=PycInvalidationMode.CHECKED_HASH):
+            raise ValueError("Failed to compile package in " + output_loc)
+
+    @staticmethod
+    def save_zip(output_loc, zip_path, package=None):
+        """Writes the package compiled into a zip file containing only .pyc files. Adding the zip file
+        to sys.path allows importing the package through zipimport. The zip file is reproducible.
+        :param output_loc: path to directory of the package
+        :param zip_path: path to the zip file
+        :param package: name of the package. Defaults to the name of the directory.
+        """
+        package = package or os.path.basename(os.path.normpath(output_loc))
+
+        with TemporaryDirectory() as temp_dir, ZipFile(zip_path, 'w', ZIP_DEFLATED) as zip_file:
+            for file_name in sorted(os.listdir(output_loc)):
+                if not file_name.endswith(".py"):
+                    continue
+
+                pyc_file = os.path.join(temp_dir, file_name + "c")
+                compile_file(os.path.join(output_loc, file_name), cfile=pyc_file,
+                             dfile=package + "/" + file_name, doraise=True,
+                             invalidation_mode=PycInvalidationMode.UNCHECKED_HASH)
+
+                # Fixed timestamp so the same package always produces the same zip file
+                info = ZipInfo(package + "/" + file_name + "c", date_time=ZIP_DATE_TIME)
+                info.compress_type = ZIP_DEFLATED
+                with open(pyc_file, 'rb') as f:
+                    zip_file.writestr(info, f.read())
@@ -1,127 +1,250 @@
 import xml.etree.ElementTree as ET
 import logging
 from keyword import iskeyword
+from sys import intern
 
 XMLNS = "{http://docs.oasis-open.org/odata/ns/edm}"
+EDMX_XMLNS = "{http://docs.oasis-open.org/odata/ns/edmx}"
+
+CAPABILITIES_NAMESPACE = "Org.OData.Capabilities.V1"
+
+# Capability terms: record property or None for terms with a single value: capability name.
+# Collections are lists of property paths, or of names for FilterFunctions.
+CAPABILITY_TERMS = {'FilterRestrictions': {'Filterable': 'filterable',
+                                           'RequiresFilter': 'requires_filter',
+                                           'RequiredProperties': 'required_filter_properties',
+                                           'NonFilterableProperties': 'non_filterable_properties'},
+                    'FilterFunctions': {None: 'filter_functions'},
+                    'SortRestrictions': {'Sortable': 'sortable',
+                                         'NonSortableProperties': 'non_sortable_properties'},
+                    'TopSupported': {None: 'top_supported'},
+                    'SkipSupported': {None: 'skip_supported'},
+                    'CountRestrictions': {'Countable': 'countable'},
+                    'SearchRestrictions': {'Searchable': 'searchable'},
+                    'SelectSupport': {'Supported': 'selectable'},
+                    'ExpandRestrictions': {'Expandable': 'expandable',
+                                           'NonExpandableProperties': 'non_expandable_properties'}}
+
+# Elements of annotation values
+EXPRESSION_TAGS = ('Record', 'Collection', 'Bool', 'Int', 'String', 'EnumMember', 'PropertyPath',
+                   'NavigationPropertyPath')
+
+# Memoized translations of attribute names, the same names appear in many types
+_python_attributes = {}
+
+
+def pythonize_attribute(name):
+    """
+    Convert name into python attribute format
+    :param name: string with name in thisFormat
+    :return: string with name in this_format
+    """
+    try:
+        return _python_attributes[name]
+    except KeyError:
+        pass
+
+    python_name = name[0].lower() + name[1:]
+    python_name = ''.join(["_" + c.lower() if c.isupper() else c for c in python_name])
+
+    while iskeyword(python_name):
+        python_name = "_" + python_name
+
+    _python_attributes[name] = python_name = intern(python_name)
+    return python_name
+
+
+def to_dict(value):
+    """Returns value with all model objects converted to dictionaries, for json serialization."""
+    if isinstance(value, ModelObject):
+        return value.to_dict()
+    elif isinstance(value, dict):
+        return {k: to_dict(v) for k, v in value.items()}
+    elif isinstance(value, list):
+        return [to_dict(v) for v in value]
+    return value
+
+
+def annotation_value(element):
+    """Returns value of an annotation or a record property element: bool, int, string, list of the values
+    of a collection or dictionary property name: value of a record. None if the element has no value.
+    :param element: Annotation or PropertyValue XML element.
+    """
+    for attribute, convert in (('Bool', lambda v: v == 'true'), ('Int', int), ('String', str),
+                               ('EnumMember', str), ('PropertyPath', str), ('NavigationPropertyPath', str)):
+        if attribute in element.attrib:
+            return convert(element.attrib[attribute])
+
+    # Annotations of the annotation are skipped
+    for child in element:
+        if child.tag.replace(XMLNS, '') in EXPRESSION_TAGS:
+            return expression_value(child)
+    return None
+
+
+def expression_value(element):
+    """Returns value of an expression element: Record, Collection or constant.
+    Elements of a collection are taken before its text, which is only whitespace in indented documents.
+    :param element: XML element with one of EXPRESSION_TAGS.
+    """
+    tag = element.tag.replace(XMLNS, '')
+    if tag == 'Record':
+        return {e.attrib['Property']: annotation_value(e) for e in element.findall(XMLNS + 'PropertyValue')}
+    if tag == 'Collection':
+        return [expression_value(e) for e in element if e.tag.replace(XMLNS, '') in EXPRESSION_TAGS]
+    text = (element.text or '').strip()
+    if tag == 'Bool':
+        return text == 'true'
+    if tag == 'Int':
+        return int(text)
+    return text
+
+
+def capabilities_of(annotations, term_prefixes):
+    """Returns dictionary capability name: value with the capability terms of the annotations.
+    :param annotations: list of Annotation XML elements.
+    :param term_prefixes: namespace of the capabilities vocabulary and its aliases.
+    """
+    capabilities = {}
+    for e_annotation in annotations:
+        prefix, _, term = e_annotation.attrib.get('Term', '').rpartition('.')
+        if prefix not in term_prefixes or term not in CAPABILITY_TERMS or 'Qualifier' in e_annotation.attrib:
+            continue
+        value = annotation_value(e_annotation)
+        for record_property, name in CAPABILITY_TERMS[term].items():
+            if record_property is not None:
+                if not isinstance(value, dict) or value.get(record_property) is None:
+                    continue
+                property_value = value[record_property]
+            else:
+                property_value = value
+            if property_value is not None:
+                capabilities[name] = tuple(property_value) if isinstance(property_value, list) else property_value
+    return capabilities
+
+
+class ModelObject(object):
+    """Base of the model objects. Fields are declared in __slots__ of each class."""
+    __slots__ = ()
+
+    def to_dict(self):
+        """Returns dictionary with the fields of the object."""
+        output = {}
+        for c in reversed(type(self).__mro__):
+            for name in c.__dict__.get('__slots__', ()):
+                output[name] = to_dict(getattr(self, name))
+        return output
+
+    def __str__(self):
+        return str(self.to_dict())
 
 
-class OdataFunction(dict):
+class OdataFunction(ModelObject):
+    __slots__ = ('odata_name', 'returns', 'odata_returns', 'parameters')
+
     def __init__(self,
+                 odata_name,
                  returns=None,
+                 odata_returns=None,
                  parameters=None):
-        super().__init__()
-        self['returns'] = returns
-        self['parameters'] = parameters
+        self.odata_name = odata_name
+        self.returns = returns
+        self.odata_returns = odata_returns
+        self.parameters = parameters
 
 
-class OdataProperty(dict):
+class OdataProperty(ModelObject):
+    __slots__ = ('python_type', 'odata_name', 'odata_type')
+
     def __init__(self,
                  python_type,
                  odata_name,
                  odata_type):
-        super().__init__()
-        self['python_type'] = python_type
-        self['odata_name'] = odata_name
-        self['odata_type'] = odata_type
-
-    @property
-    def python_type(self):
-        return self['python_type']
+        self.python_type = python_type
+        self.odata_name = odata_name
+        self.odata_type = odata_type
 
-    @property
-    def odata_name(self):
-        return self['odata_name']
 
-    @property
-    def odata_type(self):
-        return self['odata_type']
+class EdmType(ModelObject):
+    __slots__ = ('odata_name',)
+    edm_type = None
 
-
-class EdmType(dict):
     def __init__(self, odata_name):
-        super().__init__()
-        self['edm_type'] = None
-        self['odata_name'] = odata_name
-
-    @property
-    def edm_type(self):
-        return self['edm_type']
+        self.odata_name = odata_name
 
-    @property
-    def odata_name(self):
-        return self['odata_name']
-
-    def __str__(self):
-        output = '{'
-        for key, value in self.items():
-            output += "'" + key + "': '" + str(value) + "',\n"
-        output += '}'
+    def to_dict(self):
+        output = {'edm_type': self.edm_type}
+        output.update(super().to_dict())
         return output
 
 
 class EntitySet(EdmType):
+    __slots__ = ('entity_type', 'odata_entity_type', 'navigation_properties', 'capabilities')
+    edm_type = 'EntitySet'
+
     def __init__(self,
                  odata_name,
                  entity_type,
                  odata_entity_type,
-                 navigation_properties=None):
+                 navigation_properties=None,
+                 capabilities=None):
         super().__init__(odata_name)
-        self['edm_type'] = 'EntitySet'
-        self['entity_type'] = entity_type
-        self['odata_entity_type'] = odata_entity_type
-        self['navigation_properties'] = navigation_properties
-
-    @property
-    def odata_entity_type(self):
-        return self['odata_entity_type']
+        self.entity_type = entity_type
+        self.odata_entity_type = odata_entity_type
+        self.navigation_properties = navigation_properties
+        self.capabilities = capabilities if capabilities is not None else {}
 
 
 class Singleton(EntitySet):
-    def __init__(self,
-                 odata_name,
-                 entity_type,
-                 odata_entity_type,
-                 navigation_properties=None):
-        super().__init__(odata_name, entity_type, odata_entity_type, navigation_properties)
-        self['edm_type'] = 'Singleton'
+    __slots__ = ()
+    edm_type = 'Singleton'
 
 
 class EnumType(EdmType):
+    __slots__ = ('valid_values',)
+    edm_type = "EnumType"
+
     def __init__(self, odata_name, values):
         super().__init__(odata_name)
-        self['edm_type'] = "EnumType"
-        self['valid_values'] = values
-
-    @property
-    def valid_values(self):
-        return self['valid_values']
+        self.valid_values = values
 
 
 class ComplexType(EdmType):
+    __slots__ = ('properties', 'navigation_properties')
+    edm_type = "ComplexType"
+
     def __init__(self,
                  odata_name,
                  properties=None,
                  navigation_properties=None):
         super().__init__(odata_name)
-        self['edm_type'] = "ComplexType"
-        self['properties'] = properties
-        self['navigation_properties'] = navigation_properties
+        self.properties = properties
+        self.navigation_properties = navigation_properties
 
-    @property
-    def properties(self):
-        """
-        Gets properties
-        :return: boolean
-        """
-        return self['properties']
 
-    @property
-    def navigation_properties(self):
-        """
-        Gets navigation_properties
-        :return: boolean
-        """
-        return self['navigation_properties']
+class TypeInfo(ModelObject):
+    """Entry of the type index of the schema: names of the generated class of a type and the types it refers to.
+    property_types: dictionary odata property name: odata type, without Collection(), of properties
+                    and navigation properties.
+    collection_properties: names of the properties that are collections.
+    referenced_by: odata types having a property of this type or deriving from it.
+    """
+    __slots__ = ('odata_name', 'python_name', 'module_name', 'import_line', 'base',
+                 'property_types', 'collection_properties', 'referenced_by')
+
+    def __init__(self,
+                 odata_name,
+                 python_name,
+                 module_name,
+                 base=None):
+        self.odata_name = odata_name
+        self.python_name = python_name
+        self.module_name = module_name
+        self.import_line = "from ." + module_name + " import " + python_name
+        self.base = base
+        self.property_types = {}
+        self.collection_properties = set()
+        self.referenced_by = []
 
 
 class EntityType(ComplexType):
@@ -154,6 +277,8 @@ class EntityType(ComplexType):
             }
         }
     """
+    __slots__ = ('key_property', 'base', 'actions', 'functions')
+    edm_type = "EntityType"
 
     def __init__(self,
                  odata_name,
@@ -162,36 +287,18 @@ class EntityType(ComplexType):
                  properties=None,
                  navigation_properties=None):
         super().__init__(odata_name, properties=properties, navigation_properties=navigation_properties)
-        self['edm_type'] = "EntityType"
-        self['key_property'] = key_property
-        self['base'] = base_type
-
-    @property
-    def base(self):
-        """
-        Gets the base type
-        :return: <string> base type
-        """
-        return self['base']
-
-    @property
-    def key_property(self):
-        """
-        Gets the key property
-        :return: <string> with key property name
-        """
-        return self['key_property']
+        self.key_property = key_property
+        self.base = base_type
+        self.actions = {}
+        self.functions = {}
 
     def add_action(self, name, action_dic):
         """
-        Adds a OdataFunction to the functions dictionary
-        :param name: Name of function
+        Adds a OdataFunction to the actions dictionary
+        :param name: Name of action
         :param action_dic: OdataFunction object
         """
-        if 'actions' not in self:
-            self['actions'] = {name: action_dic}
-        else:
-            self['actions'].update({name: action_dic})
+        self.actions[name] = action_dic
 
     def add_function(self, name, function_dic):
         """
@@ -199,10 +306,7 @@ class EntityType(ComplexType):
         :param name: Name of function
         :param function_dic: OdataFunction object
         """
-        if 'functions' not in self:
-            self['functions'] = {name: function_dic}
-        else:
-            self['functions'].update({name: function_dic})
+        self.functions[name] = function_dic
 
 
 class Metadata(object):
@@ -214,6 +318,8 @@ class Metadata(object):
         self.class_prefix = class_prefix
         self.sets = {}
         self.classes = {}
+        self.type_index = {}
+        self.class_index = {}
         self.odata_containers = {}
         self.odata_types = {'Edm.String': 'str',
                             'Edm.SByte': 'int',
@@ -243,12 +349,19 @@ class Metadata(object):
             """
             return self._namespace + '.' + tag
 
+        # Memoized translations of type names
+        python_types = {}
+
         def pythonize_type(name):
             """
             Convert name into python class format
             :param name: string with name in odata format
             :return: string with name in ThisFormat
             """
+            try:
+                return python_types[name]
+            except KeyError:
+                odata_name = name
 
             if name.startswith('Collection('):
                 # remove Collection from name
@@ -269,20 +382,7 @@ class Metadata(object):
 
             if is_list:
                 name = '*' + name
-            return name
-
-        def pythonize_attribute(name):
-            """
-            Convert name into python attribute format
-            :param name: string with name in thisFormat
-            :return: string with name in this_format
-            """
-            name = name[0].lower() + name[1:]
-            name = ''.join(["_" + c.lower() if c.isupper() else c for c in name])
-
-            while iskeyword(name):
-                name = "_" + name
-
+            python_types[odata_name] = name = intern(name)
             return name
 
         # begining of _init_
@@ -353,6 +453,28 @@ class Metadata(object):
             self.sets[singleton_name] = singleton
             self.odata_containers[singleton_name] = singleton_type
 
+        # Process capability annotations of entity sets and singletons, written inside them or in
+        # Annotations elements targeting Namespace.Container/name
+        term_prefixes = {CAPABILITIES_NAMESPACE}
+        for e_include in tree.iter(EDMX_XMLNS + 'Include'):
+            if e_include.attrib.get('Namespace') == CAPABILITIES_NAMESPACE and 'Alias' in e_include.attrib:
+                term_prefixes.add(e_include.attrib['Alias'])
+
+        container_name = entity_container.attrib.get('Name')
+        annotations = {}
+        for e_container_item in entity_container:
+            if 'Name' in e_container_item.attrib:
+                annotations.setdefault(e_container_item.attrib['Name'], []).extend(
+                    e_container_item.findall(add_xmlns_to_tag('Annotation')))
+        for e_annotations in tree.iter(add_xmlns_to_tag('Annotations')):
+            # Container qualified with the namespace or its alias
+            target_container, _, target = e_annotations.attrib.get('Target', '').partition('/')
+            if target and '/' not in target and target_container.rpartition('.')[2] == container_name:
+                annotations.setdefault(target, []).extend(e_annotations.findall(add_xmlns_to_tag('Annotation')))
+
+        for entityset in self.sets.values():
+            entityset.capabilities = capabilities_of(annotations.get(entityset.odata_name, []), term_prefixes)
+
         # Process EnumType
         for e_type in schema.findall(add_xmlns_to_tag('EnumType')):
 
@@ -483,7 +605,10 @@ class Metadata(object):
                     binding = pythonize_type(e_attrib.attrib['Type'])
                 else:
                     # Add attribute type to parameters dictionary
-                    parameters[pythonize_attribute(e_attrib.attrib['Name'])] = pythonize_type(e_attrib.attrib['Type'])
+                    parameters[pythonize_attribute(e_attrib.attrib['Name'])] = \
+                        OdataProperty(odata_name=e_attrib.attrib['Name'],
+                                      odata_type=e_attrib.attrib['Type'],
+                                      python_type=pythonize_type(e_attrib.attrib['Type']))
 
             if binding.startswith("*"):
                 logging.warning("Action {action} not supported, it binds to collection {binding}.".
@@ -493,11 +618,15 @@ class Metadata(object):
             # Load return_graph_type
             et_return_type = e_type.find(add_xmlns_to_tag('ReturnType'))
             try:
-                return_type = pythonize_type(et_return_type.attrib['Type'])
+                odata_return_type = et_return_type.attrib['Type']
+                return_type = pythonize_type(odata_return_type)
             except AttributeError:
+                odata_return_type = None
                 return_type = None
 
-            type_function = OdataFunction(returns=return_type,
+            type_function = OdataFunction(odata_name=e_type.attrib['Name'],
+                                          returns=return_type,
+                                          odata_returns=odata_return_type,
                                           parameters=parameters)
 
             # Attach action to entity_type in graph_type dictionary
@@ -526,7 +655,10 @@ class Metadata(object):
                     binding = pythonize_type(e_attrib.attrib['Type'])
                 else:
                     # Add attribute type to parameters dictionary
-                    parameters[e_attrib.attrib['Name']] = pythonize_type(e_attrib.attrib['Type'])
+                    parameters[pythonize_attribute(e_attrib.attrib['Name'])] = \
+                        OdataProperty(odata_name=e_attrib.attrib['Name'],
+                                      odata_type=e_attrib.attrib['Type'],
+                                      python_type=pythonize_type(e_attrib.attrib['Type']))
 
             if binding.startswith("*"):
                 logging.warning("Function {name} not supported, it binds to collection {binding}.".
@@ -536,11 +668,15 @@ class Metadata(object):
             # Load return_graph_type
             et_return_type = e_type.find(add_xmlns_to_tag('ReturnType'))
             try:
-                return_type = pythonize_type(et_return_type.attrib['Type'])
+                odata_return_type = et_return_type.attrib['Type']
+                return_type = pythonize_type(odata_return_type)
             except AttributeError:
+                odata_return_type = None
                 return_type = None
 
-            type_function = OdataFunction(returns=return_type,
+            type_function = OdataFunction(odata_name=e_type.attrib['Name'],
+                                          returns=return_type,
+                                          odata_returns=odata_return_type,
                                           parameters=parameters)
 
             # Attach function to entity_type in graph_type dictionary
@@ -549,3 +685,39 @@ class Metadata(object):
             except KeyError:
                 raise KeyError("Key not found in dictionary trying to add function {name} to binding {binding}".
                                format(name=function_name, binding=binding))
+
+        self.build_type_index()
+
+    def build_type_index(self):
+        """Builds the type index of the generated classes: self.type_index with odata type: TypeInfo
+        and self.class_index with python class name: TypeInfo.
+        """
+        for python_name, schema_type in self.classes.items():
+            info = TypeInfo(odata_name=schema_type.odata_name,
+                            python_name=python_name,
+                            module_name=pythonize_attribute(python_name))
+
+            if isinstance(schema_type, EntityType) and schema_type.base:
+                info.base = self.classes[schema_type.base].odata_name
+
+            if isinstance(schema_type, ComplexType):
+                # Properties override navigation properties with the same name
+                for prop in list(schema_type.navigation_properties.values()) + list(schema_type.properties.values()):
+                    if prop.odata_type.startswith('Collection('):
+                        info.property_types[prop.odata_name] = intern(prop.odata_type[11:-1])
+                        info.collection_properties.add(prop.odata_name)
+                    else:
+                        info.property_types[prop.odata_name] = prop.odata_type
+                        info.collection_properties.discard(prop.odata_name)
+
+            self.type_index[info.odata_name] = info
+            self.class_index[python_name] = info
+
+        # Reverse references
+        for info in self.type_index.values():
+            referenced = set(info.property_types.values())
+            if info.base:
+                referenced.add(info.base)
+            for odata_type in sorted(referenced):
+                if odata_type in self.type_index:
+                    self.type_index[odata_type].referenced_by.append(info.odata_name)
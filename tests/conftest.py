@@ -0,0 +1,338 @@
+"""
+Fixtures of the tests. The package is generated once from data/metadata.xml into a temporary directory and
+imported as graph_model, so test modules can import it at module level.
+"""
+
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import urlsplit, parse_qsl, urlencode
+import pytest
+
+ROOT_LOCATION = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_LOCATION = os.path.join(ROOT_LOCATION, "tests", "data")
+INPUT_LOCATION = os.path.join(ROOT_LOCATION, "input") + os.sep
+METADATA_PATH = os.path.join(DATA_LOCATION, "metadata.xml")
+PACKAGE_NAME = "graph_model"
+CLASS_PREFIX = "Graph"
+
+sys.path.insert(0, ROOT_LOCATION)
+import omodeler  # noqa: E402
+
+
+def generate_package(directory, metadata_path=METADATA_PATH, package_name=PACKAGE_NAME, **save_options):
+    """Generates the package from the metadata file into directory/package_name.
+    :return: path to the package directory, ending with a separator.
+    """
+    output_loc = os.path.join(directory, package_name) + os.sep
+    temp_loc = os.path.join(directory, "tmp") + os.sep
+    os.makedirs(output_loc, exist_ok=True)
+    os.makedirs(temp_loc, exist_ok=True)
+    factory = omodeler.ClassFactory(Path(metadata_path).as_uri(), CLASS_PREFIX, INPUT_LOCATION, temp_loc)
+    factory.save(output_loc, **save_options)
+    return output_loc
+
+
+BUILD_LOCATION = tempfile.mkdtemp(prefix="odatapymodel-")
+PACKAGE_LOCATION = generate_package(BUILD_LOCATION)
+sys.path.insert(0, BUILD_LOCATION)
+
+
+def pytest_unconfigure(config):
+    shutil.rmtree(BUILD_LOCATION, ignore_errors=True)
+
+
+@pytest.fixture(scope="session")
+def package_location():
+    """Path to the directory of the generated package."""
+    return PACKAGE_LOCATION
+
+
+def user_item(i):
+    """Returns user number i in odata format."""
+    return {'id': 'u%05d' % i, 'displayName': 'User %05d' % i, 'department': 'D%d' % (i % 7),
+            'accountEnabled': i % 3 != 0, 'userPrincipalName': 'u%d@example.com' % i, 'ageGroup': i % 90,
+            'businessPhones': ['+1 555 %04d' % i],
+            'assignedLicenses': [{'skuId': 'sku%d' % (i % 4), 'disabledPlans': []}],
+            'passwordProfile': {'password': 'p%d' % i, 'forceChangePasswordNextSignIn': False}}
+
+
+def user_items(count):
+    """Returns list of users in odata format."""
+    return [user_item(i) for i in range(count)]
+
+
+def directory_items(count):
+    """Returns list of users, groups and devices in odata format with @odata.type, in mixed order."""
+    items = []
+    for i in range(count):
+        kind = i % 3
+        if kind == 0:
+            item = user_item(i)
+            item['@odata.type'] = '#microsoft.graph.user'
+        elif kind == 1:
+            item = {'@odata.type': '#microsoft.graph.group', 'id': 'g%05d' % i, 'displayName': 'Group %d' % i,
+                    'mail': 'g%d@example.com' % i, 'securityEnabled': i % 2 == 0}
+        else:
+            item = {'@odata.type': '#microsoft.graph.device', 'id': 'd%05d' % i, 'displayName': 'Device %d' % i,
+                    'state': 'active' if i % 2 else 'disabled'}
+        items.append(item)
+    return items
+
+
+# Resource path of a request: entity set, key of an entity and navigation property of the entity
+RESOURCE_RE = re.compile(r"^(\w+)(?:\('([^']*)'\))?(?:/(\w+))?$")
+
+
+def split_options(text, separator):
+    """Returns the parts of text separated by separator outside parentheses."""
+    parts = []
+    depth = 0
+    start = 0
+    for pos, char in enumerate(text):
+        depth += {'(': 1, ')': -1}.get(char, 0)
+        if char == separator and depth == 0:
+            parts.append(text[start:pos])
+            start = pos + 1
+    parts.append(text[start:])
+    return [part for part in parts if part]
+
+
+def parse_expand(expand):
+    """Returns list of (item, options dictionary) of a $expand option, i.e. "manager($select=id),memberOf"."""
+    items = []
+    for part in split_options(expand, ','):
+        name, _, nested = part.partition('(')
+        options = dict(option.split('=', 1) for option in split_options(nested[:-1], ';')) if nested else {}
+        items.append((name, options))
+    return items
+
+
+class ODataService(object):
+    """In-process odata service over http serving entity sets of json items. It evaluates $filter and
+    $orderby with the LocalCollection of the generated package, rejects the options the capabilities of
+    the entity set don't allow, pages results with $skiptoken and answers If-None-Match with status 304.
+
+    Entities are also served by key, i.e. users('u00001'), and their navigation properties, i.e.
+    users('u00001')/memberOf. relations has the keys of the related entities of each entity, expanded with
+    $expand and paged after expand_page_size entities. Json $batch requests are answered part by part.
+    requests has the path of each http request received and response_bytes the size of their bodies.
+    """
+
+    def __init__(self, entity_sets, page_size=100, relations=None, expand_page_size=20):
+        from graph_model import extension
+
+        self.entity_sets = entity_sets
+        self.page_size = page_size
+        self.relations = relations or {}
+        self.expand_page_size = expand_page_size
+        self.requests = []
+        self.response_bytes = 0
+        self.etag = '"1"'
+        service = self
+
+        # Entities by key with their @odata.type
+        self.entities = {}
+        for container, items in entity_sets.items():
+            odata_type = '#' + extension.ODATA_CONTAINER_TYPE[container]
+            for item in items:
+                self.entities.setdefault(item['id'], dict({'@odata.type': odata_type}, **item))
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def send_json(self, status, body):
+                data = json.dumps(body).encode('utf-8') if body is not None else b''
+                service.response_bytes += len(data)
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                if status == 200 and self.command == 'GET':
+                    self.send_header('ETag', service.etag)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                service.requests.append(self.path)
+                self.send_json(*service.get(self.path, self.headers))
+
+            def do_POST(self):
+                service.requests.append(self.path)
+                body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))).decode('utf-8'))
+                self.send_json(*service.batch(self.path, body))
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = 'http://127.0.0.1:%d/v1.0/' % self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True).start()
+
+    def get(self, path, headers):
+        from graph_model import extension
+        from graph_model.query import FilterParser, LocalCollection
+
+        url = urlsplit(path)
+        options = dict(parse_qsl(url.query))
+        if headers.get('If-None-Match') == self.etag:
+            return 304, None
+        match = RESOURCE_RE.match(url.path[len(urlsplit(self.url).path):])
+        if match is None or match.group(1) not in self.entity_sets:
+            return 404, {'error': {'message': 'Unknown resource ' + url.path}}
+        container, key, navigation = match.groups()
+        context = self.url + '$metadata#' + container
+
+        if key is not None:
+            item = self.entities.get(key)
+            if item is None:
+                return 404, {'error': {'message': 'Unknown entity ' + key}}
+            try:
+                if navigation is None:
+                    return 200, dict(self.shape(item, options), **{'@odata.context': context + '/$entity'})
+                related = self.related(item, navigation)
+                if not isinstance(related, list):
+                    return 200, self.shape(related, options) if related is not None else None
+            except ValueError as e:
+                return 400, {'error': {'message': str(e)}}
+            return 200, self.page(related, options, self.url + url.path.split('/', 2)[-1], self.page_size,
+                                  context + '/' + navigation)
+
+        capabilities = extension.get_capabilities(container)
+        cls = extension.ODATA_TYPE_TO_PYTHON[extension.ODATA_CONTAINER_TYPE[container]]
+        items = self.entity_sets[container]
+        if '$skip' in options and not capabilities['skip_supported']:
+            return 400, {'error': {'message': '$skip is not supported'}}
+        if '$top' in options and not capabilities['top_supported']:
+            return 400, {'error': {'message': '$top is not supported'}}
+        objects = [cls(item) for item in items]
+        by_object = {id(obj): item for obj, item in zip(objects, items)}
+        try:
+            if '$filter' in options:
+                parser = FilterParser(cls, options['$filter'])
+                parser.parse()
+                if any(p.split('/')[0] in capabilities['non_filterable_properties'] for p in parser.odata_paths):
+                    return 400, {'error': {'message': 'Property is not filterable'}}
+            selected = LocalCollection(objects, cls).query(options.get('$filter'), options.get('$orderby'),
+                                                           None, int(options.get('$skip', 0)))
+        except ValueError as e:
+            return 400, {'error': {'message': str(e)}}
+        count = len(selected)
+        if '$top' in options:
+            selected = selected[:int(options['$top'])]
+        try:
+            body = self.page([by_object[id(obj)] for obj in selected], options, self.url + container,
+                             self.page_size, context)
+        except ValueError as e:
+            return 400, {'error': {'message': str(e)}}
+        if options.get('$count') == 'true':
+            body['@odata.count'] = count
+        return 200, body
+
+    def page(self, items, options, url, page_size, context=None):
+        """Returns response body with the page of the items starting at $skiptoken, shaped by the options."""
+        start = int(options.get('$skiptoken', 0))
+        body = {'value': [self.shape(item, options) for item in items[start:start + page_size]]}
+        if context is not None:
+            body['@odata.context'] = context
+        if start + page_size < len(items):
+            body['@odata.nextLink'] = url + '?' + urlencode(dict(options, **{'$skiptoken': str(start + page_size)}))
+        return body
+
+    def related(self, item, navigation):
+        """Returns the entity or list of entities related to the item by the navigation property."""
+        from graph_model import extension
+        from graph_model.planner import get_navigation_property
+
+        cls = extension.get_object_class(None, item['@odata.type']) if '@odata.type' in item else None
+        declared = get_navigation_property(cls, navigation) if cls is not None else None
+        if declared is None:
+            raise ValueError('Unknown navigation property ' + navigation)
+        related = self.relations.get(item['id'], {}).get(navigation)
+        if declared[1].startswith('Collection('):
+            return [self.entities[key] for key in related or ()]
+        return self.entities[related] if related is not None else None
+
+    def shape(self, item, options):
+        """Returns the item with the properties of $select and the navigation properties of $expand."""
+        from graph_model import extension
+
+        fields = [field.split('/')[-1] for field in options['$select'].split(',')] if '$select' in options else None
+        result = {k: v for k, v in item.items() if fields is None or k in fields or k[0] == '@'}
+        entity = self.entities.get(item['id'], item)
+        for name, expand_options in parse_expand(options.get('$expand', '')):
+            cast, _, navigation = name.rpartition('/')
+            if cast and not extension.is_assignable(entity['@odata.type'], cast):
+                continue
+            related = self.related(entity, navigation)
+            if isinstance(related, list):
+                body = self.page(related, expand_options, self.url + "directoryObjects('%s')/%s" %
+                                 (item['id'], navigation), self.expand_page_size)
+                result[navigation] = body['value']
+                if '@odata.nextLink' in body:
+                    result[navigation + '@odata.nextLink'] = body['@odata.nextLink']
+            else:
+                result[navigation] = self.shape(related, expand_options) if related is not None else None
+        return result
+
+    def batch(self, path, body):
+        """Answers a json $batch request with the responses of its requests, in order."""
+        if not path.endswith('/$batch'):
+            return 404, {'error': {'message': 'Unknown resource ' + path}}
+        responses = []
+        failed = set()
+        prefix = urlsplit(self.url).path[:-1]
+        for request in body.get('requests', []):
+            if any(d in failed for d in request.get('dependsOn', ())):
+                status, response = 424, {'error': {'message': 'Failed dependency'}}
+            elif request['method'] != 'GET':
+                status, response = 405, {'error': {'message': 'Method not allowed'}}
+            else:
+                status, response = self.get(prefix + request['url'], request.get('headers', {}))
+            if status >= 400:
+                failed.add(request['id'])
+            responses.append({'id': request['id'], 'status': status,
+                              'headers': {'Content-Type': 'application/json'}, 'body': response})
+        return 200, {'responses': responses}
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def directory_relations(users, groups):
+    """Returns relations of the users and groups: managers of the users, groups of the even users and their
+    members, and an owner of each group.
+    """
+    relations = {}
+    for i, user in enumerate(users):
+        relations[user['id']] = {}
+        if i >= 10:
+            relations[user['id']]['manager'] = users[i // 10]['id']
+        if i % 2 == 0:
+            member_of = sorted(set([groups[i % len(groups)]['id'], groups[i * 3 % len(groups)]['id']]))
+            relations[user['id']]['memberOf'] = member_of
+            for group_id in member_of:
+                relations.setdefault(group_id, {}).setdefault('members', []).append(user['id'])
+    for group in groups:
+        relations.setdefault(group['id'], {})['owners'] = [users[0]['id']]
+    return relations
+
+
+@pytest.fixture
+def service():
+    """ODataService with 250 users, 14 groups, 14 devices and the 42 of them in directoryObjects, with the
+    relations of directory_relations().
+    """
+    items = directory_items(42)
+    users = user_items(250)
+    groups = [i for i in items if i['@odata.type'].endswith('group')]
+    service = ODataService({'users': users,
+                            'groups': groups,
+                            'devices': [i for i in items if i['@odata.type'].endswith('device')],
+                            'directoryObjects': items}, relations=directory_relations(users, groups))
+    yield service
+    service.close()
@@ -0,0 +1,111 @@
+import asyncio
+import pytest
+from graph_model import GraphUser, GraphGroup
+from graph_model.async_client import AsyncClient, retry_after_seconds
+from graph_model.query import LocalCollection
+from conftest import user_items
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_retry_after_seconds():
+    assert retry_after_seconds(None, 2.0) == 2.0
+    assert retry_after_seconds("3", 1.0) == 3.0
+    assert retry_after_seconds("not a date", 1.5) == 1.5
+
+
+def test_all_pages(service):
+    async def main():
+        async with AsyncClient(service.url) as client:
+            return await client.users.all()
+
+    users = run(main())
+    assert len(users) == 250
+    assert all(isinstance(u, GraphUser) for u in users)
+    assert len(service.requests) == 3
+
+
+def test_get_and_select(service):
+    async def main():
+        async with AsyncClient(service.url) as client:
+            return await client.groups.select('displayName').all()
+
+    groups = run(main())
+    assert groups and all(isinstance(g, GraphGroup) for g in groups)
+    assert groups[0].display_name and groups[0].mail is None
+
+
+def test_fetch_local_filter_matching_after_first_page(service):
+    # contains() isn't a filter function of users, the filter is evaluated locally and only
+    # users 200 to 249, on the third page, match it
+    async def main():
+        async with AsyncClient(service.url) as client:
+            return await client.users.fetch("contains(displayName,' 002')", top=5)
+
+    users = run(main())
+    assert [u.id for u in users] == ['u00200', 'u00201', 'u00202', 'u00203', 'u00204']
+    assert len(service.requests) == 3
+
+
+def test_fetch_same_result_as_local_evaluation(service):
+    cases = [dict(filter="accountEnabled eq true and department eq 'D3' and ageGroup gt 40",
+                  orderby="displayName desc", top=25, select=['displayName']),
+             dict(filter="startswith(displayName,'User 01') and contains(userPrincipalName,'9')"),
+             dict(filter="ageGroup ge 85", orderby="department,displayName", top=10, skip=5),
+             dict(filter="passwordProfile/password eq 'p77' or displayName eq 'User 00005'"),
+             dict(top=50, skip=100, orderby="displayName")]
+    everyone = LocalCollection([GraphUser(item) for item in user_items(250)], GraphUser)
+
+    async def main():
+        async with AsyncClient(service.url) as client:
+            return [await client.users.fetch(**case) for case in cases]
+
+    for case, result in zip(cases, run(main())):
+        expected = everyone.query(case.get('filter'), case.get('orderby'), case.get('top'), case.get('skip', 0))
+        assert [u.id for u in result] == [u.id for u in expected]
+
+
+def test_fetch_stops_when_enough(service):
+    async def main():
+        async with AsyncClient(service.url) as client:
+            return await client.users.fetch("accountEnabled eq true", top=10)
+
+    assert len(run(main())) == 10
+    assert len(service.requests) == 1
+
+
+def test_count(service):
+    async def main():
+        async with AsyncClient(service.url) as client:
+            return (await client.users.count("ageGroup gt 50"), await client.users.count("department eq 'D1'"),
+                    await client.groups.count())
+
+    assert run(main()) == (sum(1 for u in user_items(250) if u['ageGroup'] > 50),
+                           sum(1 for u in user_items(250) if u['department'] == 'D1'), 14)
+    # The first count is done by the service, the second one needs all pages of keys
+    assert '$count=true' in service.requests[0] and len(service.requests) == 1 + 3 + 1
+
+
+def test_error_status(service):
+    async def main():
+        async with AsyncClient(service.url) as client:
+            return await client.users.filter("department eq 'D1'").all()
+
+    with pytest.raises(ValueError):
+        run(main())
+
+
+def test_client_used_in_several_loops(service):
+    client = AsyncClient(service.url, max_concurrency=1)
+
+    async def main():
+        # Requests waiting on the semaphore of the loop
+        return await asyncio.gather(client.groups.all(), client.devices.all())
+
+    try:
+        for _ in range(2):
+            assert [len(objects) for objects in run(main())] == [14, 14]
+    finally:
+        client.close()
@@ -0,0 +1,99 @@
+import pytest
+from graph_model import GraphUser, GraphGroup
+from graph_model.batch import BatchComposer, BatchResult, decode_result
+from graph_model.request import OdataRequest
+from graph_model.transport import HttpTransport
+from conftest import user_items
+
+USERS_CONTEXT = 'https://graph.microsoft.com/v1.0/$metadata#users'
+
+
+def request(i):
+    return OdataRequest("GET", "users('u%d')" % i, returns='microsoft.graph.user')
+
+
+def test_default_ids_skip_used_ids():
+    composer = BatchComposer()
+    assert composer.add(request(1), request_id=2) == '2'
+    assert composer.add(request(2)) == '1'
+    assert composer.add(request(3)) == '3'
+    assert composer.add(request(4), request_id='5') == '5'
+    assert composer.add(request(5)) == '4'
+    assert composer.add(request(6)) == '6'
+    with pytest.raises(ValueError):
+        composer.add(request(7), request_id=6)
+    with pytest.raises(ValueError):
+        composer.add(request(7), depends_on=['9'])
+
+
+def test_dependent_requests_in_same_batch():
+    composer = BatchComposer(max_requests=3)
+    first = composer.add(request(0))
+    for i in range(1, 5):
+        composer.add(request(i))
+    composer.add(request(5), depends_on=[first])
+    composer.add(request(6), depends_on=['6'])
+    batches = composer.batches()
+    assert all(len(batch) <= 3 for batch in batches)
+    assert any(batch[:2] == ['1', '6'] for batch in batches)
+    assert [item['id'] for payload in composer.payloads() for item in payload['requests']] == \
+        [i for batch in batches for i in batch]
+    payload_items = {item['id']: item for payload in composer.payloads() for item in payload['requests']}
+    assert payload_items['7']['dependsOn'] == ['6'] and payload_items['1']['url'] == "/users('u0')"
+
+    with pytest.raises(ValueError):
+        BatchComposer(max_requests=0)
+    chained = BatchComposer(max_requests=2)
+    chained.add(request(0))
+    chained.add(request(1), depends_on=['1'])
+    chained.add(request(2), depends_on=['2'])
+    with pytest.raises(ValueError):
+        chained.batches()
+
+
+def test_parse_response():
+    composer = BatchComposer()
+    composer.add(request(0))
+    results = composer.parse_response({'responses': [
+        {'id': '1', 'status': 200, 'body': user_items(1)[0]},
+        {'id': '7', 'status': 200, 'body': {'@odata.context': USERS_CONTEXT, 'value': user_items(2)}},
+        {'id': '8', 'status': 404, 'body': {'error': {'code': 'NotFound'}}}]})
+    assert isinstance(results['1'].value, GraphUser) and results['1'].error is None
+    # Ids that weren't requested have no request, the type is taken from the context
+    assert results['7'].request is None
+    assert [u.id for u in results['7'].value] == ['u00000', 'u00001']
+    assert results['8'].value is None and results['8'].error == {'code': 'NotFound'}
+
+
+def test_decode_result():
+    assert decode_result({'value': ['a', 'b']}, 'Collection(Edm.String)') == ['a', 'b']
+    assert decode_result({'value': True}, 'Edm.Boolean') is True
+    assert decode_result({'@odata.context': 'unknown', 'value': [1]}) == [1]
+    users = decode_result({'@odata.context': USERS_CONTEXT, 'value': user_items(2)}, fields=['displayName'])
+    assert users[0].display_name == 'User 00000' and type(users[0]) is GraphUser.projection(['displayName'])
+    assert BatchResult('1', None, 204).value is None
+    # Part without response
+    missing = BatchResult('1', request(1), None)
+    assert not missing.ok and missing.value is None
+
+
+def test_send(service):
+    transport = HttpTransport(service.url)
+    composer = BatchComposer(max_requests=3)
+    ids = [composer.add(OdataRequest("GET", "users('u%05d')" % i)) for i in range(4)]
+    ids.append(composer.add(OdataRequest("GET", "users('unknown')")))
+    ids.append(composer.add(OdataRequest("GET", "users('u00001')"), depends_on=[ids[-1]]))
+    ids.append(composer.add(OdataRequest("GET", "groups", returns='Collection(microsoft.graph.group)')))
+    results = composer.send(transport)
+
+    assert sorted(results) == sorted(ids)
+    assert [results[i].value.id for i in ids[:4]] == ['u00000', 'u00001', 'u00002', 'u00003']
+    assert all(isinstance(results[i].value, GraphUser) for i in ids[:4])
+    assert results[ids[4]].status == 404 and results[ids[4]].value is None
+    # Failed dependency
+    assert results[ids[5]].status == 424 and not results[ids[5]].ok
+    assert [type(g) for g in results[ids[6]].value] == [GraphGroup] * 14
+
+    # A round trip for each batch of 3 requests at most
+    assert len(composer.batches()) == 3
+    assert service.requests == ['/v1.0/$batch'] * 3
@@ -0,0 +1,275 @@
+"""Timings of the generated package, run with "make benchmark". They print their measurements and only check
+that the paths compared return the same results.
+"""
+
+import json
+import os
+import subprocess
+import sys
+import tracemalloc
+from timeit import repeat
+import pytest
+from graph_model import GraphUser, extension
+from graph_model.decoder import decode_items, decode_object, loads_objects
+from graph_model.query import LocalCollection, compile_filter
+from conftest import BUILD_LOCATION, PACKAGE_NAME, directory_items, user_items
+
+pytestmark = pytest.mark.benchmark
+
+# Number of items of the collections timed, can be changed with the BENCHMARK_ITEMS environment variable
+ITEMS = int(os.environ.get('BENCHMARK_ITEMS', 100000))
+
+# Number of rows exported, with the BENCHMARK_ROWS environment variable
+ROWS = int(os.environ.get('BENCHMARK_ROWS', 1000000))
+
+# Number of objects of the local queries, with the BENCHMARK_ENTITIES environment variable
+ENTITIES = int(os.environ.get('BENCHMARK_ENTITIES', 1000000))
+
+# Exports a synthetic collection of users in a new interpreter, so the peak memory is the export's only.
+# The rows path is the export before export_csv(): serialized() dictionaries flattened in python and
+# collected in memory before writing.
+EXPORT_SOURCE = '''
+import csv, json, resource, sys, time
+from {package} import GraphUser
+from {package}.export import export_csv, export_arrow
+
+mode, path, count = sys.argv[1], sys.argv[2], int(sys.argv[3])
+
+
+def users():
+    for i in range(count):
+        yield GraphUser({{'id': 'u%08d' % i, 'displayName': 'User %d' % i, 'department': 'D%d' % (i % 7),
+                         'accountEnabled': i % 3 != 0, 'ageGroup': i % 90, 'businessPhones': ['+1 555 %04d' % i],
+                         'passwordProfile': {{'password': 'p%d' % i, 'forceChangePasswordNextSignIn': False}}}})
+
+
+def flatten(values, prefix=''):
+    row = {{}}
+    for name, value in values.items():
+        if isinstance(value, dict):
+            row.update(flatten(value, prefix + name + '.'))
+        else:
+            row[prefix + name] = json.dumps(value) if isinstance(value, list) else value
+    return row
+
+
+started = time.perf_counter()
+if mode == 'rows':
+    rows = [flatten(user.serialized()) for user in users()]
+    names = []
+    for row in rows:
+        names.extend(name for name in row if name not in names)
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, names)
+        writer.writeheader()
+        writer.writerows(rows)
+elif mode == 'csv':
+    export_csv(users(), GraphUser, path)
+else:
+    export_arrow(users(), GraphUser, path)
+print(json.dumps({{'seconds': time.perf_counter() - started,
+                  'peak_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}}))
+'''
+
+# Imports the package in a new interpreter and prints the seconds taken and the modules of the package loaded
+IMPORT_SOURCE = '''
+import json, sys, time
+started = time.perf_counter()
+if sys.argv[1] == 'all':
+    import {package}
+    classes = [getattr({package}, name) for name in {package}.CLASS_MODULES]
+else:
+    import {package}.graph_user
+seconds = time.perf_counter() - started
+print(json.dumps({{'seconds': seconds, 'modules': sorted(m for m in sys.modules if m.split('.')[0] == {package!r})}}))
+'''
+
+# Builds a collection of users in a new interpreter, iterates it and looks up keys, printing the rates and the
+# peak memory. The list path keeps all objects in memory with a dictionary of them by key.
+SPILL_SOURCE = '''
+import json, random, resource, sys, time
+from {package} import GraphUser
+from {package}.spill import SpillCollection
+
+mode, count, lookups = sys.argv[1], int(sys.argv[2]), int(sys.argv[3])
+
+
+def users():
+    for i in range(count):
+        yield GraphUser({{'id': 'u%08d' % i, 'displayName': 'User %d' % i, 'department': 'D%d' % (i % 7),
+                         'accountEnabled': i % 3 != 0, 'ageGroup': i % 90, 'businessPhones': ['+1 555 %04d' % i],
+                         'passwordProfile': {{'password': 'p%d' % i, 'forceChangePasswordNextSignIn': False}}}})
+
+
+started = time.perf_counter()
+if mode == 'list':
+    collection = list(users())
+    get = {{user.id: user for user in collection}}.get
+else:
+    collection = SpillCollection(users(), memory_budget=int(mode))
+    get = collection.get
+timings = {{'build': time.perf_counter() - started}}
+
+started = time.perf_counter()
+iterated = sum(1 for _ in collection)
+timings['iterate'] = time.perf_counter() - started
+
+keys = ['u%08d' % random.randrange(count) for _ in range(lookups)]
+started = time.perf_counter()
+found = sum(1 for key in keys if get(key) is not None)
+timings['lookup'] = time.perf_counter() - started
+
+print(json.dumps({{'timings': timings, 'iterated': iterated, 'found': found,
+                  'peak_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}}))
+'''
+
+
+def best_seconds(function, number=1, runs=3):
+    """Returns the best time of the runs of the function, in seconds per call."""
+    return min(repeat(function, number=number, repeat=runs)) / number
+
+
+def report(title, count, timings):
+    """Prints the rate of each path timed and its speed relative to the first one."""
+    print("\n" + title + ", %d items" % count)
+    baseline = timings[0][1]
+    for name, seconds in timings:
+        print("  %-28s %12.0f items/s %6.2fx" % (name, count / seconds, baseline / seconds))
+
+
+def memory_per_item(function, count):
+    """Returns the bytes per item kept by the result of the function and allocated only while it ran."""
+    function()
+    tracemalloc.start()
+    try:
+        result = function()
+        kept, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del result
+    return kept / float(count), (peak - kept) / float(count)
+
+
+def decode_flat_lookup(items, declared_type):
+    """Decoding before the derived type index: the odata type is stripped of # and looked up in the table
+    of all types, and its class checked to derive from the declared class.
+    """
+    declared_class = extension.ODATA_TYPE_TO_PYTHON[declared_type]
+    result = []
+    for item in items:
+        odata_type = item.get('@odata.type')
+        cls = declared_class if odata_type is None else extension.ODATA_TYPE_TO_PYTHON[odata_type.lstrip('#')]
+        if not issubclass(cls, declared_class):
+            raise ValueError("Type {} is not assignable to {}.".format(odata_type, declared_type))
+        result.append(cls(item))
+    return result
+
+
+def test_polymorphic_decoding():
+    items = directory_items(ITEMS)
+    declared = 'microsoft.graph.directoryObject'
+    expected = [(type(o), o.to_record()) for o in decode_flat_lookup(items, declared)]
+    assert [(type(o), o.to_record()) for o in extension.decode_polymorphic(items, declared)] == expected
+
+    dispatch = extension.get_dispatch(declared)
+    types = [item['@odata.type'] for item in items]
+    report("Class of mixed @odata.type values", len(items), [
+        ("strip and check subclass", best_seconds(lambda: [
+            issubclass(extension.ODATA_TYPE_TO_PYTHON[t.lstrip('#')], extension.ODATA_TYPE_TO_PYTHON[declared])
+            for t in types])),
+        ("assignable dispatch", best_seconds(lambda: [dispatch[t] for t in types]))])
+    report("Decoding mixed collection", len(items), [
+        ("flat lookup", best_seconds(lambda: decode_flat_lookup(items, declared))),
+        ("decode_polymorphic", best_seconds(lambda: extension.decode_polymorphic(items, declared)))])
+
+
+def test_export_rate_and_peak_memory(tmp_path):
+    pytest.importorskip("pyarrow")
+    pytest.importorskip("resource")
+    env = dict(os.environ, PYTHONPATH=BUILD_LOCATION)
+    results = {}
+    for mode in ('rows', 'csv', 'arrow'):
+        output = subprocess.run([sys.executable, "-c", EXPORT_SOURCE.format(package=PACKAGE_NAME), mode,
+                                 str(tmp_path / ("users." + mode)), str(ROWS)], env=env, check=True,
+                                stdout=subprocess.PIPE, universal_newlines=True).stdout
+        results[mode] = json.loads(output)
+
+    print("\nExport of %d users" % ROWS)
+    for mode, result in results.items():
+        print("  %-8s %10.0f rows/s %10.0f MB peak" % (mode, ROWS / result['seconds'], result['peak_kb'] / 1024.0))
+    assert os.path.getsize(str(tmp_path / "users.csv")) > 0 and os.path.getsize(str(tmp_path / "users.arrow")) > 0
+
+
+def test_single_pass_decoding():
+    items = user_items(ITEMS)
+    body = json.dumps({'@odata.context': 'https://graph.microsoft.com/v1.0/$metadata#users', 'value': items})
+    paths = [("cls(json.loads())", lambda: [GraphUser(item) for item in json.loads(body)['value']]),
+             ("loads_objects()", lambda: loads_objects(body)),
+             ("cls(item), parsed", lambda: [GraphUser(item) for item in items]),
+             ("decode_items(), parsed", lambda: decode_items(items, GraphUser))]
+
+    expected = [o.to_record() for o in paths[0][1]()]
+    assert all([o.to_record() for o in function()] == expected for _, function in paths[1:])
+    report("Decoding users", ITEMS, [(name, best_seconds(function)) for name, function in paths])
+    for name, function in paths:
+        kept, temporary = memory_per_item(function, ITEMS)
+        print("  %-28s %8.0f bytes/item kept %8.0f bytes/item temporary" % (name, kept, temporary))
+
+
+def test_local_query():
+    users = [decode_object({'id': 'u%07d' % i, 'department': 'D%d' % (i % 7), 'accountEnabled': i % 3 != 0},
+                           GraphUser) for i in range(ENTITIES)]
+    expression = "accountEnabled eq true and startswith(department,'D1')"
+    predicate = compile_filter(GraphUser, expression)
+    expected = [u for u in users if predicate(u)]
+
+    collection = LocalCollection(users, GraphUser)
+    first = best_seconds(lambda: LocalCollection(users, GraphUser).filter(expression), runs=1)
+    assert collection.filter(expression) == expected
+    print("\nLocal query of %d users: %s" % (ENTITIES, expression))
+    for name, seconds in (("linear scan", best_seconds(lambda: [u for u in users if predicate(u)], runs=1)),
+                          ("first query, building indexes", first),
+                          ("repeated query", best_seconds(lambda: collection.filter(expression), runs=5))):
+        print("  %-32s %10.1f ms" % (name, seconds * 1000))
+
+
+def test_import_time_and_modules():
+    env = dict(os.environ, PYTHONPATH=BUILD_LOCATION)
+    results = {}
+    for mode in ('class', 'all'):
+        runs = [json.loads(subprocess.run([sys.executable, "-c", IMPORT_SOURCE.format(package=PACKAGE_NAME), mode],
+                                          env=env, check=True, stdout=subprocess.PIPE,
+                                          universal_newlines=True).stdout) for _ in range(5)]
+        results[mode] = (min(run['seconds'] for run in runs), runs[0]['modules'])
+
+    print("\nCold import")
+    for mode, title in (('class', PACKAGE_NAME + ".graph_user"), ('all', "all classes")):
+        seconds, modules = results[mode]
+        print("  %-28s %8.1f ms %4d modules of the package" % (title, seconds * 1000, len(modules)))
+    print("  modules: " + ", ".join(results['class'][1]))
+
+    # Only the modules of the inheritance chain and the runtime modules they use
+    chain = set(cls.__module__ for cls in GraphUser.__mro__ if cls.__module__.startswith(PACKAGE_NAME + "."))
+    assert set(results['class'][1]) == chain | {PACKAGE_NAME, PACKAGE_NAME + ".request"}
+    assert len(results['all'][1]) > len(results['class'][1])
+
+
+def test_spill_rate_and_peak_memory():
+    pytest.importorskip("resource")
+    env = dict(os.environ, PYTHONPATH=BUILD_LOCATION)
+    lookups = 10000
+    budget = 16 * 1024 * 1024
+    results = {}
+    for mode in ('list', str(budget)):
+        output = subprocess.run([sys.executable, "-c", SPILL_SOURCE.format(package=PACKAGE_NAME), mode, str(ITEMS),
+                                 str(lookups)], env=env, check=True, stdout=subprocess.PIPE,
+                                universal_newlines=True).stdout
+        results[mode] = json.loads(output)
+        assert results[mode]['iterated'] == ITEMS and results[mode]['found'] == lookups
+
+    print("\nCollection of %d users, %d key lookups" % (ITEMS, lookups))
+    for mode, title in (('list', "list in memory"), (str(budget), "SpillCollection, 16 MB budget")):
+        timings = results[mode]['timings']
+        print("  %-30s %10.0f built/s %10.0f iterated/s %10.0f lookups/s %8.0f MB peak" % (
+            title, ITEMS / timings['build'], ITEMS / timings['iterate'], lookups / timings['lookup'],
+            results[mode]['peak_kb'] / 1024.0))
@@ -0,0 +1,82 @@
+import json
+import os
+import pytest
+from graph_model import GraphUser, GraphGroup
+from graph_model import bulk
+from conftest import user_items, directory_items
+
+
+def count_objects(objects):
+    return len(objects)
+
+
+def add(total, count):
+    return total + count
+
+
+@pytest.fixture
+def users_file(tmp_path):
+    path = str(tmp_path / "users.ndjson")
+    with open(path, 'w') as f:
+        for item in user_items(500):
+            f.write(json.dumps(item) + "\n")
+    return path
+
+
+def test_split_file_at_line_boundaries(users_file):
+    ranges = bulk.split_file(users_file, chunk_size=1000)
+    assert ranges[0][0] == 0 and ranges[-1][1] == os.path.getsize(users_file)
+    with open(users_file, 'rb') as f:
+        data = f.read()
+    for start, end in ranges:
+        assert data[end - 1:end] == b'\n'
+    assert all(a[1] == b[0] for a, b in zip(ranges, ranges[1:]))
+
+
+@pytest.mark.parametrize("threads", [False, True])
+def test_decode_file(users_file, threads):
+    objects = list(bulk.decode_file(users_file, 'microsoft.graph.user', processes=2, chunk_size=8192,
+                                    threads=threads))
+    assert [u.id for u in objects] == [item['id'] for item in user_items(500)]
+    assert all(isinstance(u, GraphUser) for u in objects)
+    records = list(bulk.decode_file(users_file, 'microsoft.graph.user', processes=2, as_records=True,
+                                    chunk_size=8192, threads=threads))
+    assert records == [u.to_record() for u in objects]
+
+
+def test_reduce_file(users_file):
+    assert bulk.reduce_file(users_file, count_objects, add, 0, 'microsoft.graph.user', processes=2,
+                            chunk_size=4096) == 500
+
+
+def test_polymorphic_lines(tmp_path):
+    path = str(tmp_path / "directory.ndjson")
+    with open(path, 'w') as f:
+        for item in directory_items(30):
+            f.write(json.dumps(item) + "\n")
+    objects = list(bulk.decode_file(path, processes=2, chunk_size=1024))
+    assert [type(o).__name__ for o in objects[:3]] == ['GraphUser', 'GraphGroup', 'GraphDevice']
+
+
+def test_to_columns():
+    columns = bulk.to_columns([GraphUser({'id': 'u1', 'displayName': 'A'}), GraphGroup({'id': 'g1', 'mail': 'm'})])
+    assert columns['id'] == ['u1', 'g1']
+    assert columns['display_name'] == ['A', None]
+    assert columns['mail'] == [None, 'm']
+
+
+@pytest.mark.parametrize("threads", [False, True])
+def test_line_without_type(tmp_path, threads):
+    path = str(tmp_path / "mixed.ndjson")
+    items = directory_items(40)
+    del items[25]['@odata.type']
+    with open(path, 'w') as f:
+        for item in items:
+            f.write(json.dumps(item) + "\n")
+        f.write("\n")
+    with pytest.raises(ValueError, match="^line 26 has no @odata.type and no odata_type was given$"):
+        list(bulk.decode_file(path, processes=2, chunk_size=512, threads=threads))
+    # With odata_type the line is of that type
+    objects = list(bulk.decode_file(path, 'microsoft.graph.directoryObject', processes=2, chunk_size=512,
+                                    threads=threads))
+    assert type(objects[25]).__name__ == 'GraphDirectoryObject'
@@ -0,0 +1,144 @@
+import asyncio
+import os
+from graph_model import GraphUser
+from graph_model.async_client import AsyncClient
+from graph_model.cache import ResponseCache, INDEX_FILENAME, JOURNAL_FILENAME, MIN_JOURNAL_OPERATIONS
+from graph_model.session import Session
+from conftest import user_items
+
+USERS_CONTEXT = 'https://graph.microsoft.com/v1.0/$metadata#users'
+
+
+def users(count):
+    return [GraphUser(item) for item in user_items(count)]
+
+
+def journal_lines(directory):
+    path = os.path.join(directory, JOURNAL_FILENAME)
+    if not os.path.exists(path):
+        return 0
+    with open(path) as f:
+        return len(f.readlines())
+
+
+def test_entries_keyed_by_url_and_context(tmp_path):
+    cache = ResponseCache(str(tmp_path))
+    cache.put('users', USERS_CONTEXT, '"1"', users(2))
+    cache.put('users', USERS_CONTEXT + '(displayName)', '"2"', users(1))
+    assert len(cache) == 2
+    assert cache.get_entry('users', USERS_CONTEXT).etag == '"1"'
+    assert [u.id for u in cache.load(cache.get_entry('users', USERS_CONTEXT))] == ['u00000', 'u00001']
+    assert cache.get_entry('users', 'https://other/$metadata#users') is None
+    # Without a context, the entry of the url used last
+    assert cache.get_entry('users').etag == '"1"'
+    cache.get_entry('users', USERS_CONTEXT + '(displayName)')
+    assert cache.get_entry('users').etag == '"2"'
+
+
+def test_put_appends_to_journal(tmp_path):
+    directory = str(tmp_path)
+    cache = ResponseCache(directory)
+    for i in range(10):
+        cache.put('users?page=%d' % i, USERS_CONTEXT, '"%d"' % i, users(1))
+    assert not os.path.exists(os.path.join(directory, INDEX_FILENAME))
+    assert journal_lines(directory) == 10
+
+    cache.touch(cache.get_entry('users?page=3'))
+    reopened = ResponseCache(directory)
+    assert len(reopened) == 10
+    assert reopened.get_entry('users?page=3').stored == cache.get_entry('users?page=3').stored
+    assert reopened.total_bytes == cache.total_bytes
+
+    cache.flush()
+    assert journal_lines(directory) == 0
+    assert len(ResponseCache(directory)) == 10
+
+
+def test_journal_compacted(tmp_path):
+    directory = str(tmp_path)
+    cache = ResponseCache(directory)
+    for i in range(MIN_JOURNAL_OPERATIONS + 10):
+        cache.put('users', USERS_CONTEXT, '"%d"' % i, users(1))
+    assert journal_lines(directory) < MIN_JOURNAL_OPERATIONS
+    assert ResponseCache(directory).get_entry('users').etag == '"%d"' % (MIN_JOURNAL_OPERATIONS + 9)
+
+
+def test_incomplete_journal_line_ignored(tmp_path):
+    directory = str(tmp_path)
+    cache = ResponseCache(directory)
+    cache.put('users', USERS_CONTEXT, '"1"', users(1))
+    with open(os.path.join(directory, JOURNAL_FILENAME), 'a') as f:
+        f.write('["put", {"url": "gro')
+    assert len(ResponseCache(directory)) == 1
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = ResponseCache(str(tmp_path), max_bytes=10 ** 9)
+    cache.put('a', USERS_CONTEXT, '"1"', users(20))
+    size = cache.total_bytes
+    cache.max_bytes = size * 2 + size // 2
+    cache.put('b', USERS_CONTEXT, '"1"', users(20))
+    cache.get_entry('a')
+    cache.put('c', USERS_CONTEXT, '"1"', users(20))
+    assert cache.get_entry('b') is None and cache.get_entry('a') is not None
+    assert cache.evictions == 1
+    reopened = ResponseCache(str(tmp_path))
+    assert sorted(url for url, _ in reopened._entries) == ['a', 'c']
+
+
+def test_response_too_large_replaces_entry(tmp_path):
+    cache = ResponseCache(str(tmp_path))
+    cache.put('users', USERS_CONTEXT, '"1"', users(1))
+    cache.max_bytes = cache.total_bytes * 2
+    cache.put('users', USERS_CONTEXT, '"2"', users(20))
+    assert cache.get_entry('users') is None and cache.total_bytes == 0
+    assert os.listdir(str(tmp_path)) == [JOURNAL_FILENAME]
+    assert len(ResponseCache(str(tmp_path))) == 0
+
+
+def test_missing_file_removes_entry(tmp_path):
+    cache = ResponseCache(str(tmp_path))
+    cache.put('users', USERS_CONTEXT, '"1"', users(1))
+    entry = cache.get_entry('users')
+    os.remove(os.path.join(str(tmp_path), entry.file_name))
+    assert cache.load(entry) is None
+    assert len(cache) == 0 and len(ResponseCache(str(tmp_path))) == 0
+
+
+def fetch_all(service, cache, session=None, container='users'):
+    async def main():
+        async with AsyncClient(service.url, cache=cache, session=session) as client:
+            return await client.query(container).all()
+    return asyncio.run(main())
+
+
+def test_fresh_hits_skip_network(service, tmp_path):
+    cache = ResponseCache(str(tmp_path), max_age=60)
+    first = fetch_all(service, cache)
+    requests = len(service.requests)
+    second = fetch_all(service, cache)
+    assert len(service.requests) == requests == 3
+    assert [u.to_record() for u in second] == [u.to_record() for u in first]
+    stats = cache.stats()
+    assert (stats['misses'], stats['hits'], stats['hit_rate']) == (3, 3, 0.5)
+
+
+def test_revalidated_with_etag(service, tmp_path):
+    cache = ResponseCache(str(tmp_path))
+    groups = fetch_all(service, cache, container='groups')
+    assert fetch_all(service, cache, container='groups')[0].to_record() == groups[0].to_record()
+    assert cache.stats()['revalidated'] == 1
+    # Entries are keyed with the absolute url and the context of the response
+    assert (service.url + 'groups', service.url + '$metadata#groups') in cache._entries
+
+
+def test_cache_hits_merged_into_session(service, tmp_path):
+    cache = ResponseCache(str(tmp_path), max_age=60)
+    session = Session()
+    first = fetch_all(service, cache, session)
+    first[0].display_name = 'Changed'
+    second = fetch_all(service, cache, session)
+    # The same instances of the session, with the values of the response cached
+    assert all(a is b for a, b in zip(first, second))
+    assert second[0].display_name == 'User 00000'
+    assert cache.stats()['hits'] == 3
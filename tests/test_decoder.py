@@ -0,0 +1,65 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from graph_model import GraphUser, GraphGroup, GraphDevice, GraphPasswordProfile
+from graph_model import decoder
+from conftest import user_item, user_items, directory_items
+
+CONTEXT = 'https://graph.microsoft.com/v1.0/$metadata#'
+
+
+def test_decode_plan():
+    plan = {name: (odata_name, kind, converter) for odata_name, name, kind, converter in
+            decoder.decode_plan(GraphUser)}
+    assert plan['id'] == ('id', decoder.SCALAR, str)
+    assert plan['password_profile'] == ('passwordProfile', decoder.OBJECT, GraphPasswordProfile)
+    assert plan['business_phones'][1] == decoder.SCALAR_LIST
+    assert plan['assigned_licenses'][1] == decoder.OBJECT_LIST
+    assert [name for _, name, _, _ in decoder.decode_plan(GraphUser)] == list(GraphUser.flattened_properties())
+
+
+def test_equal_to_constructors():
+    for item in user_items(10) + [{'id': 'u1'}, {}]:
+        item['unknown'] = 'ignored'
+        obj = decoder.decode_object(item, GraphUser)
+        assert type(obj) is GraphUser and obj.to_record() == GraphUser(item).to_record()
+        assert list(obj.__dict__) == list(GraphUser(item).__dict__)
+    user = decoder.decode_object(user_item(3), GraphUser)
+    assert type(user.assigned_licenses[0]).__name__ == 'GraphAssignedLicense'
+    assert decoder.object_decoder(GraphUser) is decoder.object_decoder(GraphUser)
+    with pytest.raises(ValueError):
+        decoder.decode_object(['not', 'a', 'dictionary'], GraphUser)
+
+
+def test_decode_items_by_type():
+    items = directory_items(9)
+    objects = decoder.decode_items(items, GraphUser)
+    assert [type(o) for o in objects] == [GraphUser, GraphGroup, GraphDevice] * 3
+    assert [o.to_record() for o in objects] == [type(o)(item).to_record() for o, item in zip(objects, items)]
+    assert type(decoder.decode_item(items[2], GraphUser)) is GraphDevice
+
+
+def test_loads_objects():
+    body = {'@odata.context': CONTEXT + 'users', 'value': user_items(3)}
+    users = decoder.loads_objects(json.dumps(body).encode('utf-8'))
+    assert [u.id for u in users] == ['u00000', 'u00001', 'u00002']
+
+    single = dict(user_item(1), **{'@odata.context': CONTEXT + 'users/$entity'})
+    assert decoder.loads_objects(json.dumps(single)).id == 'u00001'
+    assert type(decoder.loads_objects(json.dumps({'value': []}), GraphGroup)) is list
+    with pytest.raises(ValueError):
+        decoder.loads_objects('[]')
+
+
+def test_threaded():
+    items = directory_items(50)
+    expected = [o.to_record() for o in decoder.decode_items(items, GraphUser)]
+    objects = decoder.decode_items_threaded(items, GraphUser, max_workers=3, chunk_items=7)
+    assert [o.to_record() for o in objects] == expected
+    with pytest.raises(ValueError):
+        decoder.decode_items_threaded(items, GraphUser, chunk_items=0)
+
+    bodies = [json.dumps({'@odata.context': CONTEXT + 'users', 'value': user_items(i)}) for i in range(4)]
+    with ThreadPoolExecutor(2) as executor:
+        pages = decoder.loads_threaded(bodies, executor=executor)
+    assert [len(page) for page in pages] == [0, 1, 2, 3]
@@ -0,0 +1,129 @@
+import json
+import os
+import pytest
+from graph_model import GraphUser, GraphDevice
+from graph_model.delta import DeltaSync, JOURNAL_SUFFIX
+from conftest import user_item, user_items
+
+
+class DeltaTransport(object):
+    """Transport answering GET requests with the responses queued for each url."""
+
+    def __init__(self):
+        self.responses = {}
+        self.urls = []
+
+    def add(self, url, value, next_link=None, delta_link=None, status=200):
+        body = {'value': value}
+        if next_link is not None:
+            body['@odata.nextLink'] = next_link
+        if delta_link is not None:
+            body['@odata.deltaLink'] = delta_link
+        self.responses.setdefault(url, []).append((status, body))
+
+    def request(self, method, url, body=None, headers=None):
+        self.urls.append(url)
+        status, body = self.responses[url].pop(0)
+        return status, {}, json.dumps(body).encode('utf-8')
+
+
+def full_sync(transport, count=5, delta_link='delta1'):
+    items = user_items(count)
+    transport.add('users/delta', items[:3], next_link='page2')
+    transport.add('page2', items[3:], delta_link=delta_link)
+
+
+def test_full_then_incremental():
+    transport = DeltaTransport()
+    events = []
+    sync = DeltaSync(transport, 'users', callback=events.append)
+    full_sync(transport)
+    result = sync.sync()
+    assert (result.full, result.pages, len(result.added), sync.delta_link) == (True, 2, 5, 'delta1')
+    assert len(sync) == 5 and sync.get('u00002').display_name == 'User 00002'
+    assert [event[0] for event in events] == ['added'] * 5
+
+    del events[:]
+    transport.add('delta1', [{'id': 'u00001', 'displayName': 'Renamed'},
+                             {'id': 'u00002', '@removed': {'reason': 'deleted'}},
+                             {'id': 'u00001', 'displayName': 'Renamed again'},
+                             user_item(7),
+                             {'id': 'u00007', 'department': 'D9'},
+                             {'id': 'u00009', '@removed': {'reason': 'deleted'}}], delta_link='delta2')
+    result = sync.sync()
+    assert not result.full and sync.delta_link == 'delta2'
+    # Partial update merged, first old value kept
+    assert result.modified == {'u00001': {'display_name': ('User 00001', 'Renamed again')}}
+    assert sync.get('u00001').department == 'D1'
+    assert [u.id for u in result.removed] == ['u00002'] and 'u00002' not in sync
+    # Changes of an object added in the same synchronization are not modifications
+    assert [u.id for u in result.added] == ['u00007'] and sync.get('u00007').department == 'D9'
+    assert [event[0] for event in events] == ['modified', 'removed', 'modified', 'added', 'modified']
+
+
+def test_type_change_keeps_properties():
+    transport = DeltaTransport()
+    sync = DeltaSync(transport, 'directoryObjects')
+    transport.add('directoryObjects/delta', [{'id': 'd1', 'deletedDateTime': '2020-01-01'}], delta_link='delta1')
+    sync.sync()
+    transport.add('delta1', [{'id': 'd1', '@odata.type': '#microsoft.graph.device', 'state': 'active'}],
+                  delta_link='delta2')
+    result = sync.sync()
+    device = sync.get('d1')
+    assert type(device) is GraphDevice and device.deleted_date_time == '2020-01-01'
+    assert result.modified['d1']['state'] == (None, 'active')
+
+
+def test_expired_delta_link_resyncs():
+    transport = DeltaTransport()
+    sync = DeltaSync(transport, 'users', select=['id', 'displayName'])
+    assert sync.url == 'users/delta?$select=id,displayName'
+    transport.add(sync.url, user_items(3), delta_link='delta1')
+    sync.sync()
+
+    transport.add('delta1', [], status=410)
+    transport.add(sync.url, user_items(2), delta_link='delta2')
+    result = sync.sync()
+    assert result.full and transport.urls[-2:] == ['delta1', sync.url]
+    assert [u.id for u in result.removed] == ['u00002'] and not result.added and len(sync) == 2
+
+    transport.add('delta2', [], status=500)
+    with pytest.raises(ValueError):
+        sync.sync()
+    transport.add(sync.url, [])
+    sync.reset()
+    with pytest.raises(ValueError, match="deltaLink"):
+        sync.sync()
+
+
+def test_state_and_journal(tmp_path):
+    path = str(tmp_path / "users.state")
+    transport = DeltaTransport()
+    sync = DeltaSync(transport, 'users', state_path=path)
+    full_sync(transport)
+    sync.sync()
+    assert os.path.exists(path) and not os.path.exists(path + JOURNAL_SUFFIX)
+
+    transport.add('delta1', [{'id': 'u00001', 'displayName': 'Renamed'},
+                             {'id': 'u00004', '@removed': {}}], delta_link='delta2')
+    sync.sync()
+    assert os.path.exists(path + JOURNAL_SUFFIX)
+
+    loaded = DeltaSync(transport, 'users', state_path=path)
+    assert loaded.delta_link == 'delta2'
+    assert sorted(loaded.objects) == ['u00000', 'u00001', 'u00002', 'u00003']
+    assert loaded.get('u00001').display_name == 'Renamed' and type(loaded.get('u00001')) is GraphUser
+
+    # A journal larger than the state is merged into it
+    transport.add('delta2', [{'id': 'u%05d' % i, 'department': 'X'} for i in range(4)], delta_link='delta3')
+    loaded.sync()
+    assert not os.path.exists(path + JOURNAL_SUFFIX)
+    assert DeltaSync(transport, 'users', state_path=path).delta_link == 'delta3'
+
+    # State of another url is not loaded
+    assert DeltaSync(transport, 'users', select=['id'], state_path=path).delta_link is None
+
+
+def test_invalid_entity_set():
+    with pytest.raises(ValueError):
+        DeltaSync(DeltaTransport(), 'contacts')
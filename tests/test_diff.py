@@ -0,0 +1,56 @@
+from graph_model import GraphUser
+from graph_model import diff
+from conftest import user_items
+
+
+def users(count, **changes):
+    """Returns users, with the properties of changes set for the users with the numbers given as keys."""
+    result = [GraphUser(item) for item in user_items(count)]
+    for number, values in changes.items():
+        result[int(number[1:])].set(**values)
+    return result
+
+
+def test_diff():
+    old = users(5)
+    new = users(6, n1={'display_name': 'Changed'}, n3={'department': 'X', 'age_group': 99})[1:]
+    result = diff.diff(old, new)
+    assert [u.id for u in result.added] == ['u00005']
+    assert [u.id for u in result.removed] == ['u00000']
+    assert result.modified == {'u00001': {'display_name': ('User 00001', 'Changed')},
+                               'u00003': {'department': ('D3', 'X'), 'age_group': (3, 99)}}
+    assert result.keyless == []
+
+    # Only the groups whose hash changed are compared
+    groups = [['display_name'], ['department']]
+    index = diff.hash_index(old, groups)
+    lookup = {u.id: u for u in old}.get
+    grouped = diff.diff(index, new, groups, old_lookup=lookup)
+    assert grouped.modified == result.modified
+    assert grouped.removed == ['u00000']
+    assert diff.diff(index, new, groups).modified == {'u00001': {}, 'u00003': {}}
+
+
+def test_diff_sorted():
+    old = users(5)
+    new = users(6, n2={'display_name': 'Changed'})
+    del new[1]
+    assert list(diff.diff_sorted(old, new)) == [('removed', old[1]),
+                                                ('modified', 'u00002', {'display_name': ('User 00002', 'Changed')}),
+                                                ('added', new[-1])]
+    assert list(diff.diff_sorted([], new[:2])) == [('added', new[0]), ('added', new[1])]
+
+
+def test_objects_without_key():
+    old, new = users(3), users(3, n1={'display_name': 'Changed'})
+    old.insert(1, GraphUser({'displayName': 'No key'}))
+    new.append(GraphUser({'displayName': 'No key either'}))
+
+    changes = list(diff.diff_sorted(old, new))
+    assert changes == [('keyless', 'old', old[1]),
+                       ('modified', 'u00001', {'display_name': ('User 00001', 'Changed')}),
+                       ('keyless', 'new', new[-1])]
+
+    result = diff.diff(old, new)
+    assert result.keyless == [('old', old[1]), ('new', new[-1])]
+    assert (result.added, result.removed, list(result.modified)) == ([], [], ['u00001'])
@@ -0,0 +1,68 @@
+import csv
+import pytest
+from graph_model import GraphUser, GraphGroup
+from graph_model import export
+from conftest import user_items
+
+pyarrow = pytest.importorskip("pyarrow")
+
+
+@pytest.fixture
+def users():
+    return [GraphUser(item) for item in user_items(25)]
+
+
+def test_columns():
+    columns = export.get_columns(GraphUser)
+    names = [column.name for column in columns]
+    assert names[:2] == ['id', 'deletedDateTime']
+    assert 'passwordProfile.password' in names and 'passwordProfile' not in names
+    assert [c.name for c in export.get_columns(GraphUser, collections='skip')].count('businessPhones') == 0
+    assert 'passwordProfile' in [c.name for c in export.get_columns(GraphUser, max_depth=0)]
+    with pytest.raises(ValueError):
+        export.get_columns(GraphUser, collections='all')
+
+
+@pytest.mark.parametrize("collections,expected", [('json', '["+1 555 0003"]'), ('join', '+1 555 0003'),
+                                                  ('first', '+1 555 0003'), ('count', '1')])
+def test_export_csv(tmp_path, users, collections, expected):
+    path = str(tmp_path / "users.csv")
+    assert export.export_csv(users, GraphUser, path, batch_size=10, collections=collections) == 25
+    with open(path, newline='', encoding='utf-8') as f:
+        rows = list(csv.DictReader(f))
+    assert len(rows) == 25
+    assert rows[3]['id'] == 'u00003' and rows[3]['passwordProfile.password'] == 'p3'
+    assert rows[3]['businessPhones'] == expected
+    assert rows[3]['deletedDateTime'] == ''
+
+
+def test_export_arrow(tmp_path, users):
+    path = str(tmp_path / "users.arrow")
+    assert export.export_arrow(users, GraphUser, path, batch_size=10) == 25
+    with pyarrow.OSFile(path, 'rb') as source:
+        reader = pyarrow.ipc.open_file(source)
+        assert reader.num_record_batches == 3
+        table = reader.read_all()
+    assert table.num_rows == 25
+    assert table.schema.field('ageGroup').type == pyarrow.int64()
+    assert table.schema.field('accountEnabled').type == pyarrow.bool_()
+    assert table.schema.field('displayName').type == pyarrow.string()
+    rows = table.to_pylist()
+    assert rows[4]['ageGroup'] == 4 and rows[4]['accountEnabled'] is True
+    assert rows[4]['passwordProfile.forceChangePasswordNextSignIn'] is False
+    assert rows[4]['businessPhones'] == '["+1 555 0004"]' and rows[4]['deletedDateTime'] is None
+
+
+def test_export_arrow_from_generator(tmp_path):
+    path = str(tmp_path / "groups.arrow")
+    groups = (GraphGroup({'id': 'g%d' % i, 'securityEnabled': i % 2 == 0}) for i in range(5))
+    assert export.export_arrow(groups, GraphGroup, path, collections='count') == 5
+    with pyarrow.OSFile(path, 'rb') as source:
+        table = pyarrow.ipc.open_file(source).read_all()
+    assert table.column('securityEnabled').to_pylist() == [True, False, True, False, True]
+
+
+def test_export_arrow_without_pyarrow(tmp_path, users, monkeypatch):
+    monkeypatch.setattr(export, 'pyarrow', None)
+    with pytest.raises(ImportError):
+        export.export_arrow(users, GraphUser, str(tmp_path / "users.arrow"))
@@ -0,0 +1,50 @@
+import pytest
+from graph_model import GraphDirectoryObject, GraphUser, GraphGroup, GraphDevice, GraphPasswordProfile
+from graph_model import extension
+from conftest import directory_items
+
+CONTEXT = 'https://graph.microsoft.com/v1.0/$metadata#'
+
+
+def test_type_hierarchy_tables():
+    derived = extension.ODATA_DERIVED_TYPES
+    assert derived['microsoft.graph.directoryObject'] == frozenset(['microsoft.graph.directoryObject',
+                                                                    'microsoft.graph.user', 'microsoft.graph.group',
+                                                                    'microsoft.graph.device'])
+    assert derived['microsoft.graph.user'] == frozenset(['microsoft.graph.user'])
+    assert extension.ODATA_TYPE_DEPTH['microsoft.graph.entity'] == 0
+    assert extension.ODATA_TYPE_DEPTH['microsoft.graph.user'] == 2
+    assert extension.is_assignable('#microsoft.graph.user', 'microsoft.graph.directoryObject')
+    assert not extension.is_assignable('microsoft.graph.directoryObject', 'microsoft.graph.user')
+
+
+@pytest.mark.parametrize("context,odata_type,cls", [
+    (None, '#microsoft.graph.user', GraphUser),
+    (None, 'microsoft.graph.group', GraphGroup),
+    (CONTEXT + 'users', None, GraphUser),
+    (CONTEXT + 'users/$entity', None, GraphUser),
+    (CONTEXT + "users('u1')", None, GraphUser),
+    (CONTEXT + "users('u1')/passwordProfile", None, GraphPasswordProfile),
+])
+def test_get_object_class(context, odata_type, cls):
+    assert extension.get_object_class(context, odata_type) is cls
+
+
+def test_unknown_types():
+    unknown = ((None, '#microsoft.graph.contact'), ('no context', None), (CONTEXT + 'contacts', None))
+    for context, odata_type in unknown:
+        with pytest.raises(ValueError):
+            extension.get_object_class(context, odata_type)
+    with pytest.raises(ValueError):
+        extension.get_dispatch('microsoft.graph.contact')
+
+
+def test_decode_polymorphic():
+    items = directory_items(6) + [{'id': 'o1'}]
+    objects = extension.decode_polymorphic(items, 'microsoft.graph.directoryObject')
+    assert [type(o) for o in objects] == [GraphUser, GraphGroup, GraphDevice] * 2 + [GraphDirectoryObject]
+
+    # Only the types derived from the declared type
+    assert set(extension.get_dispatch('microsoft.graph.user').values()) == {GraphUser}
+    with pytest.raises(ValueError, match="not assignable"):
+        extension.decode_polymorphic(items[:2], 'microsoft.graph.user')
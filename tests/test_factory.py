@@ -0,0 +1,84 @@
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+import pytest
+import omodeler
+from omodeler.factory import camel_to_lowercase, MANIFEST_FILENAME
+from conftest import METADATA_PATH, CLASS_PREFIX, INPUT_LOCATION, generate_package
+
+
+@pytest.fixture(scope="module")
+def factory(tmp_path_factory):
+    temp_loc = str(tmp_path_factory.mktemp("tmp")) + os.sep
+    return omodeler.ClassFactory(Path(METADATA_PATH).as_uri(), CLASS_PREFIX, INPUT_LOCATION, temp_loc)
+
+
+def run_python(source, *paths):
+    """Runs source in a new interpreter with the paths in sys.path and returns its output."""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(paths))
+    return subprocess.run([sys.executable, "-c", source], env=env, check=True, stdout=subprocess.PIPE,
+                          universal_newlines=True).stdout
+
+
+def test_camel_to_lowercase():
+    assert camel_to_lowercase("OdataObjectBase") == "odata_object_base"
+
+
+def test_manifest(package_location):
+    with open(os.path.join(package_location, MANIFEST_FILENAME)) as f:
+        modules = json.load(f)['modules']
+    assert {'__init__', 'graph_user', 'extension', 'decoder'} <= set(modules)
+
+
+def test_bytecode_and_zip(tmp_path):
+    zip_path = str(tmp_path / "zipped.zip")
+    package_loc = generate_package(str(tmp_path), package_name="zipped", compile_bytecode=True, zip_path=zip_path)
+    assert any(name.startswith("graph_user.") for name in os.listdir(os.path.join(package_loc, "__pycache__")))
+    output = run_python("import zipped, zipped.graph_user; print(zipped.GraphUser({'id': 'a'}).id, "
+                        "zipped.graph_user.__loader__.__class__.__name__)", zip_path)
+    assert output.split() == ['a', 'zipimporter']
+
+
+def test_save_staged_publishes_link(factory, tmp_path):
+    output_loc = str(tmp_path / "staged") + os.sep
+    factory.save_staged(output_loc)
+    assert os.path.islink(str(tmp_path / "staged"))
+    assert os.readlink(str(tmp_path / "staged")) == "staged.generation-1"
+
+    factory.save_staged(output_loc, zip_path=str(tmp_path / "staged.zip"))
+    factory.save_staged(output_loc)
+    assert os.readlink(str(tmp_path / "staged")) == "staged.generation-3"
+    # The previous generation is kept for imports in progress
+    assert sorted(os.listdir(str(tmp_path))) == ["staged", "staged.generation-2", "staged.generation-3",
+                                                 "staged.zip"]
+    output = run_python("import staged; print(staged.GraphGroup({'id': 'g'}).id)", str(tmp_path))
+    assert output.strip() == 'g'
+
+
+def test_save_staged_over_directory(factory, tmp_path):
+    os.makedirs(str(tmp_path / "plain"))
+    with pytest.raises(ValueError):
+        factory.save_staged(str(tmp_path / "plain") + os.sep)
+
+
+def test_save_staged_package_never_missing(factory, tmp_path, monkeypatch):
+    output_loc = str(tmp_path / "swapped") + os.sep
+    factory.save_staged(output_loc)
+    missing = []
+
+    def checked(rename):
+        def call(source, destination):
+            rename(source, destination)
+            for file_name in ("__init__.py", "graph_user.py", MANIFEST_FILENAME):
+                if not os.path.exists(os.path.join(output_loc, file_name)):
+                    missing.append(file_name)
+        return call
+
+    # The package must be complete after each rename of the publication
+    monkeypatch.setattr(os, "rename", checked(os.rename))
+    monkeypatch.setattr(os, "replace", checked(os.replace))
+    factory.save_staged(output_loc)
+    factory.save_staged(output_loc, zip_path=str(tmp_path / "swapped.zip"))
+    assert missing == []
@@ -0,0 +1,95 @@
+import json
+import os
+import subprocess
+import sys
+import pytest
+import graph_model
+from graph_model import instrumentation, decoder, extension
+from graph_model.batch import decode_result
+from conftest import BUILD_LOCATION, PACKAGE_NAME, user_items
+
+# Classes and modules imported after enable() must be instrumented, and restored by disable()
+LATE_SOURCE = '''
+import json, sys
+import {package} as model
+from {package} import instrumentation, decoder, extension
+assert 'GraphDevice' not in sys.modules['{package}.odata_object_base']._resolved_classes
+
+active = instrumentation.enable(sample_every=1, constructors=True)
+device = model.GraphDevice({{'id': 'd1', 'state': 'active'}})
+from {package} import planner
+group = planner.decode_object({{'id': 'g1'}}, model.GraphGroup)
+extension.get_object_class(None, '#microsoft.graph.device')
+during = (planner.decode_object is decoder.decode_object, model.GraphDevice.__init__.__name__)
+snapshot = instrumentation.disable()
+
+model.GraphDevice({{'id': 'd2'}})
+after = (planner.decode_object is decoder.decode_object,
+         planner.decode_object.__doc__ == decoder.decode_object.__doc__,
+         'wrap' in repr(model.GraphDevice.__init__))
+print(json.dumps({{'classes': snapshot['classes'], 'get_object_class_calls': snapshot['get_object_class_calls'],
+                  'during': during, 'after': after, 'constructions': active.constructions()}}))
+'''
+
+
+def test_late_loaded_classes_and_modules():
+    env = dict(os.environ, PYTHONPATH=BUILD_LOCATION)
+    output = subprocess.run([sys.executable, "-c", LATE_SOURCE.format(package=PACKAGE_NAME)], env=env,
+                            check=True, stdout=subprocess.PIPE, universal_newlines=True).stdout
+    result = json.loads(output)
+    assert result['classes']['GraphDevice']['count'] == 1
+    assert result['classes']['GraphGroup']['count'] == 1
+    assert result['get_object_class_calls'] == 1
+    # The late module got the wrapper, the constructor of the late class was wrapped
+    assert result['during'] == [True, '__init__']
+    assert result['after'] == [True, True, False]
+    # Constructions after disable() aren't counted
+    assert result['constructions'] == 2
+
+
+def test_counts_decoded_responses():
+    body = {'@odata.context': 'https://graph.microsoft.com/v1.0/$metadata#users', 'value': user_items(10)}
+    active = instrumentation.enable()
+    try:
+        from graph_model import batch
+        batch.decode_result(body)
+        graph_model.GraphUser({'id': 'x'}).set(display_name='y')
+    finally:
+        snapshot = instrumentation.disable()
+    assert snapshot['responses'] == 1
+    assert snapshot['max_objects_per_response'] == 10
+    assert snapshot['classes']['GraphUser']['count'] == 10
+    assert snapshot['set_calls'] == 1
+    assert active.constructions() == 10
+    assert instrumentation.snapshot() is None
+
+
+def test_disable_restores_functions():
+    original = (decoder.decode_object, extension.get_object_class, graph_model.GraphUser.__dict__['__init__'])
+    instrumentation.enable(constructors=True)
+    try:
+        assert decoder.decode_object is not original[0]
+        with pytest.raises(ValueError):
+            instrumentation.enable()
+    finally:
+        instrumentation.disable()
+    assert (decoder.decode_object, extension.get_object_class, graph_model.GraphUser.__dict__['__init__']) == original
+
+
+def test_export(tmp_path):
+    path = str(tmp_path / "snapshot.json")
+    snapshots = []
+    active = instrumentation.Instrumentation(path=path, callback=snapshots.append, constructors=True)
+    active.enable()
+    try:
+        decode_result({'@odata.context': 'https://graph.microsoft.com/v1.0/$metadata#users',
+                       'value': user_items(3)})
+        active.export()
+    finally:
+        active.disable()
+    with open(path) as f:
+        assert json.load(f) == snapshots[0]
+    # Nested objects are counted too
+    assert snapshots[0]['classes']['GraphAssignedLicense']['count'] == 3
+    with pytest.raises(ValueError):
+        instrumentation.Instrumentation(sample_every=0)
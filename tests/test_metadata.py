@@ -0,0 +1,122 @@
+import xml.etree.ElementTree as ET
+import pytest
+from omodeler import metadata
+from conftest import METADATA_PATH, CLASS_PREFIX
+
+EDM = 'xmlns="http://docs.oasis-open.org/odata/ns/edm"'
+
+
+def element(source):
+    return ET.fromstring(source.replace('<Annotation ', '<Annotation ' + EDM + ' ', 1))
+
+
+@pytest.fixture(scope="module")
+def model():
+    return metadata.Metadata(METADATA_PATH, CLASS_PREFIX)
+
+
+def test_pythonize_attribute():
+    assert metadata.pythonize_attribute('displayName') == 'display_name'
+    assert metadata.pythonize_attribute('ID') == 'i_d'
+    assert metadata.pythonize_attribute('from') == '_from'
+
+
+def test_annotation_value_constants():
+    assert metadata.annotation_value(element('<Annotation Term="T" Bool="false"/>')) is False
+    assert metadata.annotation_value(element('<Annotation Term="T"><Int> 7 </Int></Annotation>')) == 7
+    assert metadata.annotation_value(element('<Annotation Term="T">\n  <Bool>true</Bool>\n</Annotation>')) is True
+    assert metadata.annotation_value(element('<Annotation Term="T"/>')) is None
+
+
+def test_annotation_value_indented_collection():
+    value = metadata.annotation_value(element('''<Annotation Term="T">
+          <Collection>
+            <String>startswith</String>
+            <String>tolower</String>
+          </Collection>
+        </Annotation>'''))
+    assert value == ['startswith', 'tolower']
+
+
+def test_annotation_value_collection_of_records():
+    value = metadata.annotation_value(element('''<Annotation Term="T">
+          <Collection>
+            <Record>
+              <PropertyValue Property="NavigationProperty" NavigationPropertyPath="memberOf"/>
+              <PropertyValue Property="MaxLevels" Int="1"/>
+            </Record>
+            <Record>
+              <PropertyValue Property="NavigationProperty" NavigationPropertyPath="manager"/>
+              <PropertyValue Property="MaxLevels" Int="2"/>
+            </Record>
+          </Collection>
+        </Annotation>'''))
+    assert value == [{'NavigationProperty': 'memberOf', 'MaxLevels': 1},
+                     {'NavigationProperty': 'manager', 'MaxLevels': 2}]
+
+
+def test_annotation_value_skips_annotations_of_annotation():
+    value = metadata.annotation_value(element('''<Annotation Term="T">
+          <Annotation Term="Core.Description" String="text"/>
+          <Record><PropertyValue Property="Countable" Bool="false"/></Record>
+        </Annotation>'''))
+    assert value == {'Countable': False}
+
+
+def test_capabilities_of_entity_sets(model):
+    users = model.sets['users'].capabilities
+    assert users['non_filterable_properties'] == ('department', 'passwordProfile')
+    assert users['filter_functions'] == ('startswith', 'tolower')
+    assert users['non_sortable_properties'] == ('department',)
+    assert users['skip_supported'] is False
+    # Qualified annotations don't apply to every request
+    assert 'searchable' not in users
+    assert model.sets['groups'].capabilities == {'countable': False, 'top_supported': False}
+    assert model.sets['devices'].capabilities == {'selectable': False, 'requires_filter': True,
+                                                  'required_filter_properties': ('displayName',)}
+    assert model.sets['me'].capabilities == {}
+
+
+def test_types(model):
+    assert 'GraphUser' in model.class_index
+    assert model.class_index['GraphUser'].module_name == 'graph_user'
+
+
+def test_model_objects_are_slotted(model):
+    user = model.classes['GraphUser']
+    assert not hasattr(user, '__dict__')
+    with pytest.raises(AttributeError):
+        user.unknown = 1
+    fields = user.to_dict()
+    assert fields['edm_type'] == 'EntityType' and fields['base'] == 'GraphDirectoryObject'
+    assert fields['properties']['display_name'] == {'python_type': 'str', 'odata_name': 'displayName',
+                                                   'odata_type': 'Edm.String'}
+    assert fields['actions']['assign_license']['odata_returns'] == 'microsoft.graph.user'
+    assert model.classes['GraphEntity'].key_property == 'id'
+    assert model.classes['GraphDeviceState'].valid_values == ['active', 'disabled']
+    assert str(model.sets['users']) == str(model.sets['users'].to_dict())
+
+
+def test_type_index(model):
+    user = model.type_index['microsoft.graph.user']
+    assert model.class_index['GraphUser'] is user
+    assert (user.python_name, user.module_name, user.base) == ('GraphUser', 'graph_user',
+                                                                'microsoft.graph.directoryObject')
+    assert user.import_line == "from .graph_user import GraphUser"
+    # Collections are indexed by their item type, navigation properties too
+    assert user.property_types['assignedLicenses'] == 'microsoft.graph.assignedLicense'
+    assert user.property_types['manager'] == 'microsoft.graph.directoryObject'
+    assert user.collection_properties == {'businessPhones', 'assignedLicenses', 'memberOf'}
+
+    assert model.type_index['microsoft.graph.directoryObject'].referenced_by == \
+        ['microsoft.graph.user', 'microsoft.graph.group', 'microsoft.graph.device']
+    assert model.type_index['microsoft.graph.assignedLicense'].referenced_by == ['microsoft.graph.user']
+    assert model.type_index['microsoft.graph.deviceState'].referenced_by == ['microsoft.graph.device']
+
+
+def test_type_names_translated_once(model):
+    assert model.odata_types['microsoft.graph.passwordProfile'] == 'GraphPasswordProfile'
+    properties = [p for c in model.classes.values() for p in getattr(c, 'properties', {}).values()]
+    names = [p.python_type for p in properties if p.odata_type == 'Edm.String']
+    # Memoized translations are the same interned string
+    assert len(names) > 1 and all(name is names[0] for name in names)
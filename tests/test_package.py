@@ -0,0 +1,92 @@
+import importlib
+import json
+import os
+import subprocess
+import sys
+import pytest
+import graph_model
+from graph_model import resolve_class, extension
+from conftest import BUILD_LOCATION, PACKAGE_NAME
+
+# Importing the runtime modules and serializing objects imports only the classes used
+LAZY_SOURCE = '''
+import json, sys
+import {package} as model
+from {package} import extension, decoder, session
+
+
+def loaded():
+    return sorted(name for name in model.CLASS_MODULES if '{package}.' + model.CLASS_MODULES[name] in sys.modules)
+
+
+result = {{'imported': loaded()}}
+model.GraphUser({{'id': 'u1', 'displayName': 'Ann'}}).serialized()
+result['serialized'] = loaded()
+assert extension.get_object_class(None, '#microsoft.graph.device') is model.GraphDevice
+assert 'microsoft.graph.group' in extension.ODATA_TYPE_TO_PYTHON
+result['looked_up'] = loaded()
+print(json.dumps(result))
+'''
+
+
+def test_classes_resolved_by_name():
+    assert set(graph_model.CLASS_MODULES) >= {'GraphUser', 'GraphGroup', 'GraphDevice', 'GraphDeviceState'}
+    for class_name, module_name in graph_model.CLASS_MODULES.items():
+        module = importlib.import_module('graph_model.' + module_name)
+        assert getattr(graph_model, class_name) is getattr(module, class_name)
+        assert resolve_class(class_name) is getattr(module, class_name)
+
+
+def test_unknown_attribute():
+    with pytest.raises(AttributeError):
+        graph_model.GraphUnknown
+    with pytest.raises(ImportError):
+        from graph_model import GraphUnknown  # noqa: F401
+
+
+def test_all_exports_classes():
+    assert 'GraphUser' in graph_model.__all__
+    assert 'OdataObjectBase' in graph_model.__all__
+
+
+def test_objects_of_generated_classes():
+    user = graph_model.GraphUser({'id': 'u1', 'displayName': 'Ann', 'businessPhones': ['1'],
+                                  'passwordProfile': {'password': 'x'},
+                                  'assignedLicenses': [{'skuId': 's', 'disabledPlans': []}]})
+    assert user.display_name == 'Ann'
+    assert isinstance(user.password_profile, graph_model.GraphPasswordProfile)
+    assert isinstance(user.assigned_licenses[0], graph_model.GraphAssignedLicense)
+    assert user.serialized()['passwordProfile'] == {'password': 'x'}
+
+
+def test_runtime_modules_import_classes_when_used():
+    env = dict(os.environ, PYTHONPATH=BUILD_LOCATION)
+    output = subprocess.run([sys.executable, "-c", LAZY_SOURCE.format(package=PACKAGE_NAME)], env=env,
+                            check=True, stdout=subprocess.PIPE, universal_newlines=True).stdout
+    result = json.loads(output)
+    assert result['imported'] == []
+    # The user and the classes of its properties
+    assert 'GraphUser' in result['serialized'] and 'GraphGroup' not in result['serialized']
+    assert set(result['looked_up']) - set(result['serialized']) == {'GraphDevice'}
+
+
+def test_class_table():
+    table = extension.ClassTable({'microsoft.graph.user': 'GraphUser', 'Edm.String': str})
+    assert len(table) == 2 and 'microsoft.graph.user' in table and 'x' not in table
+    assert dict.__len__(table) == 0
+    assert table['microsoft.graph.user'] is graph_model.GraphUser
+    assert table.get('Edm.String') is str and table.get('x') is None
+    with pytest.raises(KeyError):
+        table['x']
+    assert dict(table.items()) == {'microsoft.graph.user': graph_model.GraphUser, 'Edm.String': str}
+    table.reset({'microsoft.graph.group': 'GraphGroup'})
+    assert list(table) == ['microsoft.graph.group'] and dict.__len__(table) == 0
+
+
+def test_serialized_skips_expanded_navigation_properties():
+    user = graph_model.GraphUser({'id': 'u1', 'displayName': 'Ann'})
+    user.manager = graph_model.GraphUser({'id': 'u2'})
+    assert user.serialized() == {'id': 'u1', 'displayName': 'Ann'}
+    user.__dict__['unknown'] = 1
+    with pytest.raises(ValueError):
+        user.serialized()
@@ -0,0 +1,46 @@
+import pickle
+from graph_model import GraphUser, GraphDevice, GraphDeviceState, OdataObjectBase
+from conftest import user_items
+
+
+def test_round_trip():
+    users = [GraphUser(item) for item in user_items(20)]
+    loaded = pickle.loads(pickle.dumps(users, pickle.HIGHEST_PROTOCOL))
+    assert [u.to_record() for u in loaded] == [u.to_record() for u in users]
+    assert type(loaded[0].password_profile) is type(users[0].password_profile)
+
+    device = pickle.loads(pickle.dumps(GraphDevice({'id': 'd1', 'state': 'active'})))
+    assert type(device.state) is GraphDeviceState
+
+
+def test_state_without_names_and_trailing_none():
+    user = GraphUser({'id': 'u1', 'displayName': 'Ann'})
+    state = user.__getstate__()
+    assert state == ('u1', None, None, 'Ann')
+    # Smaller than pickling the dictionary of attributes
+    assert len(pickle.dumps(user)) < len(pickle.dumps((GraphUser, user.__dict__)))
+
+    restored = GraphUser.__new__(GraphUser)
+    restored.__setstate__(state)
+    assert restored.__dict__ == user.__dict__
+
+
+def test_attributes_that_are_not_properties():
+    user = GraphUser({'id': 'u1'})
+    user.manager = GraphUser({'id': 'u2'})
+    loaded = pickle.loads(pickle.dumps(user))
+    assert loaded.manager.id == 'u2' and loaded.display_name is None
+
+
+def test_projections_pickled_as_full_class():
+    user = GraphUser.projection(['displayName'])(user_items(1)[0])
+    loaded = pickle.loads(pickle.dumps(user))
+    assert type(loaded) is GraphUser
+    assert (loaded.id, loaded.display_name, loaded.department) == ('u00000', 'User 00000', None)
+
+
+def test_records():
+    users = [GraphUser(item) for item in user_items(3)]
+    records = [u.to_record() for u in users]
+    assert records[0][0] == 'microsoft.graph.user'
+    assert [OdataObjectBase.from_record(r).to_record() for r in records] == records
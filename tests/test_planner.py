@@ -0,0 +1,136 @@
+import json
+from urllib.parse import quote, unquote
+import pytest
+from graph_model import GraphUser, OdataObjectBase
+from graph_model.planner import QueryPlan, PlanNode, PlanRequest
+from graph_model.transport import HttpTransport
+from conftest import user_items
+
+
+def test_select_and_expand():
+    plan = QueryPlan('users', ['displayName', 'manager/deletedDateTime', 'memberOf/microsoft.graph.group/mail',
+                               'passwordProfile/password'])
+    assert unquote(plan.url()) == "users?$select=id,displayName,passwordProfile&$expand=" \
+                                  "manager($select=id,deletedDateTime),memberOf($select=id,microsoft.graph.group/mail)"
+    assert QueryPlan('users', []).url() == 'users'
+    assert QueryPlan('users', ['displayName'], key='u1').url().startswith("users('u1')?")
+
+    for path in ('unknown', 'displayName/length', 'manager/microsoft.graph.unknown/mail'):
+        with pytest.raises(ValueError):
+            QueryPlan('users', [path])
+    with pytest.raises(ValueError):
+        QueryPlan('contacts', ['displayName'])
+
+
+def test_chunks_select_only_the_key():
+    plan = QueryPlan('users', ['manager', 'memberOf'], max_expands=1)
+    urls = [unquote(request.url) for request in plan.requests()]
+    assert urls == ['users?$select=id&$expand=manager', 'users?$select=id&$expand=memberOf']
+
+    # Entities without key select all their properties
+    node = PlanNode('microsoft.graph.passwordProfile')
+    assert plan._options(node, [], 0, PlanRequest('x', node, [], 0, 'merge'), (), select=False) == {}
+
+
+def test_options_follow_capabilities():
+    # department can't be filtered or sorted by the service
+    plan = QueryPlan('users', ['displayName'], filter="startswith(displayName,'User 01') and department eq 'D3'",
+                     orderby='department desc', top=3)
+    url = unquote(plan.url())
+    assert "$filter=startswith(displayName,'User 01')" in url
+    assert 'department eq' not in url and '$orderby' not in url and '$top' not in url
+    # The local filter and order read the department
+    assert '$select=id,displayName,department' in url
+
+    exact = QueryPlan('users', ['displayName'], filter="startswith(displayName,'User 01')", orderby='displayName',
+                      top=3)
+    assert '$orderby=displayName&$top=3' in unquote(exact.url())
+
+    # Groups don't support $top
+    assert '$top' not in QueryPlan('groups', ['displayName'], top=2).url()
+
+
+def test_execute_with_local_options(service):
+    transport = HttpTransport(service.url)
+    plan = QueryPlan('users', ['displayName'], filter="startswith(displayName,'User 01') and department eq 'D3'",
+                     orderby='displayName desc', top=3)
+    users = plan.execute(transport)
+    expected = sorted((item for item in user_items(250) if item['displayName'].startswith('User 01')
+                       and item['department'] == 'D3'), key=lambda item: item['displayName'], reverse=True)[:3]
+    assert [u.id for u in users] == [item['id'] for item in expected]
+    assert all(isinstance(u, GraphUser) for u in users)
+
+    groups = QueryPlan('groups', ['displayName'], top=2).execute(transport)
+    assert [g.id for g in groups] == ['g00001', 'g00004']
+    assert plan.round_trips == 1
+
+
+PATHS = ['displayName', 'manager/microsoft.graph.user/displayName', 'memberOf/microsoft.graph.group/mail',
+         'memberOf/microsoft.graph.group/members/microsoft.graph.user/displayName']
+FILTER = "startswith(displayName,'User 0001')"
+
+
+def tree(value):
+    """Returns comparable structure of the objects with their properties and navigation properties."""
+    if isinstance(value, list):
+        return [tree(v) for v in value]
+    if isinstance(value, OdataObjectBase):
+        properties = set(type(value).flattened_properties())
+        return (type(value).__name__, value.to_record(),
+                {name: tree(v) for name, v in sorted(vars(value).items()) if name not in properties})
+    return value
+
+
+def test_execute_expanded_navigation_properties(service):
+    transport = HttpTransport(service.url)
+    service.expand_page_size = 4
+    users = QueryPlan('users', PATHS, filter=FILTER, max_depth=2).execute(transport)
+    assert [u.id for u in users] == ['u%05d' % i for i in range(10, 20)]
+
+    for user in users:
+        relations = service.relations[user.id]
+        assert user.manager.id == relations['manager'] and user.manager.display_name == 'User 00001'
+        assert type(user.manager) is GraphUser.projection(['displayName'])
+        assert [g.id for g in user.member_of] == relations.get('memberOf', [])
+        for group in user.member_of:
+            assert type(group).__name__ == 'GraphGroupProjection' and group.mail
+            # Next pages of the expanded members were followed
+            assert [m.id for m in group.members] == service.relations[group.id]['members']
+            assert len(group.members) > service.expand_page_size
+
+
+@pytest.mark.parametrize("max_depth,max_expands", [(1, None), (1, 1), (2, 1), (3, 2)])
+def test_same_objects_with_any_limits(service, max_depth, max_expands):
+    transport = HttpTransport(service.url)
+    service.expand_page_size = 4
+    expected = tree(QueryPlan('users', PATHS, filter=FILTER, max_depth=2).execute(transport))
+
+    del service.requests[:]
+    plan = QueryPlan('users', PATHS, filter=FILTER, max_depth=max_depth, max_expands=max_expands)
+    assert tree(plan.execute(transport)) == expected
+    assert plan.round_trips == len(service.requests)
+    if max_depth == 1:
+        # Members of the groups are requested for each group in $batch requests
+        assert any(path.endswith('$batch') for path in service.requests)
+        assert plan.requests_sent > plan.round_trips
+
+
+def test_fewer_round_trips_and_bytes(service):
+    transport = HttpTransport(service.url)
+    paths = ['displayName', 'manager/microsoft.graph.user/displayName', 'memberOf/microsoft.graph.group/displayName']
+
+    # Full entities, then the navigation properties of each user
+    status, headers, data = transport.request("GET", "users?$filter=" + quote(FILTER))
+    for item in json.loads(data.decode('utf-8'))['value']:
+        for navigation in ('manager', 'memberOf'):
+            transport.request("GET", "users('{}')/{}".format(item['id'], navigation))
+    separate_requests, separate_bytes = len(service.requests), service.response_bytes
+
+    del service.requests[:]
+    service.response_bytes = 0
+    plan = QueryPlan('users', paths, filter=FILTER)
+    users = plan.execute(transport)
+    assert plan.round_trips == len(service.requests) == 1 and separate_requests == 21
+    assert service.response_bytes * 3 < separate_bytes
+    assert [g.id for g in users[0].member_of] == service.relations[users[0].id]['memberOf']
+    assert all(g.display_name for g in users[0].member_of)
@@ -0,0 +1,28 @@
+import pytest
+from graph_model import GraphUser, GraphPasswordProfile
+from graph_model.decoder import decode_object
+from conftest import user_item
+
+
+def test_projection_class():
+    projection = GraphUser.projection(['displayName', 'passwordProfile'])
+    assert projection is GraphUser.projection(('passwordProfile', 'displayName'))
+    assert projection.projection(['displayName']) is GraphUser.projection(['displayName'])
+    assert issubclass(projection, GraphUser) and projection.__name__ == 'GraphUserProjection'
+    assert projection.selected_properties == frozenset(['id', 'displayName', 'passwordProfile'])
+    with pytest.raises(ValueError):
+        GraphUser.projection(['unknown'])
+
+
+def test_only_selected_properties_stored():
+    projection = GraphUser.projection(['displayName', 'passwordProfile'])
+    user = projection(user_item(4))
+    assert user.__dict__.keys() == {'id', 'display_name', 'password_profile'}
+    assert isinstance(user.password_profile, GraphPasswordProfile)
+    # Other properties read as None from the class
+    assert user.department is None and user.assigned_licenses is None
+
+    assert decode_object(user_item(4), projection).to_record() == user.to_record()
+    assert projection({}, department='D').department == 'D'
+    with pytest.raises(ValueError):
+        projection(['not', 'a', 'dictionary'])
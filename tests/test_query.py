@@ -0,0 +1,121 @@
+import pytest
+from graph_model import GraphUser
+from graph_model.extension import get_capabilities
+from graph_model.query import LocalCollection, QueryPushdown, FilterParser, compile_filter, split_expression
+from conftest import user_items
+
+
+@pytest.fixture(scope="module")
+def users():
+    return LocalCollection([GraphUser(item) for item in user_items(50)], GraphUser)
+
+
+def test_filter_and_orderby(users):
+    result = users.query("department eq 'D3' and ageGroup gt 20", "displayName desc")
+    assert [u.id for u in result] == ['u00045', 'u00038', 'u00031', 'u00024']
+    assert [u.id for u in users.query(orderby="displayName", top=2, skip=3)] == ['u00003', 'u00004']
+    assert len(users.query("startswith(displayName,'User 0001')")) == 10
+
+
+def test_indexes_return_same_result(users):
+    expected = users.filter("ageGroup ge 40")
+    users.create_index("ageGroup", sorted_index=True)
+    assert users.filter("ageGroup ge 40") == expected
+
+
+@pytest.mark.parametrize("expression", [
+    "accountEnabled eq true and startswith(department,'D1')",
+    "startswith(displayName,'User 0001') and ageGroup ge 15 and accountEnabled eq false",
+    "startswith(department,'') and department ne 'D2'",
+    "startswith(displayName,'Z')",
+    "accountEnabled eq true and department eq 'D3' and passwordProfile/password eq null",
+])
+def test_indexed_conjunctions_same_as_scan(expression):
+    users = LocalCollection([GraphUser(item) for item in user_items(50)], GraphUser)
+    users.append(GraphUser({'id': 'x', 'department': None}))
+    predicate = compile_filter(GraphUser, expression)
+    expected = [u for u in users if predicate(u)]
+    assert users.filter(expression) == expected
+    # Repeated with the indexes built
+    assert users.filter(expression) == expected
+
+
+@pytest.mark.parametrize("expression", ["businessPhones eq '+1 555 0001'", "businessPhones gt 'a'",
+                                        "startswith(businessPhones,'+1')", "assignedLicenses/skuId eq 'sku1'"])
+def test_collection_properties_rejected(users, expression):
+    with pytest.raises(ValueError):
+        users.filter(expression)
+    with pytest.raises(ValueError):
+        users.query(orderby="businessPhones")
+
+
+def test_service_rejects_collection_properties(service):
+    status, body = service.get("/v1.0/users?$filter=businessPhones eq '1'", {})
+    assert status == 400 and 'businessPhones' in body['error']['message']
+
+
+def test_split_expression():
+    assert split_expression("a eq 1 and (b eq 2 or c eq 3) and d eq 4") == ['a eq 1', '(b eq 2 or c eq 3)', 'd eq 4']
+    assert split_expression("a eq 1 or b eq 2") == ['a eq 1 or b eq 2']
+
+
+def test_prefix_index():
+    users = LocalCollection([GraphUser(item) for item in user_items(30)], GraphUser)
+    index = users.create_index("displayName", sorted_index=True)
+    assert [users.items[pos].id for pos in sorted(index.lookup('prefix', 'User 0001'))] == \
+        ['u%05d' % i for i in range(10, 20)]
+    assert len(index.lookup('prefix', '')) == 30
+
+
+def test_parser_paths_and_functions():
+    parser = FilterParser(GraphUser, "startswith(displayName,'A') and passwordProfile/password eq 'x'")
+    parser.parse()
+    assert parser.odata_paths == ['displayName', 'passwordProfile/password']
+    assert parser.functions == ['startswith']
+
+
+def test_capabilities_from_annotations():
+    users = get_capabilities('users')
+    assert users['non_filterable_properties'] == ('department', 'passwordProfile')
+    assert users['filter_functions'] == ('startswith', 'tolower')
+    assert users['skip_supported'] is False
+    assert users['searchable'] is True
+    groups = get_capabilities('groups')
+    assert groups['countable'] is False and groups['top_supported'] is False
+    assert get_capabilities('devices')['required_filter_properties'] == ('displayName',)
+    with pytest.raises(ValueError):
+        get_capabilities('unknown')
+
+
+def test_pushdown_splits_filter():
+    pushdown = QueryPushdown('users', "accountEnabled eq true and department eq 'D3' and contains(displayName,'1')",
+                             orderby="displayName", top=5, select=['displayName'])
+    assert pushdown.options['$filter'] == "accountEnabled eq true"
+    assert pushdown.local_filter == "department eq 'D3' and contains(displayName,'1')"
+    assert pushdown.options['$orderby'] == "displayName"
+    assert '$top' not in pushdown.options
+    assert pushdown.options['$select'] == "department,displayName,id"
+
+
+def test_pushdown_paging_sent_when_exact():
+    pushdown = QueryPushdown('users', "accountEnabled eq true", orderby="displayName", top=5, skip=2)
+    assert pushdown.options['$top'] == '7'
+    assert '$skip' not in pushdown.options
+    assert pushdown.limit() == 7
+    objects = [GraphUser(item) for item in user_items(7)]
+    assert [u.id for u in pushdown.apply(objects)] == ['u00002', 'u00003', 'u00004', 'u00005', 'u00006']
+
+
+def test_pushdown_limit_with_local_filter():
+    # Local matches can be anywhere in the collection, so no number of objects received is enough
+    assert QueryPushdown('users', "department eq 'D3'", top=5).limit() is None
+    assert QueryPushdown('users', "contains(displayName,'2')", top=1).limit() is None
+    assert QueryPushdown('users', orderby="department", top=5).limit() is None
+    assert QueryPushdown('users', top=5).limit() == 5
+
+
+def test_pushdown_required_filter():
+    with pytest.raises(ValueError):
+        QueryPushdown('devices', "state eq 'active'")
+    assert QueryPushdown('devices', "displayName eq 'Device 2'").options['$filter'] == "displayName eq 'Device 2'"
+    assert '$select' not in QueryPushdown('devices', "displayName eq 'x'", select=['state']).options
@@ -0,0 +1,64 @@
+import os
+import subprocess
+import sys
+from conftest import ROOT_LOCATION, INPUT_LOCATION, METADATA_PATH, CLASS_PREFIX
+
+# Runs in a new interpreter: the reload replaces the classes of the package imported
+RELOAD_SOURCE = """
+import os, sys
+from pathlib import Path
+import omodeler
+
+output_loc, temp_loc, metadata_path, changed_path = sys.argv[1:]
+
+def generate(path):
+    factory = omodeler.ClassFactory(Path(path).as_uri(), {prefix!r}, {input_location!r}, temp_loc)
+    factory.save_staged(output_loc)
+
+generate(metadata_path)
+import reloaded
+from reloaded import GraphDevice, GraphUser, extension
+from reloaded.reload import Reloader
+
+reloader = Reloader('reloaded')
+device = GraphDevice({{'id': 'd1', 'displayName': 'Laptop', 'state': 'active'}})
+user = GraphUser({{'id': 'u1'}})
+user.manager = device
+table = extension.ODATA_TYPE_TO_PYTHON
+print(reloader.changed_modules() == ([], [], []), reloader.reload().reloaded)
+
+generate(changed_path)
+changed, added, removed = reloader.changed_modules()
+print(sorted(changed), added, removed)
+result = reloader.reload()
+print(sorted(result.reloaded), result.stale, result.restart_required)
+
+new_class = sys.modules['reloaded.graph_device'].GraphDevice
+print(reloader.is_stale(device), reloader.current_class(GraphDevice) is new_class, reloader.is_stale(user))
+refreshed = reloader.refresh(device)
+print(type(refreshed) is new_class, refreshed.display_name, refreshed.state, refreshed.serial_number)
+print(reloader.refresh(user) is user)
+print(extension.ODATA_TYPE_TO_PYTHON is table, table['microsoft.graph.device'] is new_class)
+""".format(prefix=CLASS_PREFIX, input_location=INPUT_LOCATION)
+
+
+def test_reload_changed_class(tmp_path):
+    with open(METADATA_PATH) as f:
+        metadata = f.read()
+    device_property = '<Property Name="state" Type="microsoft.graph.deviceState"/>'
+    assert device_property in metadata
+    changed_path = str(tmp_path / "changed.xml")
+    with open(changed_path, "w") as f:
+        f.write(metadata.replace(device_property, device_property +
+                                 '<Property Name="serialNumber" Type="Edm.String"/>'))
+    temp_loc = str(tmp_path / "tmp") + os.sep
+    os.makedirs(temp_loc)
+
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([str(tmp_path), ROOT_LOCATION]))
+    output = subprocess.run([sys.executable, "-c", RELOAD_SOURCE, str(tmp_path / "reloaded") + os.sep, temp_loc,
+                             METADATA_PATH, changed_path], env=env, check=True, stdout=subprocess.PIPE,
+                            universal_newlines=True).stdout.splitlines()
+    assert output[0] == "True []"
+    assert output[1].startswith("['") and "'graph_device'" in output[1] and output[1].endswith("[] []")
+    assert output[2] == "['extension', 'graph_device'] ['GraphDevice'] []"
+    assert output[3:] == ["True True False", "True Laptop active None", "True", "True True"]
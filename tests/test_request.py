@@ -0,0 +1,43 @@
+import json
+import pytest
+from graph_model import GraphUser, GraphAssignedLicense, GraphPasswordProfile
+from graph_model.request import OdataRequest, odata_literal
+
+
+def test_odata_literal():
+    assert [odata_literal(v) for v in (None, True, False, 3, 1.5, "it's")] == \
+        ['null', 'true', 'false', '3', '1.5', "'it''s'"]
+
+
+def test_action_request():
+    user = GraphUser({'id': 'u1'})
+    request = user.assign_license(add_licenses=[GraphAssignedLicense({'skuId': 's1', 'disabledPlans': []})],
+                                  remove_licenses=['s2'])
+    assert (request.method, request.url, request.returns) == ("POST", "users('u1')/assignLicense",
+                                                              'microsoft.graph.user')
+    assert request.body == {'addLicenses': [{'skuId': 's1', 'disabledPlans': []}], 'removeLicenses': ['s2']}
+    assert request.headers == {'Content-Type': 'application/json'}
+    assert json.loads(request.encoded_body().decode('utf-8')) == request.body
+    # Actions of base types, None parameters are left out
+    assert user.check_member_groups().body == {}
+
+
+def test_function_request():
+    request = GraphUser({'id': "o'k"}).reminder_view(start_date_time='2020-01-01', end_date_time=None)
+    assert (request.method, request.url) == ("GET", "users('o''k')/reminderView(StartDateTime='2020-01-01')")
+    assert request.returns == 'Collection(Edm.String)' and request.encoded_body() is None
+
+
+def test_entity_without_key_or_entity_set():
+    with pytest.raises(ValueError):
+        GraphUser({}).reminder_view()
+    with pytest.raises(ValueError):
+        GraphPasswordProfile({'password': 'x'}).get_entity_url()
+
+
+def test_batch_item():
+    request = OdataRequest("PATCH", "/users('u1')", body={'displayName': 'A'}, headers={'If-Match': '*'})
+    assert request.batch_item('2', ['1']) == {'id': '2', 'method': 'PATCH', 'url': "/users('u1')",
+                                              'headers': {'If-Match': '*', 'Content-Type': 'application/json'},
+                                              'body': {'displayName': 'A'}, 'dependsOn': ['1']}
+    assert OdataRequest("GET", "me").batch_item('1') == {'id': '1', 'method': 'GET', 'url': '/me'}
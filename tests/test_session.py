@@ -0,0 +1,72 @@
+import gc
+import pytest
+from graph_model import GraphUser, GraphGroup, GraphDirectoryObject
+from graph_model.session import Session
+from conftest import user_items
+
+USERS_CONTEXT = 'https://graph.microsoft.com/v1.0/$metadata#users'
+
+
+def test_decode_returns_same_instance():
+    session = Session()
+    first = session.decode({'id': 'u1', 'displayName': 'Ann'}, USERS_CONTEXT)
+    second = session.decode({'id': 'u1', 'department': 'Sales'}, USERS_CONTEXT)
+    assert first is second
+    assert (first.display_name, first.department) == ('Ann', 'Sales')
+    assert (session.constructed, session.merged) == (1, 1)
+    assert session.get(GraphUser, 'u1') is first and session.get(GraphGroup, 'u1') is None
+
+
+def test_decode_more_specific_type():
+    session = Session()
+    session.decode({'id': 'x', 'deletedDateTime': '2020-01-01'},
+                   odata_type='microsoft.graph.directoryObject')
+    user = session.decode({'@odata.type': '#microsoft.graph.user', 'id': 'x', 'displayName': 'Ann'})
+    assert isinstance(user, GraphUser)
+    assert user.deleted_date_time == '2020-01-01'
+    assert session.get(GraphDirectoryObject, 'x') is user
+
+
+def test_decode_page():
+    session = Session()
+    page = {'@odata.context': USERS_CONTEXT, 'value': user_items(3)}
+    assert session.decode_page(page) == session.decode_page(page)
+    assert len(session) == 3
+
+
+def test_eviction():
+    session = Session(max_size=2)
+    for item in user_items(3):
+        session.decode(item, USERS_CONTEXT)
+    assert len(session) == 2 and session.evicted == 1
+    assert session.get(GraphUser, 'u00000') is None
+
+    weak = Session(eviction='weak')
+    user = weak.decode(user_items(1)[0], USERS_CONTEXT)
+    assert user in weak
+    del user
+    gc.collect()
+    assert len(weak) == 0
+
+    with pytest.raises(ValueError):
+        Session(eviction='random')
+    with pytest.raises(ValueError):
+        Session(max_size=0)
+
+
+def test_merge():
+    session = Session()
+    group = GraphGroup({'id': 'g1', 'displayName': 'G', 'mail': 'g@x'})
+    assert session.merge(group) is group
+    cached = GraphGroup({'id': 'g1', 'displayName': 'H'})
+    assert session.merge(cached) is group
+    assert (group.display_name, group.mail) == ('H', 'g@x')
+    # Objects without key aren't kept
+    assert session.merge(GraphUser({})).id is None
+    assert len(session) == 1
+
+    # A more specific type replaces the entity, keeping its values
+    session.add(GraphDirectoryObject({'id': 'u1', 'deletedDateTime': 'd'}))
+    user = session.merge(GraphUser({'id': 'u1', 'displayName': 'Ann'}))
+    assert isinstance(user, GraphUser) and user.deleted_date_time == 'd'
+    assert session.get(GraphDirectoryObject, 'u1') is user
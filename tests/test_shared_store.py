@@ -0,0 +1,77 @@
+import os
+import subprocess
+import sys
+import pytest
+from graph_model import GraphUser, GraphDevice, GraphDeviceState
+from graph_model.shared_store import SharedStore
+from conftest import BUILD_LOCATION, PACKAGE_NAME, user_items
+
+# Attaches to the store, reads it and exits, which must not remove the block of the creator
+ATTACH_SOURCE = '''
+import sys
+from {package}.shared_store import SharedStore
+with SharedStore(sys.argv[1]) as store:
+    print(len(store), store.get('u00007').display_name)
+'''
+
+
+@pytest.fixture
+def users():
+    return [GraphUser(item) for item in user_items(50)]
+
+
+def test_values_and_lookup(users):
+    store = SharedStore.create(users, GraphUser)
+    try:
+        assert len(store) == 50
+        row = store.get('u00012')
+        assert row.display_name == 'User 00012' and row.age_group == 12 and row.account_enabled is False
+        assert row.get_key() == 'u00012' and 'u00049' in store and 'x' not in store
+        assert store[-1].id == 'u00049'
+        assert store.to_object(3).to_record() == users[3].to_record()
+        assert list(store.column('department'))[:3] == ['D0', 'D1', 'D2']
+        with pytest.raises(IndexError):
+            store[50]
+        with pytest.raises(AttributeError):
+            row.unknown
+    finally:
+        store.unlink()
+
+
+def test_enumerations_read_with_their_type():
+    devices = [GraphDevice({'id': 'd1', 'state': 'active'}), GraphDevice({'id': 'd2'})]
+    with SharedStore.create(devices, GraphDevice) as store:
+        state = store.get('d1').state
+        assert type(state) is GraphDeviceState and state == 'active'
+        assert store.get('d2').state is None
+        assert type(store.to_object(0).state) is GraphDeviceState
+        store.unlink()
+
+
+def test_block_kept_when_attached_process_exits(users):
+    store = SharedStore.create(users, GraphUser)
+    try:
+        env = dict(os.environ, PYTHONPATH=BUILD_LOCATION)
+        for _ in range(2):
+            result = subprocess.run([sys.executable, "-c", ATTACH_SOURCE.format(package=PACKAGE_NAME), store.name],
+                                    env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                    universal_newlines=True)
+            assert result.returncode == 0, result.stderr
+            assert result.stdout.split() == ['50', 'User', '00007']
+            assert 'leaked' not in result.stderr
+        # Attaching in the creating process keeps the creator's registration
+        with SharedStore(store.name) as attached:
+            assert attached.get('u00001').display_name == 'User 00001'
+    finally:
+        store.unlink()
+
+
+def test_not_a_store():
+    from multiprocessing import shared_memory
+    memory = shared_memory.SharedMemory(create=True, size=64)
+    try:
+        with pytest.raises(ValueError):
+            SharedStore(memory.name)
+    finally:
+        memory.close()
+        memory.unlink()
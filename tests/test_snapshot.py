@@ -0,0 +1,48 @@
+import pytest
+from graph_model import GraphUser, GraphDevice, GraphDeviceState
+from graph_model.decoder import decode_items
+from graph_model.snapshot import Snapshot, write_snapshot
+from conftest import user_items, directory_items
+
+
+def test_write_and_read(tmp_path):
+    path = str(tmp_path / "users.snap")
+    users = [GraphUser(item) for item in user_items(300)]
+    users.append(GraphUser({'displayName': 'No key'}))
+    assert write_snapshot(path, users) == 301
+
+    with Snapshot(path) as snapshot:
+        assert len(snapshot) == 301
+        assert snapshot.get('u00123').to_record() == users[123].to_record()
+        assert 'u00299' in snapshot and 'u00300' not in snapshot and None not in snapshot
+        # Objects without key are only read by iterating
+        assert [u.to_record() for u in snapshot] == [u.to_record() for u in users]
+
+
+def test_mixed_types(tmp_path):
+    path = str(tmp_path / "directory.snap")
+    objects = decode_items(directory_items(30), GraphUser)
+    write_snapshot(path, objects)
+    with Snapshot(path) as snapshot:
+        device = snapshot.get('d00002')
+        assert type(device) is GraphDevice and type(device.state) is GraphDeviceState
+        assert [type(o) for o in snapshot] == [type(o) for o in objects]
+        assert snapshot.types == ['microsoft.graph.user', 'microsoft.graph.group', 'microsoft.graph.device']
+
+
+def test_empty_and_invalid(tmp_path):
+    path = str(tmp_path / "empty.snap")
+    assert write_snapshot(path, []) == 0
+    with Snapshot(path) as snapshot:
+        assert len(snapshot) == 0 and snapshot.get('u1') is None and list(snapshot) == []
+
+    other = tmp_path / "other.snap"
+    other.write_bytes(b'x' * 64)
+    with pytest.raises(ValueError):
+        Snapshot(str(other))
+
+    # Shorter than the header, or empty
+    for data in (b'ODSNAP01', b''):
+        other.write_bytes(data)
+        with pytest.raises(ValueError):
+            Snapshot(str(other))
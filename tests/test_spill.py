@@ -0,0 +1,49 @@
+import os
+import pytest
+from graph_model import GraphUser, GraphDeviceState
+from graph_model.decoder import decode_items
+from graph_model.spill import SpillCollection, object_size
+from conftest import user_items, directory_items
+
+
+def test_object_size():
+    user = GraphUser(user_items(1)[0])
+    assert object_size(user) > object_size(user.password_profile) > 0
+    assert object_size(None) == object_size(True) == 0
+
+
+def test_spill_and_read_back(tmp_path):
+    users = [GraphUser(item) for item in user_items(500)]
+    budget = object_size(users[0]) * 50
+    with SpillCollection(users, memory_budget=budget, directory=str(tmp_path), read_ahead=4096) as collection:
+        assert len(collection) == 500 and collection.spilled > 400
+        assert collection.memory_bytes <= budget and collection.file_bytes() > 0
+        assert collection[3].to_record() == users[3].to_record()
+        assert collection[-1] is users[-1]
+        assert collection.get('u00010').to_record() == users[10].to_record()
+        assert 'u00499' in collection and 'u00500' not in collection
+        with pytest.raises(IndexError):
+            collection[500]
+
+        reads = collection.reads
+        assert [u.to_record() for u in collection] == [u.to_record() for u in users]
+        # Read in blocks, not one read per object
+        assert collection.reads - reads < collection.spilled // 10
+
+    assert len(collection) == 0 and collection.get('u00010') is None
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_mixed_types_without_index():
+    objects = decode_items(directory_items(30), GraphUser)
+    collection = SpillCollection(objects, memory_budget=0, index_keys=False, sample_every=1)
+    assert collection.spilled == 30 and collection.memory_bytes == 0
+    assert [type(o) for o in collection] == [type(o) for o in objects]
+    assert type(collection.get('d00002').state) is GraphDeviceState
+    collection.close()
+
+
+def test_invalid_parameters():
+    for options in ({'memory_budget': -1}, {'read_ahead': 0}, {'sample_every': 0}):
+        with pytest.raises(ValueError):
+            SpillCollection(**options)
@@ -0,0 +1,122 @@
+import json
+import os
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from graph_model import GraphDirectoryObject, GraphUser
+from graph_model.decoder import decode_items, decode_items_threaded, loads_objects, loads_threaded
+from graph_model import bulk
+from conftest import BUILD_LOCATION, PACKAGE_NAME, directory_items
+
+# Run in a new interpreter, so classes, decoders, projections and the extension module are first used by
+# many threads at the same time. Each thread decodes the same mixed payload in every way the model allows.
+STRESS_SOURCE = '''
+import json, pickle, sys, threading
+sys.setswitchinterval(1e-6)
+import {package} as model
+from {package} import decoder
+
+payload = json.loads(sys.argv[1])
+body = json.dumps(payload)
+items = payload['value']
+threads = int(sys.argv[2])
+barrier = threading.Barrier(threads)
+
+
+def canonical(objects):
+    return [(type(obj).__name__, obj.to_record()) for obj in objects]
+
+
+def decode_all():
+    from {package} import extension
+    declared = 'microsoft.graph.directoryObject'
+    results = []
+    results.append(canonical(decoder.loads_objects(body)))
+    results.append(canonical(extension.decode_polymorphic(items, declared)))
+    results.append(canonical(extension.get_object_class(None, item.get('@odata.type', declared))(item)
+                             for item in items))
+    user_projection = model.GraphUser.projection(['displayName'])
+    results.append(canonical(decoder.decode_object(item, user_projection) for item in items))
+    objects = decoder.decode_items(items, model.GraphDirectoryObject)
+    results.append(canonical(model.OdataObjectBase.from_record(obj.to_record()) for obj in objects))
+    results.append(canonical(pickle.loads(pickle.dumps(objects))))
+    results.append(sorted(str(p) for c in set(map(type, objects)) for p in c.navigation_properties()))
+    return results, objects, user_projection
+
+
+outcomes = [None] * threads
+errors = []
+
+
+def run(index):
+    try:
+        barrier.wait()
+        outcomes[index] = decode_all()
+    except BaseException as e:
+        errors.append(repr(e))
+
+
+workers = [threading.Thread(target=run, args=(i,)) for i in range(threads)]
+for worker in workers:
+    worker.start()
+for worker in workers:
+    worker.join()
+assert not errors, errors
+
+expected, _, projection = decode_all()
+for results, objects, user_projection in outcomes:
+    assert results == expected
+    # One class object per type and one projection class, whatever thread imported or created it
+    assert user_projection is projection
+    for obj in objects:
+        assert type(obj) is getattr(model, type(obj).__name__)
+assert len(set(decoder._decoders)) == len(decoder._decoders)
+print("ok", len(expected[0]))
+'''
+
+
+def payload(count):
+    items = directory_items(count)
+    # Items without @odata.type are of the declared type
+    items.append({'id': 'o1', 'deletedDateTime': '2020-01-01T00:00:00Z'})
+    return {'@odata.context': 'https://graph.microsoft.com/v1.0/$metadata#directoryObjects', 'value': items}
+
+
+@pytest.mark.parametrize("run", range(4))
+def test_concurrent_first_decode_in_new_interpreter(run):
+    source = STRESS_SOURCE.format(package=PACKAGE_NAME)
+    env = dict(os.environ, PYTHONPATH=BUILD_LOCATION)
+    result = subprocess.run([sys.executable, "-c", source, json.dumps(payload(60)), "16"], env=env,
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.split() == ['ok', '61']
+
+
+def test_decode_items_threaded_same_as_single_thread():
+    items = payload(3000)['value']
+    expected = [o.to_record() for o in decode_items(items, GraphDirectoryObject)]
+    with ThreadPoolExecutor(4) as executor:
+        for objects in (decode_items_threaded(items, GraphDirectoryObject, max_workers=4, chunk_items=100),
+                        decode_items_threaded(items, GraphDirectoryObject, chunk_items=7, executor=executor)):
+            assert [o.to_record() for o in objects] == expected
+    with pytest.raises(ValueError):
+        decode_items_threaded(items, GraphDirectoryObject, chunk_items=0)
+
+
+def test_loads_threaded():
+    pages = [json.dumps(payload(n)) for n in (5, 50, 500)]
+    assert [[o.to_record() for o in objects] for objects in loads_threaded(pages, max_workers=3)] == \
+        [[o.to_record() for o in loads_objects(page)] for page in pages]
+
+
+def test_bulk_threads_reuse_scratch_buffer(tmp_path):
+    path = str(tmp_path / "users.ndjson")
+    items = payload(900)['value']
+    with open(path, 'w') as f:
+        for item in items:
+            f.write(json.dumps(item) + "\n\n")
+    objects = list(bulk.decode_file(path, 'microsoft.graph.directoryObject', processes=3, chunk_size=4096,
+                                    threads=True))
+    assert [o.to_record() for o in objects] == [o.to_record() for o in decode_items(items, GraphDirectoryObject)]
+    assert isinstance(objects[0], GraphUser)